@@ -0,0 +1,269 @@
+"""
+Batched discharge of several cases (PCMs or parameter variants) in one time loop.
+
+Every field of the fluid and the bed gets a leading case axis, ``(n_cases, 1, n_fluid)`` and
+``(n_cases, n_fluid, n_bed)``, and every time step is one set of NumPy operations over all the
+cases. The step is the same as ``Simulate.run_simulation`` for the phases of
+``simulate_all_pcms.run_discharge`` (boundary nodes, central difference diffusion, upwind
+convection, property update and fluid-bed coupling), so each case gives the same results as
+its own run. The bed materials are stacked into one PCMMaterial with per-case constants.
+
+The cases may differ in the PCM, its constants and the tank and operating parameters; the grid,
+time step and output times are shared. The adaptive step, streaming, stop criteria, draw
+profiles, the hysteresis model, graded beds and the float32 state are not available in this
+mode.
+"""
+
+import numpy as np
+from simulate_all_pcms import PCMS, DISCHARGE_PARAMS
+from tank_simulation import reset_openterrace
+from pcm_registry import MATERIAL_COLUMNS, PCMMaterial, register_variant, get_material, stack_materials
+import argparse
+import time
+
+#parámetros que definen el tamaño de los arreglos y la grilla de tiempo: iguales en todos los casos
+SHARED_PARAMS = ["n_fluid", "n_bed", "dt", "simulation_time", "output_interval"]
+
+def _unsupported(p:dict) -> list[str]:
+    """Options of ``DISCHARGE_PARAMS`` that the batched solver doesn't implement."""
+    options = []
+    if p["adaptive"]:
+        options.append("adaptive")
+    if p["implicit"]:
+        options.append("implicit")
+    if p["stream"]:
+        options.append("stream")
+    if p["supercooling"] or p["hysteresis"]:
+        options.append("supercooling/hysteresis")
+    if p["grading"]:
+        options.append("grading")
+    if p["precision"] != "float64":
+        options.append("precision")
+    if p["profile"] is not None:
+        options.append("profile")
+    if p["T_outlet_min"] is not None or p["liquid_fraction_min"] is not None or p["energy_max"] is not None:
+        options.append("stop criteria")
+    return options
+
+def _interior_diffusion(x:np.ndarray, D:np.ndarray) -> np.ndarray:
+    """Central difference diffusion of the interior nodes (``central_difference_1d`` over a stack of fields)."""
+    out = np.zeros_like(x)
+    out[...,1:-1] = x[...,:-2]*D[0][...,1:-1] + x[...,2:]*D[1][...,1:-1] - x[...,1:-1]*(D[0][...,1:-1] + D[1][...,1:-1])
+    return out
+
+def _interior_upwind(x:np.ndarray, F:np.ndarray) -> np.ndarray:
+    """Upwind convection of the interior nodes (``upwind_1d`` over a stack of fields)."""
+    out = np.zeros_like(x)
+    F0 = np.minimum(F[0][...,1:-1], 0)
+    F1 = np.maximum(F[1][...,1:-1], 0)
+    out[...,1:-1] = x[...,2:]*(-F0) + x[...,:-2]*F1 + x[...,1:-1]*(F0 - F1)
+    return out
+
+class _Phase:
+    """Fields and geometry of one phase stacked over the cases."""
+
+    def __init__(self, fcns, h:np.ndarray, V:np.ndarray, A:np.ndarray, dx:np.ndarray):
+        self.fcns = fcns
+        self.V = V
+        self.A = A
+        self.dx = dx
+        self.h = h
+        self.T = fcns.T(h)
+        self.rho = fcns.rho(h)
+        self.cp = fcns.cp(h)
+        self.k = fcns.k(h)
+        #openterrace empieza con conductancias y flujos nulos (se calculan al final del primer paso)
+        self.D = np.zeros((2,) + h.shape)
+        self.F = np.zeros((2,) + h.shape)
+        #rho y cp de los pcm de tres tramos son constantes: no se recalculan en cada paso
+        self._constant_rho_cp = isinstance(fcns, PCMMaterial)
+
+    def update_properties(self, mdot=None):
+        self.T = self.fcns.T(self.h)
+        if not self._constant_rho_cp:
+            self.rho = self.fcns.rho(self.h)
+            self.cp = self.fcns.cp(self.h)
+        self.k = self.fcns.k(self.h)
+        self.D[0] = self.k*self.A[0]/self.dx
+        self.D[1] = self.k*self.A[1]/self.dx
+        if mdot is not None:
+            self.F[0] = mdot*self.cp
+            self.F[1] = mdot*self.cp
+
+class BatchDischarge:
+    """Discharge of several cases advanced together in one time loop."""
+
+    def __init__(self, cases:list[dict]):
+        """Builds the stacked fields of the cases.
+
+        Args:
+            cases (list): Cases like the ones of ``parameter_sweep``: PCM name (``pcm``) plus overrides of ``DISCHARGE_PARAMS`` and of the PCM constants
+        """
+        import openterrace
+
+        if not cases:
+            raise ValueError("The batch needs at least one case")
+        params = [{**DISCHARGE_PARAMS, **{key: value for key, value in case.items() if key != "pcm" and key not in MATERIAL_COLUMNS}} for case in cases]
+        for p in params:
+            unknown = set(p) - set(DISCHARGE_PARAMS)
+            if unknown:
+                raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+            if _unsupported(p):
+                raise ValueError(f"Not available in batch mode: {_unsupported(p)}")
+        for key in SHARED_PARAMS:
+            if len({p[key] for p in params}) > 1:
+                raise ValueError(f"'{key}' must be the same in all the cases of a batch")
+        p0 = params[0]
+        self.params = params
+
+        materials = []
+        for case in cases:
+            constants = {key: value for key, value in case.items() if key in MATERIAL_COLUMNS}
+            materials.append(register_variant(case["pcm"], **constants) if constants else get_material(case["pcm"]))
+        self.names = [material.name for material in materials]
+
+        def column(key, ndim=3):
+            return np.array([p[key] for p in params], dtype=float).reshape((-1,) + (1,)*(ndim - 1))
+
+        #geometría de openterrace para cada caso (funciones del módulo del dominio, sin select_domain_shape)
+        reset_openterrace()
+        cylinder = openterrace.domains.cylinder_1d
+        sphere = openterrace.domains.hollow_sphere_1d
+        n_fluid, n_bed = p0["n_fluid"], p0["n_bed"]
+        fluid_vars = [{"n": n_fluid, "D": p["D"], "H": p["H"]} for p in params]
+        bed_vars = [{"n": n_bed, "Rinner": p["R_inner"], "Router": p["R_outer"]} for p in params]
+        phi = column("phi")
+        V_fluid = np.array([cylinder.V(v) for v in fluid_vars])[:,np.newaxis,:]*phi
+        A_fluid = np.stack([np.array(cylinder.A(v)) for v in fluid_vars], axis=1)[:,:,np.newaxis,:]
+        dx_fluid = np.array([cylinder.dx(v) for v in fluid_vars])[:,np.newaxis,:]
+        V_bed = np.array([sphere.V(v) for v in bed_vars])[:,np.newaxis,:]
+        A_bed = np.stack([sphere.A(v) for v in bed_vars], axis=1)[:,:,np.newaxis,:]
+        dx_bed = np.array([sphere.dx(v) for v in bed_vars])[:,np.newaxis,:]
+        V0_bed = np.array([sphere.V0(v) for v in bed_vars])[:,np.newaxis]
+
+        water = openterrace.fluid_substances.water
+        bed_fcns = stack_materials(materials)
+        T_init = column("T_init")
+        self.fluid = _Phase(water, water.h(np.broadcast_to(T_init, (len(cases), 1, n_fluid)).copy()), V_fluid, A_fluid, dx_fluid)
+        self.bed = _Phase(bed_fcns, bed_fcns.h(np.broadcast_to(T_init, (len(cases), n_fluid, n_bed)).copy()), V_bed, A_bed, dx_bed)
+
+        self.mdot = column("flow_rate")
+        self.h_inlet = water.h(column("T_cold", 2))
+        #acoplamiento: n° de cápsulas por nodo de fluido y área exterior de una cápsula
+        self.n_particles = V_fluid[:,0,:]/phi[:,0]*(1 - phi[:,0])/V0_bed
+        self.hA = column("h_value", 2)*A_bed[1][:,:,-1]
+
+        #balance de energía (como EnergyIntegrator, sobre T_cold)
+        self.flow_rate = column("flow_rate", 1)
+        self.cp_fluid = column("cp_fluid", 1)
+        self.T_cold = column("T_cold", 1)
+        self._m_bed = self.bed.rho*self.bed.V*self.n_particles[:,:,np.newaxis]
+        self._h_ref_bed = bed_fcns.h(column("T_cold"))
+        self.released = np.zeros(len(cases))
+        self._power = self._outlet_power()
+
+    def _outlet_power(self) -> np.ndarray:
+        return np.abs(self.flow_rate)*self.cp_fluid*(self.fluid.T[:,0,0] - self.T_cold)
+
+    def _step(self, dt:float):
+        """Advances all the cases by one time step (same operations as one iteration of ``Simulate.run_simulation``)."""
+        f, b = self.fluid, self.bed
+        #fluido: salida (zero_gradient) en el nodo 0 y entrada de agua fría en el nodo -1
+        f.h[...,0] = f.h[...,0] + (2*f.T[...,1]*f.D[1][...,0] - 2*f.T[...,0]*f.D[1][...,0] - f.F[0][...,1]*f.T[...,1] + f.F[1][...,0]*f.T[...,0])/(f.rho[...,0]*f.V[...,0])*dt
+        f.h[...,-1] = self.h_inlet
+        f.h = f.h + _interior_diffusion(f.T, f.D)/(f.rho*f.V)*dt
+        f.h = f.h + _interior_upwind(f.T, f.F)/(f.rho*f.V)*dt
+        f.update_properties(self.mdot)
+
+        #pcm: zero_gradient en ambos bordes (sin convección)
+        b.h[...,0] = b.h[...,0] + (2*b.T[...,1]*b.D[1][...,0] - 2*b.T[...,0]*b.D[1][...,0])/(b.rho[...,0]*b.V[...,0])*dt
+        b.h[...,-1] = b.h[...,-1] + (2*b.T[...,-2]*b.D[0][...,-1] - 2*b.T[...,-1]*b.D[0][...,-1])/(b.rho[...,-1]*b.V[...,-1])*dt
+        b.h = b.h + _interior_diffusion(b.T, b.D)/(b.rho*b.V)*dt
+        b.update_properties()
+
+        #acoplamiento fluido y pcm
+        Q = self.hA*(f.T[:,0,:] - b.T[:,:,-1])*dt
+        b.h[:,:,-1] = b.h[:,:,-1] + Q/(b.rho[:,:,-1]*b.V[:,:,-1])
+        f.h[:,0,:] = f.h[:,0,:] - self.n_particles*Q/(f.rho[:,0,:]*f.V[:,0,:])
+
+    def stored(self) -> dict:
+        """Energy stored in the PCM of every case above T_cold in J (``bed_latent``, ``bed_sensible``)."""
+        fcns = self.bed.fcns
+        fraction = np.clip((self.bed.h - fcns._h_s)/fcns._h_f, 0, 1)
+        latent = np.sum(self._m_bed*fraction, axis=(1, 2))*fcns._h_f[:,0,0]
+        total = np.sum(self._m_bed*(self.bed.h - self._h_ref_bed), axis=(1, 2))
+        return {"bed_latent": latent, "bed_sensible": total - latent}
+
+    def run(self) -> list[dict]:
+        """Runs all the cases to ``simulation_time``.
+
+        Returns:
+            list: Results of every case, with the entries of ``run_discharge``
+        """
+        import tqdm
+
+        p = self.params[0]
+        dt = p["dt"]
+        t_end = p["simulation_time"]
+        times = np.arange(0, t_end + dt, dt)
+        #mismos tiempos de salida que select_output de openterrace
+        output_times = np.intersect1d(np.arange(0, t_end + p["output_interval"], p["output_interval"]), times)
+        Tout = np.full((len(output_times), len(self.names)), np.nan)
+        q = 0
+        for t in tqdm.tqdm(times):
+            if q < len(output_times) and abs(t - output_times[q]) <= 1e-6:
+                Tout[q] = self.fluid.T[:,0,0]
+                q += 1
+            self._step(dt)
+            #run_simulation da un paso más allá de t_end: ese no se cuenta en el balance
+            if t < t_end - 1e-6:
+                power = self._outlet_power()
+                self.released += 0.5*(self._power + power)*dt
+                self._power = power
+
+        stored = self.stored()
+        return [{"energy": self.released[i]/1e6, "energy_latent": stored["bed_latent"][i]/1e6, "energy_sensible": stored["bed_sensible"][i]/1e6,
+                 "times": output_times[:q]/3600, "Tout": Tout[:q, i] - 273.15, "steps": len(times), "t_stop": t_end/3600, "stop_reason": None}
+                for i in range(len(self.names))]
+
+def run_batch(cases:list[dict], save:bool=False) -> list[dict]:
+    """Runs the discharge of several cases in one batch.
+
+    Args:
+        cases (list): PCM name (``pcm``) plus overrides of ``DISCHARGE_PARAMS`` and of the PCM constants of each case
+        save (bool): Write a results file of every case, like ``run_discharge``: ``results_<name>.npz``, or
+            ``results_<name>_<case_id>.npz`` when several cases have the same material (``parameter_sweep.case_id``)
+
+    Returns:
+        list: Results of every case in the order of ``cases``, with the material name (``name``, ``<pcm>[<constant>=<value>]`` for variants)
+    """
+    from parameter_sweep import case_id
+
+    batch = BatchDischarge(cases)
+    print(f" Iniciando simulación en lote de {len(cases)} casos ")
+    results = [{"name": name, **result} for name, result in zip(batch.names, batch.run())]
+    for case, result in zip(cases, results):
+        name = result["name"]
+        print(f"Energía Total Liberada ({name}): {result['energy']:.2f} MJ")
+        if save:
+            #casos del mismo material con otros parámetros: un archivo por caso
+            path = f"results_{name}.npz" if batch.names.count(name) == 1 else f"results_{name}_{case_id(case)}.npz"
+            np.savez(path, energy=result["energy"], energy_latent=result["energy_latent"],
+                     energy_sensible=result["energy_sensible"], times=result["times"], Tout=result["Tout"], t_stop=result["t_stop"])
+            print(f"Resultados de datos guardados en {path}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga de varios PCMs avanzados juntos en un solo ciclo de tiempo.")
+    parser.add_argument("pcms", nargs="*", default=PCMS, help="PCMs a simular (por defecto los 5 del benchmark)")
+    parser.add_argument("--hours", type=float, default=DISCHARGE_PARAMS["simulation_time"]/3600, help="horas simuladas")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    results = run_batch([{"pcm": pcm, "simulation_time": args.hours*3600} for pcm in args.pcms], save=True)
+    print(f"\nEnergía Total Liberada ({time.perf_counter() - t0:.1f} s):")
+    for result in results:
+        print(f"{result['name']:<35} | {result['energy']:<20.2f}")
+
+if __name__ == "__main__":
+    main()
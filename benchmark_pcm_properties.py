@@ -0,0 +1,88 @@
+import numpy as np
+from pcm_registry import load_materials, load_curves
+import timeit
+
+#tamaño de los arrays que openterrace pasa al pcm (n_fluid x n_bed)
+n_fluid = 100
+n_bed = 20
+
+#curvas de pcm_curves.csv muestreadas de un pcm de pcm_materials.csv: tienen que dar lo mismo que el modelo de tres tramos
+TABULATED_REFERENCES = {"sodium_acetate_trihydrate_tabla": "sodium_acetate_trihydrate"}
+
+def piecewise_h(m, T):
+    """Reference np.piecewise implementation of h(T) (previous version of the PCM modules)."""
+    return np.piecewise(T, [T <= m._T_s, (T > m._T_s) & (T <= m._T_l), T > m._T_l],
+                        [lambda T: m._cp*T,
+                         lambda T: m._h_s + (T-m._T_s)/(m._T_l-m._T_s)*m._h_f,
+                         lambda T: m._h_l + m._cp*(T-m._T_l)])
+
+def piecewise_T(m, h):
+    """Reference np.piecewise implementation of T(h) (previous version of the PCM modules)."""
+    return np.piecewise(h, [h <= m._h_s, (h > m._h_s) & (h <= m._h_l), h > m._h_l],
+                        [lambda h: 1/m._cp*h,
+                         lambda h: m._T_s + (m._T_l-m._T_s)*(h-m._h_s)/(m._h_l-m._h_s),
+                         lambda h: m._T_l + 1/m._cp*(h-m._h_l)])
+
+def piecewise_k(m, h):
+    """Reference np.piecewise implementation of k(h) (previous version of the PCM modules)."""
+    return np.piecewise(h, [h <= m._h_s, (h > m._h_s) & (h <= m._h_l), h > m._h_l],
+                        [m._k_s,
+                         lambda h: m._k_s + (m._k_l-m._k_s)/(m._h_l-m._h_s)*(h-m._h_s),
+                         m._k_l])
+
+def best_time(fcn, number:int) -> float:
+    """Best of 5 repeats of the mean time per call in seconds."""
+    return min(timeit.repeat(fcn, number=number, repeat=5)) / number
+
+def main():
+    rng = np.random.default_rng(0)
+    number = 2000
+
+    print(f"Micro-benchmark de propiedades PCM (arrays {n_bed}x{n_fluid})")
+    print("=" * 78)
+    print(f"{'PCM':<31} | {'fn':<2} | {'piecewise (us)':>14} | {'clip (us)':>9} | {'out= (us)':>9} | {'x':>5}")
+    print("-" * 78)
+    #todos los pcms de la tabla pcm_materials.csv
+    for pcm_name, m in load_materials().items():
+        #temperaturas alrededor del cambio de fase, con nodos sólidos, en la zona mushy y líquidos
+        T = rng.uniform(m._T_s - 5, m._T_l + 5, size=(n_fluid, n_bed))
+        T.flat[::7] = rng.uniform(m._T_s, m._T_l, size=T.size)[::7]
+        h = piecewise_h(m, T)
+        out = np.empty_like(T)
+
+        for name, x, reference, fast in [("h", T, piecewise_h, m.h), ("T", h, piecewise_T, m.T), ("k", h, piecewise_k, m.k)]:
+            #mismos resultados que la versión np.piecewise
+            expected = reference(m, x)
+            assert np.allclose(fast(x), expected, rtol=1e-12, atol=0), (pcm_name, name)
+            assert np.allclose(fast(x, out=out), expected, rtol=1e-12, atol=0), (pcm_name, name)
+
+            t_ref = best_time(lambda: reference(m, x), number)
+            t_fast = best_time(lambda: fast(x), number)
+            t_out = best_time(lambda: fast(x, out=out), number)
+            print(f"{pcm_name:<31} | {name:<2} | {t_ref*1e6:>14.1f} | {t_fast*1e6:>9.1f} | {t_out*1e6:>9.1f} | {t_ref/t_out:>5.1f}")
+
+    print(f"\nCurvas tabuladas vs modelo de tres tramos (arrays {n_bed}x{n_fluid})")
+    print("=" * 78)
+    print(f"{'curva':<31} | {'fn':<2} | {'max error rel.':>14} | {'tramos (us)':>11} | {'tabla (us)':>10}")
+    print("-" * 78)
+    materials = load_materials()
+    curves = load_curves()
+    for curve_name, pcm_name in TABULATED_REFERENCES.items():
+        m, table = materials[pcm_name], curves[curve_name]
+        #todo el rango de operación (agua fría a 20°C, estanque a 80°C), con nodos en la zona mushy
+        T = rng.uniform(273.15 + 10, 273.15 + 120, size=(n_fluid, n_bed))
+        T.flat[::7] = rng.uniform(m._T_s, m._T_l, size=T.size)[::7]
+        h = m.h(T)
+        out = np.empty_like(T)
+
+        for name, x, reference, tabulated in [("h", T, m.h, table.h), ("T", h, m.T, table.T), ("k", h, m.k, table.k)]:
+            expected = reference(x)
+            error = np.max(np.abs(tabulated(x, out=out) - expected)/np.abs(expected))
+            assert error < 1e-9, (curve_name, name, error)
+            t_ref = best_time(lambda: reference(x, out=out), number)
+            t_table = best_time(lambda: tabulated(x, out=out), number)
+            print(f"{curve_name:<31} | {name:<2} | {error:>14.1e} | {t_ref*1e6:>11.1f} | {t_table*1e6:>10.1f}")
+        assert np.allclose(table.rho(h), m.rho(h), rtol=1e-12, atol=0), (curve_name, "rho")
+
+if __name__ == "__main__":
+    main()
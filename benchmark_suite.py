@@ -0,0 +1,223 @@
+"""
+Benchmark suite of the simulation pipeline.
+
+Each benchmark runs in a fresh process (so the peak memory of one doesn't hide the others) and
+reports its wall time, its throughput (time steps or property calls per second) and the peak
+resident memory of the process. ``--save`` stores the results in ``benchmark_baseline.json``;
+without it the results are compared with the stored baseline and every metric that got worse by
+more than the tolerance is reported as a regression (exit code 1).
+"""
+
+import numpy as np
+from simulate_all_pcms import PCMS
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import tempfile
+import platform
+import argparse
+import timeit
+import json
+import time
+import sys
+import os
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+#tiempo simulado de las corridas cortas (10 min)
+SHORT_RUN = 600
+
+#sentido de cada métrica: 1 si más alto es mejor, -1 si más bajo es mejor
+METRICS = {"time": -1, "steps_per_s": 1, "calls_per_s": 1, "peak_rss_mb": -1}
+
+def bench_properties(fcn_name:str) -> dict:
+    """Calls one property function of every PCM of the table on (n_fluid x n_bed) arrays."""
+    from pcm_registry import load_materials
+
+    rng = np.random.default_rng(0)
+    number = 2000
+    calls = []
+    #solo las filas de pcm_materials.csv: las curvas de ejemplo cambiarían la línea base
+    for m in load_materials().values():
+        #nodos sólidos, en la zona mushy y líquidos
+        T = rng.uniform(m._T_s - 5, m._T_l + 5, size=(100, 20))
+        x = T if fcn_name == "h" else m.h(T)
+        fcn = getattr(m, fcn_name)
+        calls.append(lambda fcn=fcn, x=x: fcn(x))
+    t = min(timeit.repeat(lambda: [call() for call in calls], number=number, repeat=5))
+    return {"time": t, "calls_per_s": number*len(calls)/t}
+
+def bench_discharge(pcm_name:str) -> dict:
+    """Short discharge run (10 min simulated) of one PCM."""
+    from simulate_all_pcms import run_discharge
+
+    t0 = time.perf_counter()
+    results = run_discharge(pcm_name, save=False, simulation_time=SHORT_RUN, output_interval=60)
+    t = time.perf_counter() - t0
+    return {"time": t, "steps_per_s": results["steps"]/t}
+
+def bench_charge(pcm_name:str) -> dict:
+    """Short static charge run (10 min simulated) of one PCM."""
+    from simulate_all_pcms_carga import run_charge
+
+    t0 = time.perf_counter()
+    results = run_charge(pcm_name, save=False, simulation_time=SHORT_RUN, output_interval=60)
+    t = time.perf_counter() - t0
+    return {"time": t, "steps_per_s": results["steps"]/t}
+
+def _write_results(directory:str, n_times:int=14401):
+    """Writes discharge result files of the five PCMs with the outlet temperature every second of 4 hours."""
+    rng = np.random.default_rng(0)
+    times = np.linspace(0, 4, n_times)
+    for pcm in PCMS:
+        Tout = 80 - 30*times/4 + rng.normal(0, 0.1, n_times)
+        np.savez(os.path.join(directory, f"results_{pcm}.npz"), energy=rng.uniform(5, 30), times=times, Tout=Tout)
+
+def bench_npz() -> dict:
+    """Writes the five discharge result files and reads them through ``ResultStore``."""
+    from result_store import ResultStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        t0 = time.perf_counter()
+        _write_results(directory)
+        store = ResultStore(directory)
+        #se leen todos los arrays de los archivos
+        for entry in store:
+            np.sum(entry.node("salida")) + entry["energy"]
+        t = time.perf_counter() - t0
+    return {"time": t}
+
+def bench_plot() -> dict:
+    """Draws and saves the outlet temperature of the five PCMs and the comparison plot of ``plot_all_pcms.py`` (headless mode)."""
+    from plot_backend import set_headless, pyplot
+    set_headless()
+    plt = pyplot()
+    from simulate_all_pcms import plot_discharge
+    from plot_all_pcms import plot_and_summarize
+    from result_store import ResultStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        _write_results(directory)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            t0 = time.perf_counter()
+            for entry in ResultStore():
+                plot_discharge(entry.pcm, {"times": entry.times, "Tout": entry.node("salida")})
+                plt.close('all')
+            plot_and_summarize()
+            plt.close('all')
+            t = time.perf_counter() - t0
+        finally:
+            os.chdir(cwd)
+    return {"time": t}
+
+#nombre de cada benchmark y la función que lo corre
+BENCHMARKS = {
+    **{f"propiedades_{fcn}": (bench_properties, fcn) for fcn in ["h", "T", "k", "cp", "rho"]},
+    **{f"descarga_{pcm}": (bench_discharge, pcm) for pcm in PCMS},
+    "carga_sodium_acetate_trihydrate": (bench_charge, "sodium_acetate_trihydrate"),
+    "npz_escritura_lectura": (bench_npz,),
+    "graficos": (bench_plot,),
+}
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of the current process in MB (None if it can't be measured)."""
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #en macOS ru_maxrss está en bytes, en Linux en kB
+        return maxrss/1024**2 if sys.platform == "darwin" else maxrss/1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset/1024**2
+        except (ImportError, AttributeError):
+            return None
+
+def _measure(name:str) -> dict:
+    """Runs one benchmark and adds the peak memory of the process."""
+    fcn, *args = BENCHMARKS[name]
+    result = fcn(*args)
+    rss = peak_rss_mb()
+    if rss is not None:
+        result["peak_rss_mb"] = rss
+    return result
+
+def run_benchmarks(names:list[str]) -> dict:
+    """Runs the benchmarks one after the other, each in a new process.
+
+    Args:
+        names (list): Names of the benchmarks (keys of ``BENCHMARKS``)
+
+    Returns:
+        dict: Metrics of each benchmark
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in names:
+        print(f"Corriendo {name}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(_measure, name).result()
+    return results
+
+def compare(results:dict, baseline:dict, tolerance:float) -> list[str]:
+    """Prints the results next to the baseline and returns the metrics that got worse by more than ``tolerance``.
+
+    Args:
+        results (dict): Metrics of each benchmark
+        baseline (dict): Stored metrics of each benchmark
+        tolerance (float): Relative change counted as a regression
+
+    Returns:
+        list: Regressions as ``benchmark:metric``
+    """
+    regressions = []
+    print(f"\n{'benchmark':<45} | {'métrica':<12} | {'base':>10} | {'actual':>10} | {'cambio':>7}")
+    print("-" * 96)
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if base is None:
+                print(f"{name:<45} | {metric:<12} | {'-':>10} | {value:>10.4g} | {'-':>7}")
+                continue
+            change = (value - base)/base
+            worse = -METRICS[metric]*change > tolerance
+            flag = "  REGRESIÓN" if worse else ""
+            print(f"{name:<45} | {metric:<12} | {base:>10.4g} | {value:>10.4g} | {change:>+7.1%}{flag}")
+            if worse:
+                regressions.append(f"{name}:{metric}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de simulación, comparados con la línea base guardada.")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help="benchmarks a correr (por defecto todos)")
+    parser.add_argument("--save", action="store_true", help="guardar los resultados como nueva línea base")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="archivo de la línea base")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="cambio relativo que cuenta como regresión")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"benchmarks desconocidos: {unknown}. Disponibles: {list(BENCHMARKS)}")
+
+    results = run_benchmarks(args.benchmarks)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline.get("results", {}), args.tolerance)
+
+    if args.save:
+        #se conservan los benchmarks que no se corrieron esta vez
+        baseline = {"machine": {"platform": platform.platform(), "python": platform.python_version(), "processor": platform.processor()},
+                    "results": {**baseline.get("results", {}), **results}}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nLínea base guardada en {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regresiones (tolerancia {args.tolerance:.0%}): {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
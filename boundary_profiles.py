@@ -0,0 +1,131 @@
+"""
+Time-varying mass flow rate and inlet temperature of the fluid, driven by time series.
+
+``TimeSeriesBC`` is given to ``tank_simulation.run`` as a driver. With a fixed time step the
+series are interpolated once onto all the step times (one vectorized ``np.interp`` per series)
+and every step only picks its value by index; with the adaptive step the value is interpolated
+at each step, and the steps land on the points of the series. The draw profiles come from a
+CSV file (``load_profile``) or from the tapping cycle M of EN 16147 (``tapping_cycle``).
+"""
+
+import numpy as np
+
+#ciclo de extracción M (EN 16147): (hora, energía en kWh, caudal en l/min)
+TAPPING_CYCLE_M = [
+    ("07:00", 0.105, 3), ("07:05", 1.400, 6), ("07:30", 0.105, 3), ("08:01", 0.105, 3),
+    ("08:15", 0.105, 3), ("08:30", 0.105, 3), ("08:45", 0.105, 3), ("09:00", 0.105, 3),
+    ("09:30", 0.105, 3), ("10:30", 0.105, 3), ("11:30", 0.105, 3), ("11:45", 0.105, 3),
+    ("12:45", 0.315, 4), ("14:30", 0.105, 3), ("15:30", 0.105, 3), ("16:30", 0.105, 3),
+    ("18:00", 0.105, 3), ("18:15", 0.105, 3), ("18:30", 0.105, 3), ("19:00", 0.105, 3),
+    ("20:30", 0.735, 4), ("21:15", 0.105, 3), ("21:30", 1.400, 6),
+]
+
+class TimeSeriesBC:
+    """Mass flow rate and/or fixed inlet temperature of a fluid phase given as time series."""
+
+    def __init__(self, phase, times, mdot=None, T=None, position=(slice(None, None, None), -1), interpolation:str='linear'):
+        """Initialises the series (the inlet needs a ``fixed_value`` boundary condition at ``position``).
+
+        Args:
+            phase (object): openterrace fluid phase
+            times (ndarray): Times of the series in s (increasing)
+            mdot (ndarray): Mass flow rate in kg/s at each time (None keeps the flow of the phase)
+            T (ndarray): Inlet temperature in K at each time (None keeps the boundary value)
+            position (tuple): Position of the fixed_value boundary condition of the inlet
+            interpolation (str): 'linear' or 'previous' (piecewise constant, for draw-offs)
+        """
+        if interpolation not in ('linear', 'previous'):
+            raise ValueError(f"Unknown interpolation '{interpolation}'. Valid options are: ['linear', 'previous']")
+        self.phase = phase
+        self.times = np.asarray(times, dtype=float)
+        self.mdot = None if mdot is None else np.asarray(mdot, dtype=float)
+        self.T = None if T is None else np.asarray(T, dtype=float)
+        self.interpolation = interpolation
+        self._bc = None
+        if self.T is not None:
+            inlets = [bc for bc in phase.bcs if bc['type'] == 'fixed_value' and bc['position'] == position]
+            if not inlets:
+                raise ValueError(f"The phase has no fixed_value boundary condition at {position} for the inlet temperature")
+            self._bc = inlets[-1]
+        self._mdot_steps = None
+        self._T_steps = None
+
+    def _interp(self, t, values:np.ndarray):
+        """Value of a series at the times t (vectorized)."""
+        if self.interpolation == 'linear':
+            return np.interp(t, self.times, values)
+        i = np.clip(np.searchsorted(self.times, t, side='right') - 1, 0, len(self.times) - 1)
+        return values[i]
+
+    def prepare(self, step_times:np.ndarray):
+        """Interpolates the series onto the times of all the fixed steps.
+
+        Args:
+            step_times (ndarray): Start time of every step in s
+        """
+        if self.mdot is not None:
+            self._mdot_steps = self._interp(step_times, self.mdot)
+        if self.T is not None:
+            self._T_steps = self._interp(step_times, self.T)
+
+    def apply(self, t:float, i:int=None):
+        """Sets the mass flow rate and inlet temperature of the step starting at t.
+
+        Args:
+            t (float): Time in s
+            i (int): Index of the step in the times given to ``prepare`` (None interpolates at t)
+        """
+        if self.mdot is not None:
+            if i is not None:
+                self.phase.mdot_array = self._mdot_steps[i]
+            else:
+                self.phase.mdot_array = self._interp(t, self.mdot)
+                #cota de |mdot| hasta el próximo punto de la serie, para el límite de estabilidad
+                j = min(np.searchsorted(self.times, t, side='right'), len(self.times) - 1)
+                end = self.mdot[j] if self.interpolation == 'linear' else self.phase.mdot_array
+                self.phase.mdot_bound = max(abs(self.phase.mdot_array), abs(end))
+        if self.T is not None:
+            self._bc['value'] = self._T_steps[i] if i is not None else self._interp(t, self.T)
+
+def load_profile(path:str) -> dict:
+    """Reads a draw profile from a CSV file with the columns ``t_s``, ``mdot`` (kg/s) and/or ``T_inlet_C``.
+
+    Args:
+        path (str): Path of the CSV file
+
+    Returns:
+        dict: ``times`` in s and ``mdot`` in kg/s and ``T`` in K (None for missing columns)
+    """
+    data = np.genfromtxt(path, delimiter=',', names=True, encoding='utf-8')
+    columns = data.dtype.names
+    return {"times": data["t_s"],
+            "mdot": data["mdot"] if "mdot" in columns else None,
+            "T": data["T_inlet_C"] + 273.15 if "T_inlet_C" in columns else None}
+
+def tapping_cycle(cycle:list=TAPPING_CYCLE_M, delta_T:float=45.0, cp:float=4186.0, direction:float=-1.0) -> dict:
+    """Builds the mass flow rate of a tapping cycle as a piecewise constant series over one day.
+
+    Every draw-off starts at its hour with its flow rate and lasts until the water heated by
+    ``delta_T`` carries its energy.
+
+    Args:
+        cycle (list): Draw-offs as ``("hh:mm", energy in kWh, flow rate in l/min)``
+        delta_T (float): Temperature rise of the drawn water in K
+        cp (float): Specific heat capacity of the water in J/(kg K)
+        direction (float): Sign of the flow (-1 downwards, like ``flow_rate`` of the discharge)
+
+    Returns:
+        dict: ``times`` in s and ``mdot`` in kg/s (use with ``interpolation='previous'``)
+    """
+    times = [0.0]
+    mdot = [0.0]
+    for hour, energy, flow in cycle:
+        hours, minutes = hour.split(":")
+        start = 3600*int(hours) + 60*int(minutes)
+        flow_rate = flow/60              #kg/s (1 l = 1 kg)
+        duration = energy*3.6e6/(cp*delta_T)/flow_rate
+        times += [start, start + duration]
+        mdot += [direction*flow_rate, 0.0]
+    times.append(24*3600)
+    mdot.append(0.0)
+    return {"times": np.array(times), "mdot": np.array(mdot), "T": None}
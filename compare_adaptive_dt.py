@@ -0,0 +1,49 @@
+import numpy as np
+from simulate_all_pcms import PCMS, run_discharge
+from simulate_all_pcms_carga import run_charge
+import argparse
+import time
+
+def compare(pcm_name:str, **params) -> dict:
+    """Runs the discharge and the charge of one PCM with the fixed dt and with the adaptive dt.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        **params: Overrides of the simulation parameters
+
+    Returns:
+        dict: Steps and wall time of both runs and errors of the adaptive run against the fixed dt reference
+    """
+    out = {}
+    for mode, fcn, key in [("descarga", run_discharge, "Tout"), ("carga", run_charge, "T_fondo_C")]:
+        t0 = time.perf_counter()
+        ref = fcn(pcm_name, save=False, **params)
+        t1 = time.perf_counter()
+        ada = fcn(pcm_name, save=False, adaptive=True, **params)
+        t2 = time.perf_counter()
+        out[mode] = {"steps_ref": ref["steps"], "steps": ada["steps"],
+                     "speedup": (t1 - t0) / (t2 - t1),
+                     "err_T": np.max(np.abs(ada[key] - ref[key]))}
+        if mode == "descarga":
+            out[mode]["err_energy"] = abs(ada["energy"] - ref["energy"])
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Error del paso de tiempo adaptativo frente al dt = 0.1 s de referencia.")
+    parser.add_argument("pcms", nargs="*", default=PCMS, help="PCMs a comparar (por defecto los 5 del benchmark)")
+    parser.add_argument("--hours", type=float, default=4, help="tiempo simulado en horas")
+    args = parser.parse_args()
+
+    results = {pcm: compare(pcm, simulation_time=args.hours * 3600) for pcm in args.pcms}
+
+    print("\nPaso de tiempo adaptativo vs dt = 0.1 s:")
+    print("=" * 106)
+    print(f"{'PCM':<31} | {'modo':<8} | {'pasos ref':>9} | {'pasos':>7} | {'x':>5} | {'max |dT| (°C)':>13} | {'|dE| (MJ)':>9}")
+    print("-" * 106)
+    for pcm_name, modes in results.items():
+        for mode, r in modes.items():
+            err_energy = f"{r['err_energy']:>9.2e}" if "err_energy" in r else f"{'-':>9}"
+            print(f"{pcm_name:<31} | {mode:<8} | {r['steps_ref']:>9} | {r['steps']:>7} | {r['speedup']:>5.1f} | {r['err_T']:>13.2e} | {err_energy}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Multi-day charge/discharge cycles of the tank on one openterrace state.
+
+The tank is built once and a daily schedule of segments is applied to it: ``carga`` (no flow,
+heater at the bottom node, like ``simulate_all_pcms_carga.py``), ``descarga`` (cold water in at
+the top and hot water out at the bottom, like ``simulate_all_pcms.py``) and ``reposo`` (no flow,
+no heater). Between segments only the mass flow rate and the boundary conditions of the fluid
+are switched, so the fluid and bed fields carry over. The fields (and the phase state of a
+HysteresisMaterial) are checkpointed to ``<name>_estado/dia_<n>.npz`` at the end of the days,
+so a long run can be resumed from any saved day. One row per segment is appended to
+``<name>.jsonl`` and collected into a table like the parameter sweeps.
+"""
+
+import numpy as np
+from tank_simulation import reset_openterrace, run
+from pcm_registry import select_material
+from energy_accounting import EnergyIntegrator
+from parameter_sweep import load_checkpoint, write_table, read_table, default_table_path
+import argparse
+import json
+import glob
+import os
+
+#día típico de agua caliente sanitaria: (segmento, duración en s)
+DAILY_SCHEDULE = [
+    ("carga", 6 * 3600),     #00-06 calentador con tarifa nocturna
+    ("reposo", 1 * 3600),    #06-07
+    ("descarga", 1 * 3600),  #07-08 duchas de la mañana
+    ("reposo", 11 * 3600),   #08-19
+    ("descarga", 2 * 3600),  #19-21 consumo de la tarde
+    ("reposo", 3 * 3600),    #21-24
+]
+
+SEGMENTS = ["carga", "descarga", "reposo"]
+
+#parámetros de los ciclos (mismo estanque de la descarga y la carga)
+CYCLE_PARAMS = {
+    "D": 0.3,
+    "H": 1.5,
+    "phi": 0.4,
+    "R_inner": 0.01,
+    "R_outer": 0.03,
+    "n_fluid": 100,
+    "n_bed": 20,
+    "h_value": 200,
+    "dt": 0.1,
+    "T_init": 273.15 + 20.0,    #el estanque parte frío
+    "T_hot": 273.15 + 80.0,     #calentador en el nodo 0 durante la carga
+    "T_cold": 273.15 + 20.0,    #agua fría de entrada en el nodo -1 durante la descarga
+    "flow_rate": -0.01,         #flujo de la descarga (hacia abajo)
+    "cp_fluid": 4200,
+    #un año con dt fijo son ~3e8 pasos: por defecto el paso es adaptativo
+    "adaptive": True,
+    "safety": 0.9,
+    "phase_change_factor": 0.5,
+    #paso implícito (ver implicit_solver.py), con adaptive=False y un dt de 10-30 s
+    "implicit": False,
+    "theta": 1.0,
+    "fused": False,             #paso explícito compilado (ver fused_step.py)
+    "supercooling": 0.0,
+    "hysteresis": 0.0,
+    "grading": None,
+}
+
+class _OutletMonitor:
+    """Minimum and time averaged temperature of the fluid outlet node during a segment."""
+
+    def __init__(self, fluid, outlet:int=0):
+        self.fluid = fluid
+        self.outlet = outlet
+        self.T_min = fluid.T[0, outlet]
+        self._integral = 0.0
+        self._time = 0.0
+
+    def update(self, ot, t:float, dt:float):
+        T = self.fluid.T[0, self.outlet]
+        self.T_min = min(self.T_min, T)
+        self._integral += T*dt
+        self._time += dt
+
+    @property
+    def T_mean(self) -> float:
+        return self._integral/self._time if self._time > 0 else self.T_min
+
+def build_tank(pcm_name:str, p:dict):
+    """Builds the openterrace simulation of the tank, without the boundary conditions of a segment.
+
+    The fluid has both diffusion and convection schemes, so the same phase can be used for the
+    static charge and for the discharge.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        p (dict): Parameters (entries of ``CYCLE_PARAMS``)
+
+    Returns:
+        tuple: openterrace simulation, fluid phase and bed phase
+    """
+    import openterrace
+
+    reset_openterrace()
+    ot = openterrace.Simulate(t_start=0, t_end=0, dt=p["dt"])
+
+    fluid = ot.create_phase(n=p["n_fluid"], type='fluid')
+    fluid.select_substance(substance='water')
+    fluid.select_domain_shape(domain='cylinder_1d', D=p["D"], H=p["H"])
+    fluid.select_porosity(phi=p["phi"])
+    fluid.select_schemes(diff='central_difference_1d', conv='upwind_1d')
+    fluid.select_initial_conditions(T=p["T_init"])
+    fluid.select_massflow(mdot=0.0)
+
+    bed = ot.create_phase(n=p["n_bed"], n_other=p["n_fluid"], type='bed')
+    select_material(bed, pcm_name, supercooling=p["supercooling"], hysteresis=p["hysteresis"], grading=p["grading"])
+    bed.select_domain_shape(domain='hollow_sphere_1d', Rinner=p["R_inner"], Router=p["R_outer"])
+    bed.select_schemes(diff='central_difference_1d')
+    bed.select_initial_conditions(T=p["T_init"])
+    bed.select_bc(bc_type='zero_gradient', parameter='T', position=(slice(None, None, None), 0))
+    bed.select_bc(bc_type='zero_gradient', parameter='T', position=(slice(None, None, None), -1))
+
+    ot.select_coupling(fluid_phase=0, bed_phase=1, h_exp='constant', h_value=p["h_value"])
+    return ot, fluid, bed
+
+def _refresh(phase, t:float):
+    """Recomputes the properties (and convective fluxes) of a phase from its enthalpy field."""
+    if hasattr(phase, 'conv'):
+        phase._update_massflow_rate(t)
+    phase._update_properties()
+
+def select_segment(fluid, segment:str, p:dict, t:float=0.0):
+    """Switches the mass flow rate and boundary conditions of the fluid to those of a segment.
+
+    Args:
+        fluid (object): openterrace fluid phase
+        segment (str): 'carga', 'descarga' or 'reposo'
+        p (dict): Parameters (entries of ``CYCLE_PARAMS``)
+        t (float): Current time in s
+    """
+    if segment not in SEGMENTS:
+        raise ValueError(f"Unknown segment '{segment}'. Valid segments are: {SEGMENTS}")
+    bottom = (slice(None, None, None), 0)
+    top = (slice(None, None, None), -1)
+    fluid.bcs = []
+    if segment == "descarga":
+        #salida de agua caliente abajo y entrada de agua fría arriba
+        fluid.select_massflow(mdot=p["flow_rate"])
+        fluid.select_bc(bc_type='zero_gradient', parameter='T', position=bottom)
+        fluid.select_bc(bc_type='fixed_value', parameter='T', position=top, value=p["T_cold"])
+    elif segment == "carga":
+        #calentador en el fondo, cima aislada
+        fluid.select_massflow(mdot=0.0)
+        fluid.select_bc(bc_type='fixed_value', parameter='T', position=bottom, value=p["T_hot"])
+        fluid.select_bc(bc_type='zero_gradient', parameter='T', position=top)
+    else:
+        fluid.select_massflow(mdot=0.0)
+        fluid.select_bc(bc_type='zero_gradient', parameter='T', position=bottom)
+        fluid.select_bc(bc_type='zero_gradient', parameter='T', position=top)
+    #los flujos convectivos del primer paso ya usan el flujo nuevo
+    _refresh(fluid, t)
+
+def state_dir(name:str) -> str:
+    """Directory of the daily checkpoints of a cyclic run."""
+    return name + "_estado"
+
+def save_state(path:str, pcm_name:str, p:dict, day:int, t:float, fluid, bed):
+    """Writes the state of the tank at the end of a day (through a temporary file, so a crash never leaves half a checkpoint).
+
+    Args:
+        path (str): Path of the .npz file
+        pcm_name (str): Name of the bed substance
+        p (dict): Parameters of the run
+        day (int): Number of days simulated
+        t (float): Time in s
+        fluid (object): openterrace fluid phase
+        bed (object): openterrace bed phase
+    """
+    arrays = {"day": day, "t": t, "pcm": pcm_name, "params": json.dumps(p, sort_keys=True), "fluid_h": fluid.h, "bed_h": bed.h}
+    if getattr(bed.fcns, 'state', None) is not None:
+        arrays["bed_state"] = bed.fcns.state
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(path + ".tmp", path)
+
+def load_state(path:str, pcm_name:str, p:dict, fluid, bed) -> tuple[int, float]:
+    """Restores the fields of the tank from a checkpoint of ``save_state``.
+
+    Args:
+        path (str): Path of the .npz file
+        pcm_name (str): Name of the bed substance (must be the one of the checkpoint)
+        p (dict): Parameters of the run (must be the ones of the checkpoint)
+        fluid (object): openterrace fluid phase
+        bed (object): openterrace bed phase
+
+    Returns:
+        tuple: Number of days simulated and time in s
+    """
+    with np.load(path) as data:
+        if str(data["pcm"]) != pcm_name or json.loads(str(data["params"])) != json.loads(json.dumps(p, sort_keys=True)):
+            raise ValueError(f"The checkpoint {path} belongs to another PCM or other parameters")
+        fluid.h[...] = data["fluid_h"]
+        bed.h[...] = data["bed_h"]
+        if "bed_state" in data:
+            bed.fcns.state = data["bed_state"].copy()
+        day, t = int(data["day"]), float(data["t"])
+    _refresh(fluid, t)
+    _refresh(bed, t)
+    return day, t
+
+def saved_days(name:str) -> list[int]:
+    """Days with a checkpoint of the cyclic run ``name``, in order."""
+    files = glob.glob(os.path.join(state_dir(name), "dia_*.npz"))
+    return sorted(int(os.path.basename(path)[4:-4]) for path in files)
+
+def run_cycles(pcm_name:str, days:int=1, schedule:list=DAILY_SCHEDULE, name:str=None, resume=None, checkpoint_every:int=1, **params) -> dict:
+    """Runs ``days`` days of the schedule on one tank, with the fields carried over between segments.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        days (int): Total number of days (including the days already simulated when resuming)
+        schedule (list): Segments of one day as ``(segment, duration in s)``
+        name (str): Base name of the checkpoints, log and table (``ciclos_<pcm_name>`` if None)
+        resume: None to start from ``T_init``, a day number to continue from its checkpoint, or 'last' for the last checkpoint
+        checkpoint_every (int): Number of days between checkpoints (the last day is always saved)
+        **params: Overrides of the entries in ``CYCLE_PARAMS``
+
+    Returns:
+        dict: Table of the segments, one array per column: day, segment, start and end time in hours, released energy in MJ, energy stored at the end in MJ (``bed_latent``, ``bed_sensible``, ``fluid_sensible``), minimum and mean outlet temperature in C and final bottom/top temperature in C
+    """
+    p = {**CYCLE_PARAMS, **params}
+    name = f"ciclos_{pcm_name}" if name is None else name
+    log = name + ".jsonl"
+    os.makedirs(state_dir(name), exist_ok=True)
+
+    ot, fluid, bed = build_tank(pcm_name, p)
+    day, t = 0, 0.0
+    if resume is not None:
+        saved = saved_days(name)
+        if resume == "last":
+            if not saved:
+                raise ValueError(f"There are no checkpoints of '{name}' to resume from")
+            resume = saved[-1]
+        if resume not in saved:
+            raise ValueError(f"There is no checkpoint of day {resume} of '{name}'. Saved days: {saved}")
+        day, t = load_state(os.path.join(state_dir(name), f"dia_{resume:04d}.npz"), pcm_name, p, fluid, bed)
+    #las filas de los días posteriores al punto de partida se descartan
+    rows = [row for row in load_checkpoint(log) if row["day"] <= day]
+    with open(log, "w") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    print(f"Ciclos de {pcm_name}: días {day + 1} a {days}")
+
+    with open(log, "a") as f:
+        while day < days:
+            day += 1
+            released = 0.0
+            for segment, duration in schedule:
+                select_segment(fluid, segment, p, t)
+                ot.t_start, ot.t_end = t, t + duration
+                flow_rate = p["flow_rate"] if segment == "descarga" else 0.0
+                energy = EnergyIntegrator(fluid, bed, flow_rate=flow_rate, cp_fluid=p["cp_fluid"], T_ref=p["T_cold"], outlet=0)
+                outlet = _OutletMonitor(fluid)
+                run(ot, adaptive=p["adaptive"], safety=p["safety"], phase_change_factor=p["phase_change_factor"],
+                    monitors=[energy, outlet], extra_step=False, implicit=p["implicit"], theta=p["theta"], fused=p["fused"])
+                t = ot.t_end
+
+                balance = energy.summary()
+                released += balance["released"]
+                row = {"day": day, "segment": segment, "t_start": (t - duration)/3600, "t_end": t/3600,
+                       **{key: float(value) for key, value in balance.items()},
+                       "Tout_min": float(outlet.T_min - 273.15), "Tout_mean": float(outlet.T_mean - 273.15),
+                       "T_fondo": float(fluid.T[0, 0] - 273.15), "T_cima": float(fluid.T[0, -1] - 273.15)}
+                f.write(json.dumps(row) + "\n")
+                f.flush()
+            print(f"Día {day}: {released:.2f} MJ liberados, {balance['bed_latent']:.2f} MJ latentes en el PCM al final del día")
+            if day % checkpoint_every == 0 or day == days:
+                save_state(os.path.join(state_dir(name), f"dia_{day:04d}.npz"), pcm_name, p, day, t, fluid, bed)
+
+    table = default_table_path(name)
+    write_table(load_checkpoint(log), table)
+    print(f"Tabla de los ciclos guardada en {table}")
+    return read_table(table)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ciclos diarios de carga y descarga del estanque, con reanudación desde el estado guardado.")
+    parser.add_argument("pcm", help="PCM a simular")
+    parser.add_argument("--days", type=int, default=1, help="n° total de días")
+    parser.add_argument("--resume", default=None, help="día desde el que se continúa ('last' para el último guardado)")
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="n° de días entre estados guardados")
+    parser.add_argument("--fixed", action="store_true", help="paso de tiempo fijo dt en vez del adaptativo")
+    parser.add_argument("-o", "--name", default=None, help="nombre base de los archivos (por defecto ciclos_<pcm>)")
+    args = parser.parse_args()
+
+    resume = args.resume if args.resume in (None, "last") else int(args.resume)
+    run_cycles(args.pcm, days=args.days, name=args.name, resume=resume, checkpoint_every=args.checkpoint_every, adaptive=not args.fixed)
+
+if __name__ == "__main__":
+    main()
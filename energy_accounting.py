@@ -0,0 +1,108 @@
+"""
+Energy accounting during the simulation.
+
+``EnergyIntegrator`` is given to ``tank_simulation.run`` as a monitor and is updated after every
+time step. The energy released to the outlet water is integrated step by step (trapezoidal rule
+on the step times, not only on the output times), and the energy stored in the tank is evaluated
+from the current enthalpy fields: in the PCM it is split into latent heat (enthalpy between
+``_h_s`` and ``_h_l``, or the ``liquid_fraction`` of the material if it has a phase state) and
+sensible heat, both relative to a reference temperature. Only a few
+scalars are kept, whatever the length of the run.
+"""
+
+import numpy as np
+
+class EnergyIntegrator:
+    """Running energy balance of a fluid phase with a PCM bed."""
+
+    def __init__(self, fluid, bed, flow_rate:float, cp_fluid:float, T_ref:float, outlet:int=0):
+        """Initialises the integrator with the current (initial) state of the phases.
+
+        Args:
+            fluid (object): openterrace fluid phase
+            bed (object): openterrace bed phase coupled to the fluid
+            flow_rate (float): Mass flow rate in kg/s (None reads the current flow of the fluid, for a time-varying flow)
+            cp_fluid (float): Specific heat capacity of the fluid in J/(kg K)
+            T_ref (float): Reference temperature in K (cold inlet water)
+            outlet (int): Fluid node of the outlet
+        """
+        self.fluid = fluid
+        self.bed = bed
+        self.flow_rate = flow_rate
+        self.cp_fluid = cp_fluid
+        self.T_ref = T_ref
+        self.outlet = outlet
+        self.released = 0.0
+        self.steps = 0
+
+        #masa de cada nodo: agua (n_fluid) y pcm (n_fluid x n_bed, con el n° de cápsulas de cada nodo de fluido)
+        n_particles = fluid.domain.V/fluid.phi*(1-fluid.phi)/bed.domain.V0
+        self._m_fluid = fluid.rho*fluid.domain.V
+        self._m_bed = bed.rho*bed.domain.V*n_particles[:,np.newaxis]
+        #en precisión simple h se guarda relativa a h_offset (ver single_precision.py)
+        self._h_ref_fluid = fluid.fcns.h(np.array(T_ref)) - getattr(fluid, 'h_offset', 0.0)
+        self._h_ref_bed = bed.fcns.h(np.array(T_ref)) - getattr(bed, 'h_offset', 0.0)
+        self._power = self._outlet_power()
+
+    def _outlet_power(self) -> float:
+        """Heat carried by the outlet water above the reference temperature in W."""
+        flow_rate = self.fluid.mdot_array if self.flow_rate is None else self.flow_rate
+        return abs(float(flow_rate))*self.cp_fluid*(self.fluid.T[0, self.outlet] - self.T_ref)
+
+    def update(self, ot, t:float, dt:float):
+        """Adds the energy released during the last time step.
+
+        Args:
+            ot (object): openterrace simulation
+            t (float): Time at the end of the step
+            dt (float): Time step size
+        """
+        power = self._outlet_power()
+        self.released += 0.5*(self._power + power)*dt
+        self._power = power
+        self.steps += 1
+
+    def stored(self) -> dict:
+        """Energy stored in the tank above the reference temperature, from the current enthalpy fields.
+
+        Returns:
+            dict: Latent and sensible heat in the PCM (``bed_latent``, ``bed_sensible``) and sensible heat in the fluid (``fluid_sensible``), in J
+        """
+        fcns = self.bed.fcns
+        if hasattr(fcns, '_h_s'):
+            if np.ndim(fcns._h_f):
+                #lecho graduado: calor latente de cada fila
+                latent = np.sum(self._m_bed*self._liquid_fraction_nodes()*fcns._h_f)
+            else:
+                latent = np.sum(self._m_bed*self._liquid_fraction_nodes())*fcns._h_f
+        else:
+            latent = 0.0
+        bed_total = np.sum(self._m_bed*(self.bed.h - self._h_ref_bed))
+        fluid_total = np.sum(self._m_fluid*(self.fluid.h - self._h_ref_fluid))
+        return {"bed_latent": latent, "bed_sensible": bed_total - latent, "fluid_sensible": fluid_total}
+
+    def _liquid_fraction_nodes(self) -> np.ndarray:
+        """Liquid fraction of every PCM node (from the phase state of the material if it has one)."""
+        fcns = self.bed.fcns
+        if hasattr(fcns, 'liquid_fraction'):
+            return fcns.liquid_fraction(self.bed.h)
+        return np.clip((self.bed.h - (fcns._h_s - getattr(self.bed, 'h_offset', 0.0)))/fcns._h_f, 0, 1)
+
+    def liquid_fraction(self) -> float:
+        """Mass fraction of the PCM that is liquid, from the current enthalpy field.
+
+        Returns:
+            float: Liquid fraction from 0 to 1 (0 if the substance has no melting range)
+        """
+        fcns = self.bed.fcns
+        if not hasattr(fcns, '_h_s'):
+            return 0.0
+        return np.sum(self._m_bed*self._liquid_fraction_nodes())/np.sum(self._m_bed)
+
+    def summary(self) -> dict:
+        """Released and stored energy in MJ.
+
+        Returns:
+            dict: ``released`` plus the entries of ``stored``
+        """
+        return {"released": self.released/1e6, **{key: value/1e6 for key, value in self.stored().items()}}
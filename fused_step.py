@@ -0,0 +1,196 @@
+"""
+Fused Numba time step of the water + PCM bed tank.
+
+``FusedStep`` advances the fluid and bed phases of an openterrace simulation by one time step
+in a single compiled call over the arrays of the phases (updated in place): boundary nodes,
+central difference diffusion and upwind convection, property update (water and the three
+segment ``PCMMaterial``, with the constants of each row for a ``GradedMaterial``) and
+fluid-bed coupling. The floating point operations are the same as ``Simulate.run_simulation``,
+in the same order, so the results are bit for bit equal to the Python path; only the per-step
+dispatch of a dozen NumPy and Numba calls is gone.
+
+Supported: one ``water`` fluid phase (diffusion, optional convection) coupled with a constant h
+to one bed phase of a ``PCMMaterial`` or of ``PCMMaterial`` layers (diffusion), ``fixed_value``,
+``fixed_value_timevarying`` and ``zero_gradient`` boundary conditions at the first and last node
+and no source terms. The hysteresis model and the tabulated curves are not available.
+
+The kernel also runs on the float32 state of ``single_precision.to_single_precision`` (``h`` and
+``T`` in float32, ``h`` relative to ``phase.h_offset``): the arithmetic stays in float64 and only
+the stored values are rounded.
+"""
+
+import numpy as np
+import numba
+
+import openterrace.fluid_substances.water as water
+from pcm_registry import PCMMaterial, GradedMaterial
+
+#tipos de condición de borde del kernel
+BC_FIXED = 1
+BC_ZERO_GRADIENT = 2
+
+#las funciones del agua de openterrace compiladas tal cual (mismas operaciones)
+_water_h = numba.njit(cache=True)(water.h)
+_water_T = numba.njit(cache=True)(water.T)
+_water_rho = numba.njit(cache=True)(water.rho)
+_water_cp = numba.njit(cache=True)(water.cp)
+_water_k = numba.njit(cache=True)(water.k)
+
+@numba.njit(cache=True)
+def _boundary_nodes(h, T, rho, D, F, V, bc_types, bc_nodes, bc_values, dt, fluid, offset):
+    """``_update_boundary_nodes`` of openterrace (fixed values are temperatures, converted with water.h for the fluid, minus the enthalpy offset)."""
+    rows, n = h.shape
+    for b in range(bc_types.shape[0]):
+        node = bc_nodes[b]
+        if bc_types[b] == BC_FIXED:
+            if fluid:
+                value = _water_h(bc_values[b]) - offset
+                for j in range(rows):
+                    h[j,node] = value
+        elif node == 0:
+            for j in range(rows):
+                h[j,0] = h[j,0] + (2*T[j,1]*D[1,j,0] - 2*T[j,0]*D[1,j,0] - F[0,j,1]*T[j,1] + F[1,j,0]*T[j,0]) / (rho[j,0]*V[0])*dt
+        else:
+            for j in range(rows):
+                h[j,n-1] = h[j,n-1] + (2*T[j,n-2]*D[0,j,n-1] - 2*T[j,n-1]*D[0,j,n-1] + F[1,j,n-2]*T[j,n-2] - F[0,j,n-1]*T[j,n-1]) / (rho[j,n-1]*V[n-1])*dt
+
+@numba.njit(cache=True)
+def _interior(h, T, rho, D, F, V, dt, conv):
+    """Central difference diffusion and then upwind convection of the interior nodes (``central_difference_1d``, ``upwind_1d``)."""
+    rows, n = h.shape
+    for j in range(rows):
+        for i in range(1, n-1):
+            diff = T[j,i-1]*D[0,j,i] + T[j,i+1]*D[1,j,i] - T[j,i]*(D[0,j,i]+D[1,j,i])
+            h[j,i] = h[j,i] + diff/(rho[j,i]*V[i])*dt
+    if conv:
+        for j in range(rows):
+            for i in range(1, n-1):
+                c = T[j,i+1]*(-min(F[0,j,i],0)) + T[j,i-1]*(max(F[1,j,i],0)) + T[j,i]*(min(F[0,j,i],0)-max(F[1,j,i],0))
+                h[j,i] = h[j,i] + c/(rho[j,i]*V[i])*dt
+
+@numba.njit(cache=True)
+def _fused_step(hf, Tf, rhof, cpf, kf, Df, Ff, Vf, Af, dxf, f_types, f_nodes, f_values, mdot, conv, f_offset,
+                hb, Tb, rhob, cpb, kb, Db, Fb, Vb, Ab, dxb, b_types, b_nodes, b_values, pcm, b_offset, hA, n_particles, dt):
+    """One step of the fluid, the bed and their coupling (arrays updated in place, h relative to the offset of each phase)."""
+    #fluido: bordes, difusión y convección con T, D y F del paso anterior, luego propiedades
+    _boundary_nodes(hf, Tf, rhof, Df, Ff, Vf, f_types, f_nodes, f_values, dt, True, f_offset)
+    _interior(hf, Tf, rhof, Df, Ff, Vf, dt, conv)
+    n = hf.shape[1]
+    for i in range(n):
+        h = hf[0,i] + f_offset
+        Tf[0,i] = _water_T(h)
+        rhof[0,i] = _water_rho(h)
+        cpf[0,i] = _water_cp(h)
+        kf[0,i] = _water_k(h)
+        Df[0,0,i] = kf[0,i]*Af[0,i]/dxf[i]
+        Df[1,0,i] = kf[0,i]*Af[1,i]/dxf[i]
+        if conv:
+            Ff[0,0,i] = mdot*cpf[0,i]
+            Ff[1,0,i] = mdot*cpf[0,i]
+
+    #pcm (PCMMaterial: T y k lineales por tramos, rho y cp constantes), constantes de cada fila
+    _boundary_nodes(hb, Tb, rhob, Db, Fb, Vb, b_types, b_nodes, b_values, dt, False, b_offset)
+    _interior(hb, Tb, rhob, Db, Fb, Vb, dt, False)
+    rows, m = hb.shape
+    for j in range(rows):
+        h_s, h_f, a_T, a_k, k_s, cp, rho_avg = pcm[j,0], pcm[j,1], pcm[j,2], pcm[j,3], pcm[j,4], pcm[j,5], pcm[j,6]
+        for i in range(m):
+            h = hb[j,i] + b_offset
+            x = min(max(h - h_s, 0.0), h_f)
+            Tb[j,i] = (x*a_T + h)/cp
+            rhob[j,i] = rho_avg
+            cpb[j,i] = cp
+            kb[j,i] = x*a_k + k_s
+            Db[0,j,i] = kb[j,i]*Ab[0,i]/dxb[i]
+            Db[1,j,i] = kb[j,i]*Ab[1,i]/dxb[i]
+
+    #acoplamiento con las propiedades nuevas (T no se recalcula después, como en openterrace)
+    for j in range(rows):
+        Q = hA*(Tf[0,j] - Tb[j,m-1])*dt
+        hb[j,m-1] = hb[j,m-1] + Q/(rhob[j,m-1]*Vb[m-1])
+        hf[0,j] = hf[0,j] - n_particles[j]*Q/(rhof[0,j]*Vf[j])
+
+class FusedStep:
+    """Fused compiled time step of a water phase coupled to a PCMMaterial bed."""
+
+    def __init__(self, ot):
+        """Checks the simulation and prepares the constant arrays of the kernel.
+
+        Args:
+            ot (object): openterrace simulation with its phases and coupling selected
+        """
+        problems = []
+        if len(ot.coupling) != 1 or len(ot.Phase.instances) != 2:
+            problems.append("exactly one fluid and one bed phase with one coupling")
+        else:
+            couple = ot.coupling[0]
+            self.fluid = ot.Phase.instances[couple['fluid_phase']]
+            self.bed = ot.Phase.instances[couple['bed_phase']]
+            if self.fluid.fcns is not water:
+                problems.append("water as fluid substance")
+            fcns = self.bed.fcns
+            layers = fcns.materials if type(fcns) is GradedMaterial else [fcns]
+            if any(type(material) is not PCMMaterial for material in layers):
+                problems.append("a PCMMaterial bed or graded bed of PCMMaterial layers (no hysteresis or tabulated curves)")
+            if not hasattr(self.fluid, 'diff') or not hasattr(self.bed, 'diff') or hasattr(self.bed, 'conv'):
+                problems.append("diffusion in both phases and convection only in the fluid")
+            for phase in (self.fluid, self.bed):
+                if phase.sources:
+                    problems.append("no source terms")
+                for bc in phase.bcs:
+                    if bc['position'][1] not in (0, -1) or bc['type'] not in ('fixed_value', 'fixed_value_timevarying', 'zero_gradient'):
+                        problems.append(f"boundary condition {bc['type']} at {bc['position']}")
+                    elif phase is self.bed and bc['type'] != 'zero_gradient':
+                        problems.append("zero_gradient boundary conditions in the bed")
+        if problems:
+            raise ValueError(f"The fused step needs: {', '.join(problems)}")
+
+        fluid, bed = self.fluid, self.bed
+        self.conv = hasattr(fluid, 'conv')
+        self.Af = np.ascontiguousarray(fluid.domain.A, dtype=float)
+        self.Ab = np.ascontiguousarray(bed.domain.A, dtype=float)
+        #mismas operaciones que Simulate._coupling
+        self.hA = couple['h_value']*bed.domain.A[-1][-1]
+        self.n_particles = np.ascontiguousarray(fluid.domain.V/fluid.phi*(1-fluid.phi)/bed.domain.V0, dtype=float)
+        #constantes del pcm de cada fila del lecho
+        constants = np.array([[m._h_s, m._h_f, m._a_T, m._a_k, m._k_s, m._cp, m._rho_avg] for m in layers])
+        self.pcm = np.ascontiguousarray(constants[bed.fcns.rows if type(bed.fcns) is GradedMaterial else np.zeros(bed.h.shape[0], dtype=int)])
+        self.b_types = np.array([BC_ZERO_GRADIENT for bc in bed.bcs], dtype=np.int64)
+        self.b_nodes = np.array([bc['position'][1] for bc in bed.bcs], dtype=np.int64)
+        self.b_nodes[self.b_nodes < 0] += bed.h.shape[1]
+        self.b_values = np.zeros(len(bed.bcs))
+        self.f_types = np.array([BC_ZERO_GRADIENT if bc['type'] == 'zero_gradient' else BC_FIXED for bc in fluid.bcs], dtype=np.int64)
+        self.f_nodes = np.array([bc['position'][1] for bc in fluid.bcs], dtype=np.int64)
+        self.f_nodes[self.f_nodes < 0] += fluid.h.shape[1]
+        self.f_values = np.zeros(len(fluid.bcs))
+        #entalpía guardada relativa a h_offset (solo en precisión simple, ver single_precision.py)
+        self.f_offset = float(getattr(fluid, 'h_offset', 0.0))
+        self.b_offset = float(getattr(bed, 'h_offset', 0.0))
+        #el kernel escribe en los arreglos de las fases: tienen que ser propios y contiguos (h y T pueden ser float32)
+        for phase in (fluid, bed):
+            for name in ('h', 'T', 'rho', 'cp', 'k', 'D', 'F'):
+                array = getattr(phase, name)
+                setattr(phase, name, np.array(np.broadcast_to(array, array.shape), dtype=np.float32 if array.dtype == np.float32 else float))
+
+    def step(self, t:float, dt:float):
+        """Advances the fluid, the bed and their coupling from t to t + dt.
+
+        Args:
+            t (float): Time at the start of the step in s
+            dt (float): Time step in s
+        """
+        fluid, bed = self.fluid, self.bed
+        for b, bc in enumerate(fluid.bcs):
+            if bc['type'] == 'fixed_value':
+                self.f_values[b] = bc['value']
+            elif bc['type'] == 'fixed_value_timevarying':
+                self.f_values[b] = np.interp(t, bc['value'][:,0], bc['value'][:,1])
+        mdot = 0.0
+        if self.conv:
+            #mismo flujo que _update_massflow_rate (se usa en F al final del paso)
+            mdot_array = fluid.mdot_array
+            mdot = float(mdot_array) if mdot_array.ndim == 0 else np.interp(t, mdot_array[:,0], mdot_array[:,1])
+        _fused_step(fluid.h, fluid.T, fluid.rho, fluid.cp, fluid.k, fluid.D, fluid.F, fluid.domain.V, self.Af, fluid.domain.dx,
+                    self.f_types, self.f_nodes, self.f_values, mdot, self.conv, self.f_offset,
+                    bed.h, bed.T, bed.rho, bed.cp, bed.k, bed.D, bed.F, bed.domain.V, self.Ab, bed.domain.dx,
+                    self.b_types, self.b_nodes, self.b_values, self.pcm, self.b_offset, self.hA, self.n_particles, dt)
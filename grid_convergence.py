@@ -0,0 +1,160 @@
+"""
+Grid convergence study of the discharge for ``n_fluid`` and ``n_bed``.
+
+One PCM case is run at successive refinements (both node counts, or only one of them,
+multiplied by ``ratio`` per level). From the three finest levels the observed order of
+convergence and the Richardson extrapolated released energy and outlet temperature curve are
+computed, and the error of every level is measured against them. The recommended grid is the
+coarsest level whose errors are within the tolerances.
+"""
+
+import numpy as np
+from simulate_all_pcms import DISCHARGE_PARAMS, run_discharge
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+
+def grid_levels(levels:list[int], ratio:float=2.0, axis:str='both', n_fluid:int=None, n_bed:int=None) -> list[dict]:
+    """Node counts of each refinement level, from coarse to fine.
+
+    Args:
+        levels (list): Exponents of the refinement ratio (0 is the base grid)
+        ratio (float): Refinement ratio between levels
+        axis (str): Node counts that are refined: 'both', 'fluid' or 'bed'
+        n_fluid (int): Base number of fluid nodes (``DISCHARGE_PARAMS`` if None)
+        n_bed (int): Base number of bed nodes (``DISCHARGE_PARAMS`` if None)
+
+    Returns:
+        list: ``n_fluid`` and ``n_bed`` of each level
+    """
+    if axis not in ('both', 'fluid', 'bed'):
+        raise ValueError(f"Unknown axis '{axis}'. Valid options are: ['both', 'fluid', 'bed']")
+    n_fluid = DISCHARGE_PARAMS["n_fluid"] if n_fluid is None else n_fluid
+    n_bed = DISCHARGE_PARAMS["n_bed"] if n_bed is None else n_bed
+    grids = []
+    for level in sorted(levels):
+        factor = ratio**level
+        grids.append({"n_fluid": max(3, round(n_fluid*factor)) if axis != 'bed' else n_fluid,
+                      "n_bed": max(3, round(n_bed*factor)) if axis != 'fluid' else n_bed})
+    return grids
+
+def richardson(coarse, medium, fine, ratio:float) -> tuple:
+    """Observed order and Richardson extrapolation from three levels with a constant refinement ratio.
+
+    For arrays the order comes from the maximum norm of the differences and the extrapolation is
+    done point by point.
+
+    Args:
+        coarse (float): Result of the coarsest of the three levels (scalar or array)
+        medium (float): Result of the middle level
+        fine (float): Result of the finest level
+        ratio (float): Refinement ratio between levels
+
+    Returns:
+        tuple: Observed order (NaN if the differences don't shrink) and extrapolated result (the finest result if the order is NaN)
+    """
+    coarse, medium, fine = np.asarray(coarse), np.asarray(medium), np.asarray(fine)
+    d_coarse = np.max(np.abs(medium - coarse))
+    d_fine = np.max(np.abs(fine - medium))
+    if d_fine == 0:
+        return np.inf, fine
+    if d_coarse <= d_fine:
+        #no hay convergencia monótona: no se puede extrapolar
+        return np.nan, fine
+    order = np.log(d_coarse/d_fine)/np.log(ratio)
+    return order, fine + (fine - medium)/(ratio**order - 1)
+
+def _run_level(pcm_name:str, grid:dict, params:dict) -> dict:
+    """Discharge of one refinement level (no result file)."""
+    return run_discharge(pcm_name, save=False, **params, **grid)
+
+def convergence_study(pcm_name:str, levels:list[int]=[-2, -1, 0, 1], ratio:float=2.0, axis:str='both', tol_energy:float=0.01,
+                      tol_T:float=0.5, workers:int=None, **params) -> dict:
+    """Runs the discharge of one PCM at every refinement level and recommends the coarsest grid within the tolerances.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        levels (list): Exponents of the refinement ratio (at least 3; 0 is the base grid of ``DISCHARGE_PARAMS``)
+        ratio (float): Refinement ratio between levels
+        axis (str): Node counts that are refined: 'both', 'fluid' or 'bed'
+        tol_energy (float): Tolerance of the relative error of the released energy
+        tol_T (float): Tolerance of the maximum error of the outlet temperature in K
+        workers (int): Number of worker processes (defaults to one per level, up to the number of cores)
+        **params: Overrides of the entries in ``DISCHARGE_PARAMS`` (the adaptive step is used unless ``adaptive=False``)
+
+    Returns:
+        dict: Node counts (``n_fluid``, ``n_bed``), released energy in MJ, outlet temperature deltas to the next finer level and errors against the extrapolation of each level, observed orders, extrapolated energy and index of the recommended level (``recommended``, None if no level is within the tolerances)
+    """
+    if len(levels) < 3:
+        raise ValueError("The Richardson extrapolation needs at least 3 levels")
+    #con dt fijo las mallas finas pueden pasar el límite de estabilidad del esquema explícito (el implícito no lo tiene)
+    params = {"adaptive": not params.get("implicit", False), **params}
+    grids = grid_levels(levels, ratio, axis, params.pop("n_fluid", None), params.pop("n_bed", None))
+
+    if workers is None:
+        workers = min(len(grids), os.cpu_count() or 1)
+    if workers <= 1:
+        results = [_run_level(pcm_name, grid, params) for grid in grids]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_level, [pcm_name]*len(grids), grids, [params]*len(grids)))
+
+    energy = np.array([result["energy"] for result in results])
+    #todos los niveles guardan la salida en los mismos tiempos
+    n_times = min(len(result["Tout"]) for result in results)
+    Tout = np.array([result["Tout"][:n_times] for result in results])
+
+    order_energy, energy_ext = richardson(*energy[-3:], ratio)
+    order_T, Tout_ext = richardson(*Tout[-3:], ratio)
+    #si no hay convergencia monótona el error se mide contra la malla más fina
+    error_energy = np.abs(energy - energy_ext)/abs(energy_ext)
+    error_T = np.max(np.abs(Tout - Tout_ext), axis=1)
+    delta_energy = np.append(np.abs(np.diff(energy)), np.nan)
+    delta_T = np.append(np.max(np.abs(np.diff(Tout, axis=0)), axis=1), np.nan)
+
+    within = np.nonzero((error_energy <= tol_energy) & (error_T <= tol_T))[0]
+    return {"n_fluid": np.array([grid["n_fluid"] for grid in grids]), "n_bed": np.array([grid["n_bed"] for grid in grids]),
+            "steps": np.array([result["steps"] for result in results]), "energy": energy,
+            "delta_energy": delta_energy, "delta_T": delta_T, "error_energy": error_energy, "error_T": error_T,
+            "order_energy": order_energy, "order_T": order_T, "energy_extrapolated": float(energy_ext),
+            "recommended": int(within[0]) if len(within) else None}
+
+def print_report(pcm_name:str, study:dict, tol_energy:float, tol_T:float):
+    """Prints the table of a convergence study and the recommended grid."""
+    print(f"\nConvergencia de malla: {pcm_name}")
+    print(f"{'n_fluid':>8} | {'n_bed':>6} | {'pasos':>8} | {'energía (MJ)':>12} | {'Δenergía':>9} | {'ΔT (K)':>7} | {'error E':>8} | {'error T (K)':>11}")
+    print("-" * 92)
+    for i in range(len(study["energy"])):
+        print(f"{study['n_fluid'][i]:>8} | {study['n_bed'][i]:>6} | {study['steps'][i]:>8} | {study['energy'][i]:>12.4f} | {study['delta_energy'][i]:>9.4f} | "
+              f"{study['delta_T'][i]:>7.3f} | {study['error_energy'][i]:>8.2%} | {study['error_T'][i]:>11.3f}")
+    print(f"Orden observado: energía {study['order_energy']:.2f}, temperatura de salida {study['order_T']:.2f}")
+    if np.isnan(study["order_energy"]) or np.isnan(study["order_T"]):
+        print("Sin convergencia monótona en los 3 niveles más finos: los errores se miden contra la malla más fina")
+    print(f"Energía extrapolada (Richardson): {study['energy_extrapolated']:.4f} MJ")
+    if study["recommended"] is None:
+        print(f"Ningún nivel cumple las tolerancias ({tol_energy:.1%} en energía, {tol_T} K en la salida): refinar más")
+    else:
+        i = study["recommended"]
+        print(f"Malla recomendada: n_fluid = {study['n_fluid'][i]}, n_bed = {study['n_bed'][i]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Estudio de convergencia de malla (n_fluid, n_bed) de la descarga con extrapolación de Richardson.")
+    parser.add_argument("pcm", help="PCM a simular")
+    parser.add_argument("--levels", type=int, nargs="*", default=[-2, -1, 0, 1], help="exponentes de la razón de refinamiento (0 = malla base)")
+    parser.add_argument("--ratio", type=float, default=2.0, help="razón de refinamiento entre niveles")
+    parser.add_argument("--axis", choices=["both", "fluid", "bed"], default="both", help="nodos que se refinan")
+    parser.add_argument("--tol-energy", type=float, default=0.01, help="error relativo admisible de la energía liberada")
+    parser.add_argument("--tol-T", type=float, default=0.5, help="error admisible de la temperatura de salida en K")
+    parser.add_argument("--hours", type=float, default=4, help="horas simuladas")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="n° de procesos (por defecto uno por nivel)")
+    args = parser.parse_args()
+
+    study = convergence_study(args.pcm, levels=args.levels, ratio=args.ratio, axis=args.axis, tol_energy=args.tol_energy,
+                              tol_T=args.tol_T, workers=args.workers, simulation_time=args.hours*3600)
+    print_report(args.pcm, study, args.tol_energy, args.tol_T)
+    output_filename = f"convergencia_{args.pcm}.npz"
+    np.savez(output_filename, **{key: np.nan if value is None else value for key, value in study.items()})
+    print(f"Resultados guardados en {output_filename}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Implicit (theta scheme) time step for the openterrace tank simulations.
+
+``ImplicitSolver`` advances all the phases and the fluid-bed coupling of a simulation with the
+enthalpy method in theta form,
+
+    rho*V/dt*(h - h_old) = theta*L(T(h)) + (1 - theta)*L(T(h_old)),
+
+where L is the same spatial discretization as the explicit step (central difference diffusion,
+upwind convection, the zero_gradient and fixed_value boundary nodes of openterrace and the
+constant h coupling), with rho, k and cp taken at the start of the step. ``theta=1`` is backward
+Euler (unconditionally stable, first order) and ``theta=0.5`` Crank-Nicolson (second order, may
+oscillate at the phase change front with large steps).
+
+The nonlinear ``T(h)`` of the PCM is solved with Newton iterations on the enthalpy. Every bed
+node only couples to its neighbours and its surface to one fluid node, so each Newton system is
+solved with two banded solves: the tridiagonal systems of all the spheres at once (two right hand
+sides: residual and response to the fluid node) and then the tridiagonal fluid system with the
+spheres eliminated. The time step is not limited by stability, only by accuracy (see ``main``
+for a comparison with the explicit dt = 0.1 s).
+"""
+
+import numpy as np
+from scipy.linalg import solve_banded
+from simulate_all_pcms import PCMS, run_discharge
+from simulate_all_pcms_carga import run_charge
+import argparse
+import time
+
+#paso de enthalpía (J/kg) para la pendiente dT/dh por diferencias centradas: bajo la tolerancia de
+#Newton, para que un nodo cerca de un quiebre de T(h) (inicio y fin de la fusión) no tome la pendiente media
+SLOPE_STEP = 1e-3
+
+def _shift(x:np.ndarray, offset:int) -> np.ndarray:
+    """Value of the neighbour ``j + offset`` of every node along the last axis (0 past the ends)."""
+    out = np.zeros_like(x)
+    if offset > 0:
+        out[...,:-offset] = x[...,offset:]
+    else:
+        out[...,-offset:] = x[...,:offset]
+    return out
+
+def _tridiagonal(lower:np.ndarray, diag:np.ndarray, upper:np.ndarray, rhs:np.ndarray) -> np.ndarray:
+    """Solves the independent tridiagonal systems of the rows of (r, n) coefficient arrays.
+
+    Args:
+        lower (ndarray): Coefficient of node j-1 in equation j
+        diag (ndarray): Coefficient of node j in equation j
+        upper (ndarray): Coefficient of node j+1 in equation j
+        rhs (ndarray): Right hand side with shape (r, n) or (r, n, m) for m right hand sides
+
+    Returns:
+        ndarray: Solution with the shape of ``rhs``
+    """
+    r, n = diag.shape
+    ab = np.zeros((3, r*n))
+    #las filas se encadenan en un solo sistema en banda: los acoples entre filas son 0
+    ab[0,1:] = upper.ravel()[:-1]
+    ab[1] = diag.ravel()
+    ab[2,:-1] = lower.ravel()[1:]
+    ab[0,n::n] = 0.0
+    ab[2,n-1:-1:n] = 0.0
+    b = rhs.reshape((r*n,) + rhs.shape[2:])
+    return solve_banded((1, 1), ab, b, check_finite=False).reshape(rhs.shape)
+
+class ImplicitSolver:
+    """Implicit time step of all the phases of an openterrace simulation."""
+
+    def __init__(self, ot, theta:float=1.0, tol:float=1e-2, max_iter:int=30):
+        """Checks that the simulation can be solved implicitly.
+
+        Args:
+            ot (object): openterrace simulation with its phases and coupling selected
+            theta (float): Implicitness, 1 for backward Euler and 0.5 for Crank-Nicolson
+            tol (float): Largest enthalpy change in J/kg of the last Newton iteration
+            max_iter (int): Largest number of Newton iterations per step
+        """
+        if not 0.5 <= theta <= 1.0:
+            raise ValueError(f"theta must be between 0.5 and 1, got {theta}")
+        self.ot = ot
+        self.theta = theta
+        self.tol = tol
+        self.max_iter = max_iter
+        phases = ot.Phase.instances
+        for phase in phases:
+            if phase.sources:
+                raise ValueError("Source terms are not available in the implicit solver")
+            if phase.h.ndim != 2:
+                raise ValueError("The implicit solver only supports 1D domains")
+            for bc in phase.bcs:
+                if bc['position'][1] not in (0, -1):
+                    raise ValueError(f"Boundary condition at {bc['position']}: only the first (0) and last (-1) node are supported")
+        #acoplamientos: fluido, pcm, h*A de una cápsula y n° de cápsulas por nodo de fluido
+        self.couplings = []
+        for couple in ot.coupling:
+            fluid = phases[couple['fluid_phase']]
+            bed = phases[couple['bed_phase']]
+            if bed.h.shape[0] != fluid.h.shape[1]:
+                raise ValueError("Every fluid node needs one row of bed nodes")
+            n_particles = fluid.domain.V/fluid.phi*(1 - fluid.phi)/bed.domain.V0
+            self.couplings.append((couple['fluid_phase'], couple['bed_phase'], couple['h_value']*bed.domain.A[-1][-1], n_particles))
+        beds = [bed for _, bed, _, _ in self.couplings]
+        if len(set(beds)) != len(beds):
+            raise ValueError("A bed phase can only be coupled to one fluid phase")
+        self.steps = 0
+        self.iterations = 0
+        self.max_iterations = 0
+        self.unconverged = 0
+
+    def _operator(self, phase, t:float, dt:float) -> tuple:
+        """Coefficients of L (linear in T) of one phase without coupling, and its fixed_value nodes.
+
+        Returns:
+            tuple: Coefficients of T[j-1], T[j] and T[j+1] in the equation of node j, and dict of fixed enthalpy by node (0 or -1)
+        """
+        shape = phase.h.shape
+        lower = np.zeros(shape)
+        diag = np.zeros(shape)
+        upper = np.zeros(shape)
+        Dw = De = F = np.zeros(shape)
+        if hasattr(phase, 'diff'):
+            Dw = np.broadcast_to(phase.k*phase.domain.A[0]/phase.domain.dx, shape)
+            De = np.broadcast_to(phase.k*phase.domain.A[1]/phase.domain.dx, shape)
+            lower[:,1:-1] += Dw[:,1:-1]
+            upper[:,1:-1] += De[:,1:-1]
+            diag[:,1:-1] -= Dw[:,1:-1] + De[:,1:-1]
+        if hasattr(phase, 'conv'):
+            F = np.broadcast_to(phase.mdot*phase.cp, shape)
+            F0 = np.minimum(F, 0)
+            F1 = np.maximum(F, 0)
+            lower[:,1:-1] += F1[:,1:-1]
+            upper[:,1:-1] -= F0[:,1:-1]
+            diag[:,1:-1] += F0[:,1:-1] - F1[:,1:-1]
+        fixed = {}
+        for bc in phase.bcs:
+            node = bc['position'][1]
+            if bc['type'] == 'fixed_value':
+                fixed[node] = phase.fcns.h(bc['value'])
+            elif bc['type'] == 'fixed_value_timevarying':
+                #el valor del final del paso
+                fixed[node] = phase.fcns.h(np.interp(t + dt, bc['value'][:,0], bc['value'][:,1]))
+            elif bc['type'] == 'zero_gradient':
+                #mismos flujos que _update_boundary_nodes de openterrace
+                if node == 0:
+                    upper[:,0] += 2*De[:,0] - F[:,1]
+                    diag[:,0] += -2*De[:,0] + F[:,0]
+                else:
+                    lower[:,-1] += 2*Dw[:,-1] + F[:,-2]
+                    diag[:,-1] += -2*Dw[:,-1] - F[:,-1]
+        return lower, diag, upper, fixed
+
+    def _apply(self, ops:list, T:list) -> list:
+        """L(T) of every phase, including the coupling."""
+        out = [diag*x + lower*_shift(x, -1) + upper*_shift(x, 1) for (lower, diag, upper, _), x in zip(ops, T)]
+        for f, b, hA, n_particles in self.couplings:
+            Q = hA*(T[f][0] - T[b][:,-1])
+            out[b][:,-1] += Q
+            out[f][0] -= n_particles*Q
+        return out
+
+    def _temperature(self, phase, h:np.ndarray, state) -> np.ndarray:
+        """T(h) of a phase without changing the state of the hysteresis model (restored to the start of the step)."""
+        if state is not None:
+            phase.fcns.state = state.copy()
+        return phase.fcns.T(h)
+
+    def step(self, t:float, dt:float):
+        """Advances all phases and couplings from t to t + dt.
+
+        Args:
+            t (float): Time at the start of the step in s
+            dt (float): Time step in s
+        """
+        phases = self.ot.Phase.instances
+        theta = self.theta
+        for phase in phases:
+            if hasattr(phase, 'conv'):
+                phase._update_massflow_rate(t)
+        ops = [self._operator(phase, t, dt) for phase in phases]
+        #el estado de histéresis del inicio del paso (las iteraciones no deben cambiarlo)
+        states = []
+        for phase in phases:
+            if hasattr(phase.fcns, 'state') and phase.fcns.state is None:
+                phase.fcns.T(phase.h)
+            state = getattr(phase.fcns, 'state', None)
+            states.append(None if state is None else state.copy())
+        h_old = [phase.h.copy() for phase in phases]
+        M = [phase.rho*phase.domain.V/dt for phase in phases]
+        explicit = [(1 - theta)*x for x in self._apply(ops, [phase.T for phase in phases])] if theta < 1 else [0.0]*len(phases)
+        coupled = {b: (f, hA, n_particles) for f, b, hA, n_particles in self.couplings}
+        fluids = {f for f, _, _, _ in self.couplings}
+
+        h = [x.copy() for x in h_old]
+        for fixed_h, (_, _, _, fixed) in zip(h, ops):
+            for node, value in fixed.items():
+                fixed_h[:,node] = value
+        for iteration in range(1, self.max_iter + 1):
+            T = []
+            slope = []
+            for phase, x, state in zip(phases, h, states):
+                T.append(self._temperature(phase, x, state))
+                slope.append((self._temperature(phase, x + SLOPE_STEP, state) - self._temperature(phase, x - SLOPE_STEP, state))/(2*SLOPE_STEP))
+            LT = self._apply(ops, T)
+            residual = [m*(x - x0) - theta*lt - e for m, x, x0, lt, e in zip(M, h, h_old, LT, explicit)]
+
+            #jacobiano de cada fase (tridiagonal)
+            jacobian = [[-theta*lower*_shift(s, -1), m - theta*diag*s, -theta*upper*_shift(s, 1)]
+                        for (lower, diag, upper, _), m, s in zip(ops, M, slope)]
+            for b, (f, hA, n_particles) in coupled.items():
+                jacobian[b][1][:,-1] += theta*hA*slope[b][:,-1]
+                jacobian[f][1][0] += theta*n_particles*hA*slope[f][0]
+            #las filas fixed_value quedan como identidad
+            for J, (_, _, _, fixed), r, x in zip(jacobian, ops, residual, h):
+                for node, value in fixed.items():
+                    J[0][:,node] = 0.0
+                    J[1][:,node] = 1.0
+                    J[2][:,node] = 0.0
+                    r[:,node] = x[:,node] - value
+
+            delta = [None]*len(phases)
+            #1) esferas: respuesta al residuo y a un cambio de la enthalpía del nodo de fluido
+            responses = {}
+            for b, (f, hA, n_particles) in coupled.items():
+                rhs = np.zeros(h[b].shape + (2,))
+                rhs[...,0] = -residual[b]
+                rhs[:,-1,1] = theta*hA*slope[f][0]
+                if -1 in ops[b][3]:
+                    rhs[:,-1,1] = 0.0
+                responses[b] = _tridiagonal(*jacobian[b], rhs)
+            #2) fluido con las esferas eliminadas (complemento de Schur)
+            for i, phase in enumerate(phases):
+                if i in coupled:
+                    continue
+                diag = jacobian[i][1].copy()
+                rhs = -residual[i]
+                if i in fluids:
+                    free = np.ones(h[i].shape[1], dtype=bool)
+                    for node in ops[i][3]:
+                        free[node] = False
+                    for b, (f, hA, n_particles) in coupled.items():
+                        if f != i:
+                            continue
+                        g = np.where(free, -theta*n_particles*hA*slope[b][:,-1], 0.0)
+                        diag[0] += g*responses[b][:,-1,1]
+                        rhs = rhs.copy()
+                        rhs[0] -= g*responses[b][:,-1,0]
+                delta[i] = _tridiagonal(jacobian[i][0], diag, jacobian[i][2], rhs)
+            #3) esferas con el cambio del fluido
+            for b, (f, hA, n_particles) in coupled.items():
+                delta[b] = responses[b][...,0] + responses[b][...,1]*delta[f][0][:,np.newaxis]
+
+            change = 0.0
+            for x, d in zip(h, delta):
+                x += d
+                change = max(change, np.max(np.abs(d)))
+            if change <= self.tol:
+                break
+        else:
+            self.unconverged += 1
+
+        self.steps += 1
+        self.iterations += iteration
+        self.max_iterations = max(self.max_iterations, iteration)
+        for phase, x, state in zip(phases, h, states):
+            if state is not None:
+                phase.fcns.state = state
+            phase.h = x
+            phase._update_properties()
+
+    def stats(self) -> dict:
+        """Newton iterations of the steps taken so far (mean and maximum) and steps that didn't converge."""
+        return {"newton_mean": self.iterations/self.steps if self.steps else 0.0, "newton_max": self.max_iterations, "unconverged": self.unconverged}
+
+def compare(pcm_name:str, dts:list[float]=[1, 5, 10, 30], theta:float=1.0, **params) -> dict:
+    """Runs the discharge and the charge of one PCM explicitly with the reference dt and implicitly with larger steps.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        dts (list): Time steps of the implicit runs in s (the output interval must be a multiple of each)
+        theta (float): Implicitness of the implicit runs
+        **params: Overrides of the simulation parameters (``dt`` is the step of the explicit reference)
+
+    Returns:
+        dict: For each mode, steps and wall time of the reference, and steps, speedup and errors of every implicit dt against it
+    """
+    out = {}
+    for mode, fcn, key in [("descarga", run_discharge, "Tout"), ("carga", run_charge, "T_fondo_C")]:
+        t0 = time.perf_counter()
+        ref = fcn(pcm_name, save=False, **params)
+        t_ref = time.perf_counter() - t0
+        rows = []
+        for dt in dts:
+            t0 = time.perf_counter()
+            imp = fcn(pcm_name, save=False, **{**params, "dt": dt, "implicit": True, "theta": theta})
+            t_imp = time.perf_counter() - t0
+            row = {"dt": dt, "steps": imp["steps"], "speedup": t_ref/t_imp, "err_T": np.max(np.abs(imp[key] - ref[key])),
+                   "err_latent": abs(imp["energy_latent"] - ref["energy_latent"])}
+            if mode == "descarga":
+                row["err_energy"] = abs(imp["energy"] - ref["energy"])/abs(ref["energy"])
+            rows.append(row)
+        out[mode] = {"steps_ref": ref["steps"], "time_ref": t_ref, "runs": rows}
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Error y aceleración del paso implícito frente al paso explícito de dt = 0.1 s.")
+    parser.add_argument("pcms", nargs="*", default=PCMS, help="PCMs a comparar (por defecto los 5 del benchmark)")
+    parser.add_argument("--dt", type=float, nargs="*", default=[1, 5, 10, 30], help="pasos de tiempo implícitos en s")
+    parser.add_argument("--theta", type=float, default=1.0, help="1 = Euler implícito, 0.5 = Crank-Nicolson")
+    parser.add_argument("--hours", type=float, default=4, help="tiempo simulado en horas")
+    args = parser.parse_args()
+
+    results = {pcm: compare(pcm, args.dt, args.theta, simulation_time=args.hours*3600) for pcm in args.pcms}
+
+    print(f"\nPaso implícito (theta = {args.theta}) vs explícito dt = 0.1 s:")
+    print("=" * 112)
+    print(f"{'PCM':<31} | {'modo':<8} | {'dt (s)':>6} | {'pasos':>7} | {'x':>6} | {'max |dT| (°C)':>13} | {'|dE|/E':>8} | {'|dE latente| (MJ)':>17}")
+    print("-" * 112)
+    for pcm_name, modes in results.items():
+        for mode, r in modes.items():
+            for run in r["runs"]:
+                err_energy = f"{run['err_energy']:>8.2%}" if "err_energy" in run else f"{'-':>8}"
+                print(f"{pcm_name:<31} | {mode:<8} | {run['dt']:>6g} | {run['steps']:>7} | {run['speedup']:>6.1f} | {run['err_T']:>13.3f} | {err_energy} | {run['err_latent']:>17.2e}")
+
+if __name__ == "__main__":
+    main()
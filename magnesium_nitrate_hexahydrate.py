@@ -16,90 +16,25 @@ OpenTerrace model (following ATS58.py como template):
 - single average density is used: (1636+1550)/2 = 1593 kg/m^3.
 """
 
-import numpy as np
-
-_T_s = 88.0 + 273.15  #Solidification temperature (C a K)
-_T_l = 90.0 + 273.15  #Liquid temperature (C a K)
-_k_s = 0.611           #Solid thermal conductivity (W/mK)
-_k_l = 0.490           #Liquid thermal conductivity (W/mK)
-_h_f = 162800          #Latent heat of phase shift (J/kg)
-_cp = 2165             #Specific heat capacity (J/kg*K) 
-_rho_avg = 1593        #density (kg/m^3)
+from pcm_registry import get_material
+
+# The constants are the row of pcm_materials.csv, the breakpoints are precomputed by the registry
+_material = get_material("magnesium_nitrate_hexahydrate")
+
+_T_s = _material._T_s          # Solidification temperature (K)
+_T_l = _material._T_l          # Liquid temperature (K)
+_k_s = _material._k_s          # Solid thermal conductivity (W/mK)
+_k_l = _material._k_l          # Liquid thermal conductivity (W/mK)
+_h_f = _material._h_f          # Latent heat of phase shift (J/kg)
+_cp = _material._cp            # Specific heat capacity (J/kg*K)
+_rho_avg = _material._rho_avg  # Average density (kg/m^3)
 _rho_l = _rho_avg
 _rho_s = _rho_avg
-
-# Calculated enthalpy points
-_h_s = _T_s * _cp      # Mass specific enthalpy at point of solidification
-_h_l = _h_s + _h_f     # Mass specific enthalpy after phase shift
-
-def h(T:float) -> float:
-    """Mass specific enthalpy as function of temperature at 1 atm (fit assumes piecewise constant cp with phase change).
-
-    Args:
-        T (float): Temperature in K
-
-    Returns:
-        Specific enthalpy in J/kg
-    """
-    return np.piecewise(T, [T <= _T_s, (T > _T_s) & (T <= _T_l), T > _T_l], 
-                        [lambda T: _cp*T, 
-                         lambda T: _h_s + (T-_T_s)/(_T_l-_T_s)*_h_f, 
-                         lambda T: _h_l + _cp*(T-_T_l)])
-
-def T(h:float, p:float=None) -> float:
-    """Temperature as function of mass specific enthalpy at 1 atm (fit assumes piecewise constant cp with phase change).
-
-    Args:
-        h (float): Specific enthalpy in J/kg
-        p (float): Pressure in Pa
-
-    Returns:
-        Temperature in kelvin
-    """
-    return np.piecewise(h, [h <= _h_s, (h > _h_s) & (h <= _h_l), h > _h_l], 
-                        [lambda h: 1/_cp*h, 
-                         lambda h: _T_s + (_T_l-_T_s)*(h-_h_s)/(_h_l-_h_s), 
-                         lambda h: _T_l + 1/_cp*(h-_h_l)])
-
-
-def rho(h:float, p:float=None) -> float:
-    """Density as function of mass specific enthalpy at 1 atm (fit assumes constant density).
-
-    Args:
-        h (float): Specific enthalpy in J/kg
-        p (float): Pressure in Pa
-
-    Returns:
-        float: Density in kg/m^3
-    """
-    # Template uses a single constant density
-    return _rho_avg * h**0
-
-def k(h:float, p:float=None) -> float:
-    """Thermal conductivity as function of mass specific enthalpy at 1 atm (fit assumes piecewise constant k).
-
-    Args:
-        h (float): Specific enthalpy in J/kg
-        p (float): Pressure in Pa
-
-    Returns:
-        float: Thermal conductivity in W/(m K)
-    """
-    # Linearly interpolates conductivity across the mushy zone
-    return np.piecewise(h, [h <= _h_s, (h > _h_s) & (h <= _h_l), h > _h_l], 
-                        [_k_s, 
-                         lambda h: _k_s + (_k_l-_k_s)/(_h_l-_h_s)*(h-_h_s), 
-                         _k_l])
-
-def cp(h:float, p:float=None) -> float:
-    """Specific heat capacity as function of mass specific enthalpy at 1 atm (fit assumes constant cp).
-
-    Args:
-        h (float): Specific enthalpy in J/kg
-        p (float): Pressure in Pa
-
-    Returns:
-        float: Specific heat capacity in J/(kg K)
-    """
-    # Template uses a single constant cp
-    return _cp * h**0
\ No newline at end of file
+_h_s = _material._h_s          # Mass specific enthalpy at point of solidification
+_h_l = _material._h_l          # Mass specific enthalpy after phase shift
+
+h = _material.h
+T = _material.T
+rho = _material.rho
+k = _material.k
+cp = _material.cp
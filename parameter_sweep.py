@@ -0,0 +1,273 @@
+"""
+Parameter sweeps over the tank geometry and operating conditions.
+
+The cases (one PCM plus overrides of ``DISCHARGE_PARAMS`` / ``CHARGE_PARAMS`` and of the PCM
+constants in ``pcm_registry.MATERIAL_COLUMNS``) are built with
+``full_factorial`` or ``latin_hypercube`` and run by ``run_sweep`` in a process pool. Every
+finished case is appended to a checkpoint file (one JSON line per case), so an interrupted sweep
+skips the cases that are already done when it is started again. The metrics of all cases are
+collected into one columnar table: Parquet or Feather if pyarrow is installed, otherwise a
+single .npz with one array per column. The outlet temperature curve of every discharge is only
+kept in the checkpoint (``Tout_curve``), e.g. to train ``surrogate.py``.
+"""
+
+import numpy as np
+from simulate_all_pcms import PCMS, DISCHARGE_PARAMS, run_discharge
+from simulate_all_pcms_carga import CHARGE_PARAMS, run_charge
+from pcm_registry import MATERIAL_COLUMNS, material_constants, register_variant, get_material
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import importlib.util
+import itertools
+import hashlib
+import argparse
+import json
+import time
+import os
+
+#parámetros por defecto de cada modo
+DEFAULTS = {"descarga": DISCHARGE_PARAMS, "carga": CHARGE_PARAMS}
+
+#parámetros que son números de nodos (el muestreo lhs los redondea)
+INTEGER_PARAMS = ["n_fluid", "n_bed"]
+
+def full_factorial(grid:dict, pcms:list[str]=PCMS) -> list[dict]:
+    """Builds every combination of the given parameter values, for every PCM.
+
+    Args:
+        grid (dict): List of values of each parameter, e.g. ``{"D": [0.3, 0.4], "flow_rate": [-0.01, -0.02]}``
+        pcms (list): Names of the bed substances
+
+    Returns:
+        list: Cases, each a dict with the PCM name (``pcm``) and the parameter values
+    """
+    names = list(grid)
+    cases = []
+    for pcm in pcms:
+        for values in itertools.product(*(grid[name] for name in names)):
+            cases.append({"pcm": pcm, **dict(zip(names, values))})
+    return cases
+
+def latin_hypercube(ranges:dict, n:int, pcms:list[str]=PCMS, seed:int=0) -> list[dict]:
+    """Samples ``n`` parameter sets with a Latin hypercube (one sample in each of the ``n`` strata of every parameter), for every PCM.
+
+    Args:
+        ranges (dict): Minimum and maximum of each parameter, e.g. ``{"D": (0.2, 0.5)}``
+        n (int): Number of samples
+        pcms (list): Names of the bed substances (all of them use the same samples)
+        seed (int): Seed of the random generator
+
+    Returns:
+        list: Cases, each a dict with the PCM name (``pcm``) and the parameter values
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name, (low, high) in ranges.items():
+        u = (rng.permutation(n) + rng.random(n))/n
+        values = low + u*(high - low)
+        if name in INTEGER_PARAMS:
+            samples[name] = [int(round(value)) for value in values]
+        else:
+            samples[name] = [float(value) for value in values]
+    return [{"pcm": pcm, **{name: samples[name][i] for name in ranges}} for pcm in pcms for i in range(n)]
+
+def case_id(case:dict, mode:str='descarga') -> str:
+    """Returns a short identifier of a case (the same for the same PCM, mode and parameter values).
+
+    Args:
+        case (dict): PCM name and parameter values
+        mode (str): 'descarga' or 'carga'
+
+    Returns:
+        str: Hexadecimal identifier
+    """
+    key = json.dumps({"mode": mode, **case}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def run_case(case:dict, mode:str='descarga', T_useful:float=45.0) -> dict:
+    """Runs one case and returns its metrics (no result file is written).
+
+    Args:
+        case (dict): PCM name and parameter values
+        mode (str): 'descarga' or 'carga'
+        T_useful (float): Useful outlet temperature in C for the discharge metrics
+
+    Returns:
+        dict: Case id, PCM, its constants, all simulation parameters and the metrics of the run
+    """
+    params = {key: value for key, value in case.items() if key != "pcm" and key not in MATERIAL_COLUMNS}
+    unknown = set(params) - set(DEFAULTS[mode])
+    if unknown:
+        raise ValueError(f"Unknown parameters for '{mode}': {sorted(unknown)}")
+    #las constantes del pcm que cambian en el barrido definen una variante del material
+    constants = {key: value for key, value in case.items() if key in MATERIAL_COLUMNS}
+    material = register_variant(case["pcm"], **constants) if constants else get_material(case["pcm"])
+
+    t0 = time.perf_counter()
+    if mode == "descarga":
+        results = run_discharge(material.name, save=False, **params)
+        Tout = results["Tout"]
+        times = results["times"]
+        below = np.nonzero(Tout < T_useful)[0]
+        metrics = {"energy": results["energy"],
+                   "energy_latent": results["energy_latent"],
+                   "energy_sensible": results["energy_sensible"],
+                   "Tout_final": Tout[-1],
+                   "Tout_min": np.min(Tout),
+                   "Tout_mean": np.mean(Tout),
+                   #horas hasta que la salida baja de T_useful (tiempo de término si no baja)
+                   "t_useful": times[below[0]] if len(below) else results["t_stop"],
+                   "t_stop": results["t_stop"]}
+    else:
+        results = run_charge(material.name, save=False, **params)
+        metrics = {"energy_latent": results["energy_latent"],
+                   "energy_sensible": results["energy_sensible"],
+                   "T_fondo_final": results["T_fondo_C"][-1],
+                   "T_medio_final": results["T_medio_C"][-1],
+                   "T_cima_final": results["T_cima_C"][-1]}
+    metrics["steps"] = results["steps"]
+    metrics["wall_time"] = time.perf_counter() - t0
+
+    row = {"case_id": case_id(case, mode), "pcm": case["pcm"], **material_constants(material)}
+    for key, value in {**DEFAULTS[mode], **params}.items():
+        #solo los parámetros numéricos van a la tabla
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            row[key] = value
+    for key, value in metrics.items():
+        row[key] = float(value) if key != "steps" else int(value)
+    if mode == "descarga":
+        row["Tout_curve"] = [float(T) for T in results["Tout"]]
+    return row
+
+def load_checkpoint(path:str) -> list[dict]:
+    """Reads the rows of the cases already finished (an incomplete last line is ignored).
+
+    Args:
+        path (str): Path of the checkpoint file
+
+    Returns:
+        list: Rows written by ``run_sweep``
+    """
+    rows = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    return rows
+
+def write_table(rows:list[dict], path:str):
+    """Writes the rows as a columnar table. The format is given by the extension: .parquet or .feather (pyarrow) or .npz.
+
+    Args:
+        rows (list): Rows of the cases (missing values are written as NaN, curves are left out)
+        path (str): Path of the table
+    """
+    keys = list(dict.fromkeys(key for row in rows for key, value in row.items() if not isinstance(value, list)))
+    columns = {key: np.array([row.get(key, np.nan) for row in rows]) for key in keys}
+    if path.endswith(".npz"):
+        np.savez(path, **columns)
+        return
+    import pyarrow as pa
+    table = pa.table(columns)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    elif path.endswith(".feather"):
+        import pyarrow.feather as feather
+        feather.write_feather(table, path)
+    else:
+        raise ValueError(f"Unknown table format: {path}. Use .parquet, .feather or .npz")
+
+def read_table(path:str) -> dict:
+    """Reads a table written by ``write_table``.
+
+    Args:
+        path (str): Path of the table
+
+    Returns:
+        dict: One array per column
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {key: data[key] for key in data}
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    table = pq.read_table(path) if path.endswith(".parquet") else feather.read_table(path)
+    return {name: table[name].to_numpy() for name in table.column_names}
+
+def default_table_path(name:str) -> str:
+    """Returns ``<name>.parquet`` if pyarrow is installed, ``<name>.npz`` otherwise."""
+    if importlib.util.find_spec("pyarrow") is not None:
+        return name + ".parquet"
+    return name + ".npz"
+
+def run_sweep(cases:list[dict], name:str='sweep', mode:str='descarga', workers:int=None, T_useful:float=45.0, table:str=None) -> dict:
+    """Runs the cases that are not in the checkpoint ``<name>.jsonl`` yet and writes the table of all of them.
+
+    Args:
+        cases (list): Cases from ``full_factorial`` or ``latin_hypercube``
+        name (str): Base name of the checkpoint and table files
+        mode (str): 'descarga' or 'carga'
+        workers (int): Number of worker processes (defaults to the number of cores)
+        T_useful (float): Useful outlet temperature in C for the discharge metrics
+        table (str): Path of the table (``default_table_path(name)`` if None)
+
+    Returns:
+        dict: The table, one array per column
+    """
+    checkpoint = name + ".jsonl"
+    table = default_table_path(name) if table is None else table
+    done = {row["case_id"] for row in load_checkpoint(checkpoint)}
+    pending = [case for case in cases if case_id(case, mode) not in done]
+    print(f"Barrido '{name}': {len(cases)} casos, {len(cases) - len(pending)} ya terminados, {len(pending)} por correr")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with open(checkpoint, 'a') as f:
+        if workers <= 1:
+            for case in pending:
+                f.write(json.dumps(run_case(case, mode, T_useful)) + "\n")
+                f.flush()
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(run_case, case, mode, T_useful) for case in pending]
+                #cada caso se escribe apenas termina, así un barrido interrumpido no lo repite
+                for future in as_completed(futures):
+                    f.write(json.dumps(future.result()) + "\n")
+                    f.flush()
+
+    ids = {case_id(case, mode) for case in cases}
+    rows = [row for row in load_checkpoint(checkpoint) if row["case_id"] in ids]
+    write_table(rows, table)
+    print(f"Tabla del barrido guardada en {table}")
+    return read_table(table)
+
+def _parse_values(text:str) -> tuple[str, list[float]]:
+    """Parses ``NAME=v1,v2,...`` from the command line."""
+    name, values = text.split("=")
+    return name, [int(value) if name in INTEGER_PARAMS else float(value) for value in values.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Barrido de parámetros del estanque (factorial completo o hipercubo latino).")
+    parser.add_argument("--pcms", nargs="*", default=PCMS, help="PCMs a simular (por defecto los 5 del benchmark)")
+    parser.add_argument("--grid", nargs="*", default=[], metavar="NOMBRE=v1,v2", help="valores de cada parámetro (factorial completo)")
+    parser.add_argument("--lhs", type=int, default=None, metavar="N", help="n° de muestras del hipercubo latino")
+    parser.add_argument("--range", nargs="*", default=[], metavar="NOMBRE=min,max", help="rango de cada parámetro para --lhs")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del hipercubo latino")
+    parser.add_argument("--carga", action="store_true", help="barrido de la carga estática en vez de la descarga")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="n° de procesos (por defecto uno por núcleo)")
+    parser.add_argument("-o", "--name", default="sweep", help="nombre base de los archivos del barrido")
+    args = parser.parse_args()
+
+    if args.lhs is not None:
+        ranges = dict(_parse_values(text) for text in args.range)
+        cases = latin_hypercube(ranges, args.lhs, pcms=args.pcms, seed=args.seed)
+    else:
+        grid = dict(_parse_values(text) for text in args.grid)
+        cases = full_factorial(grid, pcms=args.pcms)
+    run_sweep(cases, name=args.name, mode="carga" if args.carga else "descarga", workers=args.workers)
+
+if __name__ == "__main__":
+    main()
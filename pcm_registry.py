@@ -0,0 +1,887 @@
+"""
+Registry of the PCMs used as bed substances.
+
+The constants of every material are rows of pcm_materials.csv (temperatures in C, k in W/mK,
+h_f in J/kg, cp in J/kg*K, rho_avg in kg/m^3). Each row becomes a PCMMaterial with the
+h/T/rho/k/cp interface of an openterrace bed substance (piecewise constant cp with a linear
+phase change between T_s and T_l, as in ATS58.py), so a new salt only needs a new row.
+
+Materials with a measured (e.g. DSC) enthalpy curve are rows of pcm_curves.csv instead. Each row
+points to a CSV with the h-T table (columns T_C, h in J/kg, k, rho) and becomes a
+TabulatedMaterial with the same interface, whose properties are linear interpolations of the
+table found through a uniform grid (O(1) per node).
+
+HysteresisMaterial wraps a PCMMaterial for one bed phase and keeps the phase state of every
+node in a uint8 array, so melting and solidification follow separate curves and the liquid
+supercools before it nucleates.
+
+GradedMaterial is the substance of an axially graded (cascaded) bed: every row of the bed field
+(the capsules of one fluid node) has its own material, and each property is evaluated once per
+material on its rows.
+"""
+
+import numpy as np
+import csv
+import os
+
+MATERIALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pcm_materials.csv")
+CURVES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pcm_curves.csv")
+
+def _buffer(x, out):
+    """Returns the array to write the result into (must not share memory with x)."""
+    return np.empty(np.shape(x)) if out is None else out
+
+class PCMMaterial:
+    """PCM with piecewise constant cp and linear phase change, with every breakpoint precomputed."""
+
+    def __init__(self, name:str, T_s:float, T_l:float, k_s:float, k_l:float, h_f:float, cp:float, rho_avg:float, formula:str="", source:str=""):
+        """Initialises the material constants.
+
+        Args:
+            name (str): Substance name
+            T_s (float): Solidification temperature in K
+            T_l (float): Liquid temperature in K
+            k_s (float): Solid thermal conductivity in W/(m K)
+            k_l (float): Liquid thermal conductivity in W/(m K)
+            h_f (float): Latent heat of phase shift in J/kg
+            cp (float): Specific heat capacity in J/(kg K)
+            rho_avg (float): Average density in kg/m^3
+            formula (str): Chemical formula
+            source (str): Reference of the data
+        """
+        self.name = name
+        self.formula = formula
+        self.source = source
+        self._T_s = T_s
+        self._T_l = T_l
+        self._k_s = k_s
+        self._k_l = k_l
+        self._h_f = h_f
+        self._cp = cp
+        self._rho_avg = rho_avg
+        self._rho_l = rho_avg
+        self._rho_s = rho_avg
+
+        #Calculated enthalpy points
+        self._h_s = T_s * cp          # Mass specific enthalpy at point of solidification
+        self._h_l = self._h_s + h_f   # Mass specific enthalpy after phase shift
+
+        # Slopes of the branch-free (clipped) form of the piecewise-linear model
+        self._a_h = h_f/((T_l-T_s)*cp) - 1
+        self._a_T = (T_l-T_s)*cp/h_f - 1
+        self._a_k = (k_l-k_s)/h_f
+
+    def __repr__(self):
+        return f"PCMMaterial({self.name!r})"
+
+    def h(self, T:float, out=None) -> float:
+        """Mass specific enthalpy as function of temperature at 1 atm (fit assumes piecewise constant cp with phase change).
+
+        Args:
+            T (float): Temperature in K
+            out (ndarray): Optional array with the shape of T to store the result in
+
+        Returns:
+            Specific enthalpy in J/kg
+        """
+        out = _buffer(T, out)
+        np.subtract(T, self._T_s, out=out)
+        np.maximum(out, 0, out=out)
+        np.minimum(out, self._T_l-self._T_s, out=out)
+        out *= self._a_h
+        out += T
+        out *= self._cp
+        return out
+
+    def T(self, h:float, p:float=None, out=None) -> float:
+        """Temperature as function of mass specific enthalpy at 1 atm (fit assumes piecewise constant cp with phase change).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            Temperature in kelvin
+        """
+        out = _buffer(h, out)
+        np.subtract(h, self._h_s, out=out)
+        np.maximum(out, 0, out=out)
+        np.minimum(out, self._h_f, out=out)
+        out *= self._a_T
+        out += h
+        out /= self._cp
+        return out
+
+    def rho(self, h:float, p:float=None) -> float:
+        """Density as function of mass specific enthalpy at 1 atm (fit assumes constant density).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Density in kg/m^3
+        """
+        return self._rho_avg * h**0
+
+    def k(self, h:float, p:float=None, out=None) -> float:
+        """Thermal conductivity as function of mass specific enthalpy at 1 atm (fit assumes piecewise constant k).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            float: Thermal conductivity in W/(m K)
+        """
+        #Linearly interpolates conductivity across the mushy zone
+        out = _buffer(h, out)
+        np.subtract(h, self._h_s, out=out)
+        np.maximum(out, 0, out=out)
+        np.minimum(out, self._h_f, out=out)
+        out *= self._a_k
+        out += self._k_s
+        return out
+
+    def cp(self, h:float, p:float=None) -> float:
+        """Specific heat capacity as function of mass specific enthalpy at 1 atm (fit assumes constant cp).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Specific heat capacity in J/(kg K)
+        """
+        return self._cp * h**0
+
+#estado de fase de cada nodo de HysteresisMaterial
+SOLID = 0     #sólido o fundiéndose: curva de fusión
+LIQUID = 1    #líquido (subenfriado bajo la curva de solidificación hasta la nucleación)
+FREEZING = 2  #solidificándose: curva de solidificación
+
+class HysteresisMaterial:
+    """PCM with separate melting and solidification curves and supercooling, with a phase state per node.
+
+    The solidification curve is the melting curve shifted ``hysteresis`` K down (same solid and
+    liquid branches). A liquid node stays on the liquid branch until it is ``supercooling`` K
+    below the start of solidification; then it nucleates and jumps to the solidification curve
+    at the same enthalpy (recalescence). The state array is updated in place by ``T``, which
+    openterrace calls once per time step, before ``k``.
+    """
+
+    def __init__(self, material:PCMMaterial, supercooling:float=0.0, hysteresis:float=0.0):
+        """Initialises the curves of the material (the state is created by the first call of ``T``).
+
+        Args:
+            material (PCMMaterial): Material with the melting curve
+            supercooling (float): Supercooling depth in K below the start of solidification
+            hysteresis (float): Shift in K of the solidification curve below the melting curve
+        """
+        if not isinstance(material, PCMMaterial):
+            raise ValueError(f"Hysteresis needs a PCM of pcm_materials.csv, got {material!r}")
+        self.material = material
+        self.name = material.name
+        self.supercooling = supercooling
+        self.hysteresis = hysteresis
+        self.state = None
+        for constant in ['_T_s', '_T_l', '_k_s', '_k_l', '_h_f', '_cp', '_rho_avg', '_rho_l', '_rho_s', '_h_s', '_h_l', '_a_T', '_a_k']:
+            setattr(self, constant, getattr(material, constant))
+
+        #entalpías de la curva de solidificación y de la nucleación del líquido subenfriado
+        self._h_s_freezing = self._h_s - self._cp*hysteresis
+        self._h_l_freezing = self._h_s_freezing + self._h_f
+        self._h_nucleation = self._h_l_freezing - self._cp*supercooling
+        #inicio de la zona de cambio de fase de cada estado (el líquido nunca entra en ella)
+        self._h_ref = np.array([self._h_s, -np.inf, self._h_s_freezing])
+
+        #tabla de transiciones: estado nuevo según el estado actual y la zona de entalpía
+        self._thresholds = np.sort([self._h_s_freezing, self._h_nucleation, self._h_l_freezing, self._h_l])
+        edges = np.concatenate([[self._thresholds[0] - 1], self._thresholds, [self._thresholds[-1] + 1]])
+        zones = (edges[:-1] + edges[1:])/2
+        self._n_zones = len(zones)
+        self._transitions = np.array([[self._next_state(state, h) for h in zones] for state in [SOLID, LIQUID, FREEZING]], dtype=np.uint8).ravel()
+
+    def __repr__(self):
+        return f"HysteresisMaterial({self.name!r}, supercooling={self.supercooling}, hysteresis={self.hysteresis})"
+
+    def _next_state(self, state:int, h:float) -> int:
+        """Transition rule of one node."""
+        if state == SOLID and h >= self._h_l:
+            return LIQUID
+        if state == LIQUID and h < self._h_nucleation:
+            return FREEZING
+        if state == FREEZING and h <= self._h_s_freezing:
+            return SOLID
+        if state == FREEZING and h >= self._h_l_freezing:
+            return LIQUID
+        return state
+
+    def reset(self):
+        """Forgets the state (the next call of ``T`` starts from the equilibrium state)."""
+        self.state = None
+
+    def _h_ref_nodes(self, h) -> np.ndarray:
+        """Start of the phase change zone of every node (melting curve if h is not the field of the phase)."""
+        if self.state is not None and self.state.shape == np.shape(h):
+            return self._h_ref.take(self.state)
+        return self._h_s
+
+    def h(self, T:float, out=None) -> float:
+        """Mass specific enthalpy as function of temperature on the melting curve (used for initial and boundary values).
+
+        Args:
+            T (float): Temperature in K
+            out (ndarray): Optional array with the shape of T to store the result in
+
+        Returns:
+            Specific enthalpy in J/kg
+        """
+        return self.material.h(T, out)
+
+    def T(self, h:float, p:float=None, out=None) -> float:
+        """Updates the phase state of every node and returns the temperature on the curve of its state.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            Temperature in kelvin
+        """
+        if self.state is None and np.ndim(h) > 0:
+            self.state = np.where(np.asarray(h) >= self._h_l, LIQUID, SOLID).astype(np.uint8)
+        if self.state is not None and self.state.shape == np.shape(h):
+            zone = np.searchsorted(self._thresholds, h, side='right')
+            zone += self._n_zones*self.state
+            np.take(self._transitions, zone, out=self.state)
+
+        out = _buffer(h, out)
+        np.subtract(h, self._h_ref_nodes(h), out=out)
+        np.maximum(out, 0, out=out)
+        np.minimum(out, self._h_f, out=out)
+        out *= self._a_T
+        out += h
+        out /= self._cp
+        return out
+
+    def rho(self, h:float, p:float=None) -> float:
+        """Density as function of mass specific enthalpy (constant density).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Density in kg/m^3
+        """
+        return self._rho_avg * h**0
+
+    def k(self, h:float, p:float=None, out=None) -> float:
+        """Thermal conductivity as function of mass specific enthalpy and the current state of every node.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            float: Thermal conductivity in W/(m K)
+        """
+        out = _buffer(h, out)
+        np.subtract(h, self._h_ref_nodes(h), out=out)
+        np.maximum(out, 0, out=out)
+        np.minimum(out, self._h_f, out=out)
+        out *= self._a_k
+        out += self._k_s
+        return out
+
+    def cp(self, h:float, p:float=None) -> float:
+        """Specific heat capacity as function of mass specific enthalpy (constant cp).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Specific heat capacity in J/(kg K)
+        """
+        return self._cp * h**0
+
+    def liquid_fraction(self, h:float) -> np.ndarray:
+        """Liquid fraction of every node from its enthalpy and state (1 for a supercooled liquid).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+
+        Returns:
+            ndarray: Liquid fraction from 0 to 1
+        """
+        return np.clip((h - self._h_ref_nodes(h))/self._h_f, 0, 1)
+
+def _lookup_loop(x, x0, inv_dx, n, segment, x_next, slopes, intercepts, out):
+    """Single pass of UniformTable.evaluate over flat arrays (compiled with numba)."""
+    for j in range(x.size):
+        u = (x[j] - x0)*inv_dx
+        i = segment[int(min(max(u, 0.0), n - 1.0))]
+        if x[j] >= x_next[i]:
+            i += 1
+        out[j] = slopes[i]*x[j] + intercepts[i]
+
+_kernel = None
+
+def _lookup_kernel():
+    """Returns the compiled lookup loop, or None if numba (installed with openterrace) is not available."""
+    global _kernel
+    if _kernel is None:
+        try:
+            import numba
+            _kernel = numba.njit(cache=True)(_lookup_loop)
+        except ImportError:
+            _kernel = False
+    return _kernel or None
+
+class UniformTable:
+    """Piecewise linear function of a table, evaluated in O(1) per point (no binary search).
+
+    A uniform grid with at most one breakpoint of the table inside each cell stores the
+    segment at the start of every cell, so the segment of a point is the one of its cell or
+    the next one. The interpolation is exact at every point of the table.
+    """
+
+    def __init__(self, x:np.ndarray, y:np.ndarray, n:int=1024, max_cells:int=2**22):
+        """Builds the grid of segment indices.
+
+        Args:
+            x (ndarray): Strictly increasing abscissas of the table
+            y (ndarray): Values of the table
+            n (int): Minimum number of cells of the grid
+            max_cells (int): Maximum number of cells of the grid
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.slopes = np.diff(self.y)/np.diff(self.x)
+        self.intercepts = self.y[:-1] - self.slopes*self.x[:-1]
+        span = self.x[-1] - self.x[0]
+        #celdas más cortas que la menor distancia entre puntos de la tabla
+        self.n = max(n, int(np.ceil(span/np.min(np.diff(self.x)))) + 1)
+        if self.n > max_cells:
+            raise ValueError(f"The table needs {self.n} cells (points too close to each other), more than max_cells = {max_cells}")
+        self._x0 = self.x[0]
+        self._inv_dx = self.n/span
+        starts = self._x0 + np.arange(self.n)/self._inv_dx
+        self._segment = np.clip(np.searchsorted(self.x, starts, side='right') - 1, 0, len(self.x) - 2)
+        #inicio del tramo siguiente (el último tramo sigue hasta infinito)
+        self._x_next = np.append(self.x[1:-1], np.inf)
+
+    def index(self, x:float) -> np.ndarray:
+        """Segment of the table of every point (the first/last segment outside the table)."""
+        u = np.array(np.subtract(x, self._x0), dtype=float)
+        u *= self._inv_dx
+        np.clip(u, 0, self.n - 1, out=u)
+        i = self._segment.take(u.astype(np.intp))
+        return i + np.greater_equal(x, self._x_next.take(i))
+
+    def evaluate(self, x:float, slopes:np.ndarray, intercepts:np.ndarray, out=None) -> np.ndarray:
+        """Evaluates ``slopes[i]*x + intercepts[i]`` with the segment ``i`` of every point.
+
+        Args:
+            x (float): Points to evaluate
+            slopes (ndarray): Slope of each segment
+            intercepts (ndarray): Intercept of each segment
+            out (ndarray): Optional array with the shape of x to store the result in
+
+        Returns:
+            ndarray: Values at the points
+        """
+        out = _buffer(x, out)
+        kernel = _lookup_kernel()
+        if kernel is not None and out.flags.c_contiguous:
+            kernel(np.ascontiguousarray(x, dtype=float).reshape(-1), self._x0, self._inv_dx, self.n,
+                   self._segment, self._x_next, slopes, intercepts, out.reshape(-1))
+            return out
+        i = self.index(x)
+        np.multiply(slopes.take(i), x, out=out)
+        out += intercepts.take(i)
+        return out
+
+    def __call__(self, x:float, out=None) -> np.ndarray:
+        """Linear interpolation (linear extrapolation with the end segments outside the table).
+
+        Args:
+            x (float): Points to evaluate
+            out (ndarray): Optional array with the shape of x to store the result in
+
+        Returns:
+            ndarray: Interpolated values
+        """
+        return self.evaluate(x, self.slopes, self.intercepts, out)
+
+class TabulatedMaterial:
+    """PCM defined by a measured h-T table, with h(T), T(h), k(h), rho(h) and cp(h) interpolated through uniform-grid lookups."""
+
+    def __init__(self, name:str, T:np.ndarray, h:np.ndarray, k:np.ndarray, rho:np.ndarray, T_s:float=None, T_l:float=None, n_grid:int=1024, source:str=""):
+        """Builds the lookup tables.
+
+        Args:
+            name (str): Substance name
+            T (ndarray): Strictly increasing temperatures of the table in K
+            h (ndarray): Strictly increasing mass specific enthalpy at each temperature in J/kg
+            k (ndarray): Thermal conductivity at each temperature in W/(m K)
+            rho (ndarray): Density at each temperature in kg/m^3
+            T_s (float): Solidification temperature in K (start of the melting range, optional)
+            T_l (float): Liquid temperature in K (end of the melting range, optional)
+            n_grid (int): Minimum number of cells of the lookup grids
+            source (str): Reference of the data
+        """
+        T, h, k, rho = (np.asarray(x, dtype=float) for x in (T, h, k, rho))
+        if len(T) < 2 or np.any(np.diff(T) <= 0) or np.any(np.diff(h) <= 0):
+            raise ValueError(f"The h-T table of '{name}' needs at least 2 points with strictly increasing T and h")
+        self.name = name
+        self.source = source
+        self._h_of_T = UniformTable(T, h, n_grid)
+        self._T_of_h = UniformTable(h, T, n_grid)
+        self._k_of_h = UniformTable(h, k, n_grid)
+        self._rho_of_h = UniformTable(h, rho, n_grid)
+        #cp aparente dh/dT de cada tramo de la tabla (constante en el tramo)
+        self._cp_segments = 1/self._T_of_h.slopes
+        self._zeros = np.zeros_like(self._cp_segments)
+        self._rho_avg = np.mean(rho)
+
+        #rango de fusión: lo usan el paso adaptativo y el balance de energía
+        if T_s is not None and T_l is not None:
+            self._T_s = T_s
+            self._T_l = T_l
+            self._h_s = float(self.h(T_s))
+            self._h_l = float(self.h(T_l))
+            self._h_f = self._h_l - self._h_s
+
+    def __repr__(self):
+        return f"TabulatedMaterial({self.name!r})"
+
+    def h(self, T:float, out=None) -> float:
+        """Mass specific enthalpy as function of temperature, interpolated from the table.
+
+        Args:
+            T (float): Temperature in K
+            out (ndarray): Optional array with the shape of T to store the result in
+
+        Returns:
+            Specific enthalpy in J/kg
+        """
+        return self._h_of_T(T, out)
+
+    def T(self, h:float, p:float=None, out=None) -> float:
+        """Temperature as function of mass specific enthalpy, interpolated from the table.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            Temperature in kelvin
+        """
+        return self._T_of_h(h, out)
+
+    def rho(self, h:float, p:float=None, out=None) -> float:
+        """Density as function of mass specific enthalpy, interpolated from the table.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            float: Density in kg/m^3
+        """
+        return self._rho_of_h(h, out)
+
+    def k(self, h:float, p:float=None, out=None) -> float:
+        """Thermal conductivity as function of mass specific enthalpy, interpolated from the table.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            float: Thermal conductivity in W/(m K)
+        """
+        return self._k_of_h(h, out)
+
+    def cp(self, h:float, p:float=None) -> float:
+        """Apparent specific heat capacity dh/dT as function of mass specific enthalpy (slope of the table).
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Specific heat capacity in J/(kg K)
+        """
+        return self._T_of_h.evaluate(h, self._zeros, self._cp_segments)
+
+def load_curve(path:str) -> dict:
+    """Reads an h-T table (columns T_C, h, k, rho).
+
+    Args:
+        path (str): CSV file of the curve
+
+    Returns:
+        dict: Arrays of temperature in K (``T``), enthalpy (``h``), conductivity (``k``) and density (``rho``)
+    """
+    data = np.genfromtxt(path, delimiter=',', names=True, encoding='utf-8')
+    return {"T": data["T_C"] + 273.15, "h": data["h"], "k": data["k"], "rho": data["rho"]}
+
+def load_curves(path:str=CURVES_FILE) -> dict:
+    """Reads a table of tabulated materials and builds one TabulatedMaterial per row.
+
+    Args:
+        path (str): CSV file with the columns of pcm_curves.csv (curve paths are relative to it)
+
+    Returns:
+        dict: TabulatedMaterial objects keyed by name, in file order
+    """
+    materials = {}
+    if not os.path.exists(path):
+        return materials
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            curve = load_curve(os.path.join(os.path.dirname(path), row["curve"]))
+            materials[row["name"]] = TabulatedMaterial(name=row["name"],
+                                                       T_s=float(row["T_s_C"]) + 273.15 if row.get("T_s_C") else None,
+                                                       T_l=float(row["T_l_C"]) + 273.15 if row.get("T_l_C") else None,
+                                                       source=row.get("source", ""),
+                                                       **curve)
+    return materials
+
+def load_materials(path:str=MATERIALS_FILE) -> dict:
+    """Reads a material table and builds one PCMMaterial per row.
+
+    Args:
+        path (str): CSV file with the columns of pcm_materials.csv
+
+    Returns:
+        dict: PCMMaterial objects keyed by name, in file order
+    """
+    materials = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            materials[row["name"]] = PCMMaterial(name=row["name"],
+                                                 T_s=float(row["T_s_C"]) + 273.15,
+                                                 T_l=float(row["T_l_C"]) + 273.15,
+                                                 k_s=float(row["k_s"]),
+                                                 k_l=float(row["k_l"]),
+                                                 h_f=float(row["h_f"]),
+                                                 cp=float(row["cp"]),
+                                                 rho_avg=float(row["rho_avg"]),
+                                                 formula=row.get("formula", ""),
+                                                 source=row.get("source", ""))
+    return materials
+
+_materials = None
+
+def materials() -> dict:
+    """Returns the materials of pcm_materials.csv and pcm_curves.csv (the files are read only once per process)."""
+    global _materials
+    if _materials is None:
+        _materials = {**load_materials(), **load_curves()}
+    return _materials
+
+def get_material(name:str) -> PCMMaterial:
+    """Returns a registered material.
+
+    Args:
+        name (str): Substance name
+
+    Returns:
+        PCMMaterial: The material (TabulatedMaterial for the rows of pcm_curves.csv)
+    """
+    if name not in materials():
+        raise ValueError(f"'{name}' is not a registered PCM. Valid PCMs are: {list(materials())}")
+    return materials()[name]
+
+#constantes de pcm_materials.csv que se pueden cambiar en un barrido (temperaturas en °C)
+MATERIAL_COLUMNS = ["T_s_C", "T_l_C", "k_s", "k_l", "h_f", "cp", "rho_avg"]
+
+def material_constants(material) -> dict:
+    """Constants of a three-segment material with the columns of pcm_materials.csv.
+
+    Args:
+        material (PCMMaterial): Material
+
+    Returns:
+        dict: Value of each entry of ``MATERIAL_COLUMNS`` (empty for materials without these constants, e.g. TabulatedMaterial)
+    """
+    if not isinstance(material, PCMMaterial):
+        return {}
+    return {"T_s_C": material._T_s - 273.15, "T_l_C": material._T_l - 273.15, "k_s": material._k_s, "k_l": material._k_l,
+            "h_f": material._h_f, "cp": material._cp, "rho_avg": material._rho_avg}
+
+def register_variant(name:str, **constants) -> PCMMaterial:
+    """Registers a copy of a PCM with some constants changed, for this process.
+
+    Args:
+        name (str): Name of the registered PCM
+        **constants: New values of entries of ``MATERIAL_COLUMNS``
+
+    Returns:
+        PCMMaterial: The variant, registered as ``<name>[<constant>=<value>,...]``
+    """
+    unknown = set(constants) - set(MATERIAL_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown material constants: {sorted(unknown)}. Valid constants are: {MATERIAL_COLUMNS}")
+    base = get_material(name)
+    if not isinstance(base, PCMMaterial):
+        raise ValueError(f"Only the PCMs of pcm_materials.csv have constants to change, got {base!r}")
+    values = {**material_constants(base), **constants}
+    if values["T_l_C"] <= values["T_s_C"]:
+        raise ValueError(f"T_l_C ({values['T_l_C']}) must be above T_s_C ({values['T_s_C']})")
+    variant_name = name + "[" + ",".join(f"{key}={constants[key]:g}" for key in sorted(constants)) + "]"
+    materials()[variant_name] = PCMMaterial(name=variant_name,
+                                            T_s=values["T_s_C"] + 273.15,
+                                            T_l=values["T_l_C"] + 273.15,
+                                            k_s=values["k_s"],
+                                            k_l=values["k_l"],
+                                            h_f=values["h_f"],
+                                            cp=values["cp"],
+                                            rho_avg=values["rho_avg"],
+                                            formula=base.formula,
+                                            source=base.source)
+    return materials()[variant_name]
+
+def stack_materials(materials:list[PCMMaterial]) -> PCMMaterial:
+    """Builds one PCMMaterial whose constants are arrays of shape (n_materials, 1, 1).
+
+    The property functions broadcast, so the fields of several beds stacked on a leading axis
+    are evaluated in one call (see ``batch_simulation.py``).
+
+    Args:
+        materials (list): Three-segment materials
+
+    Returns:
+        PCMMaterial: Stacked material
+    """
+    for material in materials:
+        if not isinstance(material, PCMMaterial):
+            raise ValueError(f"Only the PCMs of pcm_materials.csv can be stacked, got {material!r}")
+
+    def column(attribute):
+        return np.array([getattr(material, attribute) for material in materials])[:,np.newaxis,np.newaxis]
+
+    return PCMMaterial(name="+".join(material.name for material in materials),
+                       T_s=column('_T_s'), T_l=column('_T_l'), k_s=column('_k_s'), k_l=column('_k_l'),
+                       h_f=column('_h_f'), cp=column('_cp'), rho_avg=column('_rho_avg'))
+
+class GradedMaterial:
+    """Bed substance with one material per row of the bed field (axially graded, or cascaded, bed).
+
+    The bed field of openterrace has one row per fluid node (row 0 at the bottom of the tank).
+    The rows of each material are kept as a slice when they are contiguous (the usual layers)
+    and as an index array otherwise, and each property function of a material is called once on
+    its rows, so a graded bed costs about the same as a single material one. Arguments that are
+    not fields (e.g. a reference temperature) are broadcast to one value per row.
+
+    When every material has a melting range, ``_T_s``, ``_T_l``, ``_h_s``, ``_h_l`` and ``_h_f``
+    are arrays of shape (rows, 1) that broadcast against the fields (used by the adaptive step
+    and the energy balance).
+    """
+
+    def __init__(self, materials:list, rows:np.ndarray):
+        """Groups the rows of every material.
+
+        Args:
+            materials (list): Materials of the bed (PCMMaterial or TabulatedMaterial)
+            rows (ndarray): Index in ``materials`` of the material of every row, bottom to top
+        """
+        rows = np.asarray(rows, dtype=int)
+        for material in materials:
+            if not isinstance(material, (PCMMaterial, TabulatedMaterial)):
+                raise ValueError(f"A graded bed needs PCMs of pcm_materials.csv or pcm_curves.csv, got {material!r}")
+        if rows.ndim != 1 or rows.min() < 0 or rows.max() >= len(materials):
+            raise ValueError(f"The material of every row must be an index in the {len(materials)} materials")
+        self.materials = list(materials)
+        self.rows = rows
+        self.name = "+".join(material.name for material in materials)
+        self._n_rows = len(rows)
+        self._groups = []
+        for i, material in enumerate(self.materials):
+            index = np.flatnonzero(rows == i)
+            if len(index) == 0:
+                continue
+            contiguous = index[-1] - index[0] + 1 == len(index)
+            self._groups.append((material, slice(index[0], index[-1] + 1) if contiguous else index))
+
+        #rango de fusión de cada fila (si todos los materiales lo tienen)
+        if all(hasattr(material, '_h_s') for material in self.materials):
+            for constant in ['_T_s', '_T_l', '_h_s', '_h_l', '_h_f']:
+                setattr(self, constant, np.array([getattr(self.materials[i], constant) for i in rows])[:,np.newaxis])
+
+    def __repr__(self):
+        return f"GradedMaterial({self.name!r}, rows={self._n_rows})"
+
+    def _broadcast(self, x) -> np.ndarray:
+        """Broadcasts a value that is not a field to one value per row."""
+        x = np.asarray(x)
+        if x.ndim < 2:
+            x = np.broadcast_to(x, np.broadcast_shapes(x.shape, (self._n_rows, 1)))
+        if x.shape[0] != self._n_rows:
+            raise ValueError(f"The graded bed has {self._n_rows} rows, got an array of shape {x.shape}")
+        return x
+
+    def _evaluate(self, fcn:str, x:float, out=None) -> np.ndarray:
+        """Calls a property function of every material on its rows.
+
+        Args:
+            fcn (str): Name of the property function
+            x (float): Temperature or enthalpy (a bed field, or a value broadcast to every row)
+            out (ndarray): Optional array with the shape of the bed field to store the result in
+
+        Returns:
+            ndarray: Property of every node
+        """
+        x = self._broadcast(x)
+        out = _buffer(x, out)
+        for material, rows in self._groups:
+            if isinstance(rows, slice) and fcn in ('h', 'T', 'k'):
+                #las filas contiguas son una vista: se escribe directo en out
+                getattr(material, fcn)(x[rows], out=out[rows])
+            else:
+                out[rows] = getattr(material, fcn)(x[rows])
+        return out
+
+    def h(self, T:float, out=None) -> float:
+        """Mass specific enthalpy of every node as function of temperature.
+
+        Args:
+            T (float): Temperature in K
+            out (ndarray): Optional array with the shape of T to store the result in
+
+        Returns:
+            Specific enthalpy in J/kg
+        """
+        return self._evaluate('h', T, out)
+
+    def T(self, h:float, p:float=None, out=None) -> float:
+        """Temperature of every node as function of mass specific enthalpy.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            Temperature in kelvin
+        """
+        return self._evaluate('T', h, out)
+
+    def rho(self, h:float, p:float=None) -> float:
+        """Density of every node as function of mass specific enthalpy.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Density in kg/m^3
+        """
+        return self._evaluate('rho', h)
+
+    def k(self, h:float, p:float=None, out=None) -> float:
+        """Thermal conductivity of every node as function of mass specific enthalpy.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+            out (ndarray): Optional array with the shape of h to store the result in
+
+        Returns:
+            float: Thermal conductivity in W/(m K)
+        """
+        return self._evaluate('k', h, out)
+
+    def cp(self, h:float, p:float=None) -> float:
+        """Specific heat capacity of every node as function of mass specific enthalpy.
+
+        Args:
+            h (float): Specific enthalpy in J/kg
+            p (float): Pressure in Pa
+
+        Returns:
+            float: Specific heat capacity in J/(kg K)
+        """
+        return self._evaluate('cp', h)
+
+def graded_rows(layers:list, n_rows:int) -> np.ndarray:
+    """Material of every row of a bed made of layers.
+
+    Args:
+        layers (list): Pairs (material name, fraction of the height), bottom to top
+        n_rows (int): Number of rows of the bed (nodes of the fluid)
+
+    Returns:
+        ndarray: Index of the layer of every row (the row of a node goes to the layer that holds its center)
+    """
+    fractions = np.array([fraction for _, fraction in layers], dtype=float)
+    if len(fractions) == 0 or np.any(fractions <= 0):
+        raise ValueError(f"The layers of a graded bed need positive height fractions, got {layers}")
+    edges = np.cumsum(fractions)/np.sum(fractions)
+    centers = (np.arange(n_rows) + 0.5)/n_rows
+    return np.minimum(np.searchsorted(edges, centers), len(layers) - 1)
+
+def grading_name(layers:list) -> str:
+    """Name of a graded bed for results and caches, ``graded[<name>=<fraction>,...]`` bottom to top.
+
+    Args:
+        layers (list): Pairs (material name, fraction of the height), bottom to top
+
+    Returns:
+        str: Name
+    """
+    return "graded[" + ",".join(f"{name}={fraction:g}" for name, fraction in layers) + "]"
+
+def parse_grading(text:str) -> list:
+    """Reads the layers of a graded bed from ``<name>=<fraction>,...`` (bottom to top).
+
+    Args:
+        text (str): Layers, e.g. ``magnesium_eutectic=0.5,sodium_acetate_trihydrate=0.5``
+
+    Returns:
+        list: Pairs (material name, fraction of the height)
+    """
+    layers = []
+    for item in text.split(","):
+        name, _, fraction = item.partition("=")
+        layers.append((name.strip(), float(fraction) if fraction else 1.0))
+    return layers
+
+def select_material(phase, name:str, supercooling:float=0.0, hysteresis:float=0.0, grading:list=None):
+    """Selects the substance of an openterrace phase, like ``phase.select_substance``.
+
+    Registered PCMs are assigned directly (they don't have to be copied into openterrace's
+    bed_substances folder). Any other name falls back to the openterrace substances.
+
+    Args:
+        phase (object): openterrace phase
+        name (str): Substance name
+        supercooling (float): Supercooling depth in K (a HysteresisMaterial with its own node states is used if not 0)
+        hysteresis (float): Shift in K of the solidification curve below the melting curve
+        grading (list): Pairs (material name, fraction of the height) of an axially graded bed, bottom to top (a GradedMaterial is used instead of ``name``)
+    """
+    if grading:
+        if supercooling or hysteresis:
+            raise ValueError("Hysteresis is not available for graded beds")
+        #una capa repetida (p.ej. A-B-A) es un solo material con filas no contiguas
+        names = list(dict.fromkeys(layer for layer, _ in grading))
+        rows = np.array([names.index(grading[i][0]) for i in graded_rows(grading, phase.n_other)])
+        phase.fcns = GradedMaterial([get_material(layer) for layer in names], rows)
+    elif name in materials() and (supercooling or hysteresis):
+        phase.fcns = HysteresisMaterial(materials()[name], supercooling=supercooling, hysteresis=hysteresis)
+    elif name in materials():
+        phase.fcns = materials()[name]
+    else:
+        phase.select_substance(name)
@@ -1,11 +1,11 @@
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Qt5Agg')
+from result_store import ResultStore
 import numpy as np
-import os
+from plot_backend import pyplot, show, downsample
+import argparse
+
+def plot_and_summarize(simulate:bool=False, per_pcm:bool=False, fmt:str="svg"):
+    plt = pyplot()
 
-def plot_and_summarize():
-    
     pcms = [
         "sodium_acetate_trihydrate",
         "magnesium_eutectic",
@@ -16,29 +16,40 @@ def plot_and_summarize():
     
     #guardar los resultados para la tabla
     results_table = {}
+    #series de cada pcm para sus gráficos individuales
+    series = {}
     #configuración del gráfico
     plt.figure(figsize=(12, 8))
     
+    if simulate:
+        #los casos que están en el caché solo se escriben, los que faltan se simulan
+        from simulate_all_pcms import run_all
+        run_all(pcms, cache=True)
+
+    #índice de los archivos de resultados (los arrays se leen recién al usarlos)
+    store = ResultStore()
     for pcm in pcms:
         file_name = f"results_{pcm}.npz"
+        data = store.get(pcm, "descarga")
         
         #se verifica si el archivo de resultados existe
-        if not os.path.exists(file_name):
+        if data is None:
             print(f"ADVERTENCIA: No se encontró '{file_name}'.")
             print(f"Por favor, ejecuta primero el script de simulación para '{pcm}'.")
             continue
             
-        #cargar los datos del archivo .npz
-        data = np.load(file_name)
-        
+        #arrays del archivo .npz (mapeados en memoria)
         energy_released = data['energy']
-        times_discharge_hours = data['times']
-        Tout_discharge = data['Tout']
+        times_discharge_hours = data.times
+        Tout_discharge = data.node("salida")
         
         #guardar para la tabla
         results_table[pcm] = energy_released
         
-        plt.plot(times_discharge_hours, Tout_discharge, label=pcm, linewidth=2.5)
+        if per_pcm:
+            series[pcm] = {"times": np.array(times_discharge_hours), "Tout": np.array(Tout_discharge)}
+        #series largas: ~2 puntos por pixel (lttb)
+        plt.plot(*downsample(times_discharge_hours, Tout_discharge), label=pcm, linewidth=2.5)
 
     #gráfico
 
@@ -52,7 +63,11 @@ def plot_and_summarize():
     plt.xlim(0, 4)  
     plt.tight_layout()
     plt.savefig('comparacion_descarga_FINAL.png') 
-    plt.show()
+    if series:
+        #gráficos individuales (grafico_descarga_<pcm>) en paralelo
+        from simulate_all_pcms import plot_all
+        plot_all(series, fmt)
+    show()
 
     #Resultados
     print("\nResultados del Benchmark (Energía Total Liberada):")
@@ -67,4 +82,9 @@ def plot_and_summarize():
         print(f"{pcm_name:<35} | {energy:<20.2f}")
 
 if __name__ == "__main__":
-    plot_and_summarize()
+    parser = argparse.ArgumentParser(description="Gráfico comparativo de la descarga de los PCMs.")
+    parser.add_argument("--simulate", action="store_true", help="pedir los resultados al caché y simular solo los que faltan")
+    parser.add_argument("--per-pcm", action="store_true", help="dibujar también el gráfico de cada PCM, en paralelo")
+    parser.add_argument("--format", choices=["svg", "png"], default="svg", help="formato de los gráficos de cada PCM (png para lotes grandes)")
+    args = parser.parse_args()
+    plot_and_summarize(args.simulate, args.per_pcm, args.format)
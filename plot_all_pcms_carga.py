@@ -1,16 +1,17 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Qt5Agg') 
+from result_store import ResultStore
+from plot_backend import pyplot, show, downsample
+import argparse
 
-def main():
+def main(simulate:bool=False, per_pcm:bool=False, fmt:str="svg"):
+    plt = pyplot()
 
-    archivos_a_comparar = {
-        "Acetato de Sodio": "results_CARGA_CONDUCCION_sodium_acetate_trihydrate.npz",
-        "Bario Octahidratado": "results_CARGA_CONDUCCION_barium_hydroxide_octahydrate.npz",
-        "Cloruro de magnesio": "results_CARGA_CONDUCCION_magnesium_chloride_hexahydrate.npz",
-        "Nitrato de magnesio": "results_CARGA_CONDUCCION_magnesium_nitrate_hexahydrate.npz",
-        "Magnesio eutectico": "results_CARGA_CONDUCCION_magnesium_eutectic.npz"}
+    pcms_a_comparar = {
+        "Acetato de Sodio": "sodium_acetate_trihydrate",
+        "Bario Octahidratado": "barium_hydroxide_octahydrate",
+        "Cloruro de magnesio": "magnesium_chloride_hexahydrate",
+        "Nitrato de magnesio": "magnesium_nitrate_hexahydrate",
+        "Magnesio eutectico": "magnesium_eutectic"}
 
 
     print("Iniciando Script de Comparación (Solo Temp. Fondo - Nodo 1)")
@@ -19,22 +20,38 @@ def main():
     fig, ax_temp = plt.subplots(figsize=(12, 8))
     
     #colores
-    colores = plt.cm.viridis(np.linspace(0, 1, len(archivos_a_comparar)))
+    colores = plt.cm.viridis(np.linspace(0, 1, len(pcms_a_comparar)))
     max_time = 0 
 
+    if simulate:
+        #los casos que están en el caché solo se escriben, los que faltan se simulan
+        from simulate_all_pcms_carga import run_all
+        run_all(list(pcms_a_comparar.values()), cache=True)
+
+    #índice de los archivos de resultados (los arrays se leen recién al usarlos)
+    store = ResultStore()
+    #series de cada pcm para sus gráficos individuales
+    series = {}
+
     #for para cargar archivos
     
-    for i, (etiqueta, nombre_archivo) in enumerate(archivos_a_comparar.items()):
+    for i, (etiqueta, pcm) in enumerate(pcms_a_comparar.items()):
         
+        nombre_archivo = f"results_CARGA_CONDUCCION_{pcm}.npz"
         print(f"Cargando {nombre_archivo} (para '{etiqueta}')...")
         
         try:
         
-            data = np.load(nombre_archivo)
-            times = data['times_hours']
+            data = store.get(pcm, "carga")
+            if data is None:
+                raise FileNotFoundError(nombre_archivo)
+            times = data.times
             
-            temp_a_graficar = data['T_fondo_C']
-            ax_temp.plot(times, temp_a_graficar, label=f'Temp. Fondo: {etiqueta}', 
+            temp_a_graficar = data.node("fondo")
+            if per_pcm:
+                series[pcm] = {"times_hours": np.array(times), "T_fondo_C": np.array(temp_a_graficar)}
+            #series largas: ~2 puntos por pixel (lttb)
+            ax_temp.plot(*downsample(times, temp_a_graficar), label=f'Temp. Fondo: {etiqueta}', 
                          linestyle='-', linewidth=2.5, color=colores[i])
           
             
@@ -65,7 +82,16 @@ def main():
     output_filename = "grafico_comparativo_benchmark.svg"
     plt.savefig(output_filename)
     print(f"Gráfico comparativo guardado en '{output_filename}'")
-    plt.show()
+    if series:
+        #gráficos individuales (grafico_CARGA_CONDUCCION_<pcm>) en paralelo
+        from simulate_all_pcms_carga import plot_all
+        plot_all(series, fmt)
+    show()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Gráfico comparativo de la carga estática de los PCMs.")
+    parser.add_argument("--simulate", action="store_true", help="pedir los resultados al caché y simular solo los que faltan")
+    parser.add_argument("--per-pcm", action="store_true", help="dibujar también el gráfico de cada PCM, en paralelo")
+    parser.add_argument("--format", choices=["svg", "png"], default="svg", help="formato de los gráficos de cada PCM (png para lotes grandes)")
+    args = parser.parse_args()
+    main(args.simulate, args.per_pcm, args.format)
@@ -0,0 +1,171 @@
+"""
+Selection of the matplotlib backend of the scripts.
+
+matplotlib is only imported when a figure is drawn (``pyplot``), never when a runner module is
+imported. In headless mode the Agg backend is used and ``show`` does nothing, so the figures
+are only saved to file; otherwise the Qt5Agg window of the original scripts is used.
+
+Headless mode is on if the ``PCM_HEADLESS`` environment variable is set to 1/true/yes, if the
+process runs under a batch scheduler (Slurm, PBS/Torque, LSF, SGE) or if there is no display on
+Linux. ``PCM_HEADLESS=0`` forces the interactive mode.
+
+Long series (output at every step, year-long cyclic runs) are reduced before drawing with
+``downsample``: Largest-Triangle-Three-Buckets keeps the first and last points and, in every
+bucket, the point that forms the largest triangle with the point kept before and the mean of the
+next bucket, so peaks and edges survive with about two points per pixel of the figure.
+``render_figures`` draws independent figures in a pool of headless worker processes.
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import os
+
+#variables que definen los gestores de colas (Slurm, PBS/Torque, LSF, SGE)
+SCHEDULER_VARIABLES = ["SLURM_JOB_ID", "PBS_JOBID", "LSB_JOBID", "JOB_ID"]
+
+def headless() -> bool:
+    """Checks if the figures have to be drawn without a window.
+
+    Returns:
+        bool: True in headless mode
+    """
+    value = os.environ.get("PCM_HEADLESS", "").strip().lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    if any(variable in os.environ for variable in SCHEDULER_VARIABLES):
+        return True
+    if sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return True
+    return False
+
+def set_headless(on:bool=True):
+    """Forces headless (or interactive) mode for this process and the worker processes it starts.
+
+    Args:
+        on (bool): True for headless mode
+    """
+    os.environ["PCM_HEADLESS"] = "1" if on else "0"
+
+def pyplot():
+    """Imports ``matplotlib.pyplot`` with the backend of the current mode (Agg or Qt5Agg).
+
+    If pyplot was already imported (e.g. by a driver script) its backend is kept.
+
+    Returns:
+        module: matplotlib.pyplot
+    """
+    if "matplotlib.pyplot" not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg' if headless() else 'Qt5Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def show():
+    """Shows the open figures, only in interactive mode."""
+    if not headless():
+        pyplot().show()
+
+def lttb(x:np.ndarray, y:np.ndarray, n:int) -> np.ndarray:
+    """Indices of the ``n`` points kept by Largest-Triangle-Three-Buckets.
+
+    Args:
+        x (ndarray): Increasing abscissas
+        y (ndarray): Values
+        n (int): Number of points to keep (all of them if the series is not longer)
+
+    Returns:
+        ndarray: Increasing indices of the kept points, first and last included
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    #n-2 baldes entre el primer y el último punto
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    kept = np.empty(n, dtype=np.intp)
+    kept[0] = 0
+    kept[-1] = size - 1
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i+1]
+        #promedio del balde siguiente (el último punto para el último balde)
+        next_start, next_end = (edges[i+1], edges[i+2]) if i < n - 3 else (size - 1, size)
+        x_mean = x[next_start:next_end].mean()
+        y_mean = y[next_start:next_end].mean()
+        area = np.abs((x[a] - x_mean)*(y[start:end] - y[a]) - (x[a] - x[start:end])*(y_mean - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i+1] = a
+    return kept
+
+def screen_points(fig=None) -> int:
+    """Number of points drawn for a series: two per pixel of the figure width.
+
+    Args:
+        fig (object): matplotlib figure (the current figure if None)
+
+    Returns:
+        int: Number of points
+    """
+    fig = pyplot().gcf() if fig is None else fig
+    return int(2*fig.get_figwidth()*fig.dpi)
+
+def downsample(x:np.ndarray, y:np.ndarray, n:int=None) -> tuple[np.ndarray, np.ndarray]:
+    """Reduces a series to ``n`` points with ``lttb`` (series that are not longer are returned as they are).
+
+    Args:
+        x (ndarray): Increasing abscissas
+        y (ndarray): Values
+        n (int): Number of points (``screen_points`` of the current figure if None)
+
+    Returns:
+        tuple: Abscissas and values of the kept points
+    """
+    n = screen_points() if n is None else n
+    if len(x) <= n:
+        return x, y
+    kept = lttb(x, y, n)
+    return np.asarray(x)[kept], np.asarray(y)[kept]
+
+def _render(fcn, args:tuple, kwargs:dict):
+    """Draws one figure in a worker process with the Agg backend and closes it."""
+    plt = pyplot()
+    #el proceso hijo puede haber heredado pyplot con Qt5Agg: los trabajadores nunca abren ventanas
+    plt.switch_backend('Agg')
+    try:
+        return fcn(*args, **kwargs)
+    finally:
+        plt.close('all')
+
+def render_figures(fcn, jobs:list, workers:int=None) -> list:
+    """Draws independent figures in a pool of headless worker processes.
+
+    Args:
+        fcn (callable): Module-level function that draws and saves one figure
+        jobs (list): Arguments of every call, as (positional arguments tuple, keyword arguments dict) pairs
+        workers (int): Number of worker processes (defaults to one per job, up to the number of cores)
+
+    Returns:
+        list: Return values of the calls, in the order of ``jobs``
+    """
+    for job in jobs:
+        if len(job) != 2 or not isinstance(job[0], tuple) or not isinstance(job[1], dict):
+            raise ValueError(f"Every job must be an (args, kwargs) pair, got {job!r}")
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    if workers <= 1:
+        #en este proceso, con su backend: solo se cierran las figuras de cada trabajo (no las que ya estaban abiertas)
+        plt = pyplot()
+        results = []
+        for args, kwargs in jobs:
+            opened = set(plt.get_fignums())
+            results.append(fcn(*args, **kwargs))
+            for number in set(plt.get_fignums()) - opened:
+                plt.close(number)
+        return results
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render, fcn, args, kwargs) for args, kwargs in jobs]
+        return [future.result() for future in futures]
@@ -0,0 +1,256 @@
+"""
+Optional instrumentation of the time loop of ``tank_simulation.run``.
+
+A ``RunProfiler`` given to ``run`` wraps, only for the duration of that run, the parts of every
+step with timers: the boundary nodes, the diffusion and convection schemes, the mass flow update,
+the explicit update of the enthalpy (``solve``), the property calls of the substance of each phase
+(``T``, ``rho``, ``cp``, ``k``, e.g. the ``np.piecewise`` of the PCM), the fluid-bed coupling, the
+output capture, the monitors, the drivers and the stability limit of the adaptive step. The times
+are exclusive (a section doesn't count the sections called inside it), so they add up to the wall
+time of the run minus ``other`` (loop and progress bar). The timers add ~10-15% to the run;
+without a profiler ``run`` is unchanged.
+
+With ``allocations=True`` every section also reports the memory allocated through ``tracemalloc``
+(peak above the memory at its start, including the sections inside it, summed over the calls and
+its maximum), which slows the run
+down several times: use it to compare sections, not for the timings. ``trace`` additionally
+records the whole run with ``cProfile`` (``.prof``, see ``python -m pstats``) or ``pyinstrument``
+(``.html``).
+"""
+
+import time
+import json
+import tracemalloc
+
+#funciones de propiedades de las sustancias que se cronometran
+PROPERTY_FUNCTIONS = ("T", "rho", "cp", "k")
+
+class _TimedFunctions:
+    """Substance of a phase (``phase.fcns``) with timed property functions; the rest is passed through."""
+
+    def __init__(self, fcns, timed:dict):
+        object.__setattr__(self, "_fcns", fcns)
+        object.__setattr__(self, "_timed", timed)
+
+    def __getattr__(self, name):
+        timed = object.__getattribute__(self, "_timed")
+        if name in timed:
+            return timed[name]
+        return getattr(object.__getattribute__(self, "_fcns"), name)
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, "_fcns"), name, value)
+
+class RunProfiler:
+    """Per-section timing (and optionally allocations) of one run, saved as a JSON report."""
+
+    def __init__(self, allocations:bool=False, trace:str=None):
+        """Initialises an empty report.
+
+        Args:
+            allocations (bool): Measure the memory allocated by every section with ``tracemalloc``
+            trace (str): Also record the run with 'cprofile' or 'pyinstrument' (None for no trace)
+        """
+        if trace not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"Unknown trace '{trace}'. Valid options are: [None, 'cprofile', 'pyinstrument']")
+        self.allocations = allocations
+        self.trace = trace
+        self.sections = {}
+        self.report = None
+        self._stack = []
+        self._restore = []
+        self._tracer = None
+        self._t0 = None
+        self._tracemalloc = False
+
+    def timed(self, name:str, fcn):
+        """Wraps a function so that its calls are counted in the section ``name``.
+
+        Args:
+            name (str): Name of the section
+            fcn (callable): Function to wrap
+
+        Returns:
+            callable: Wrapped function
+        """
+        section = self.sections.setdefault(name, {"time": 0.0, "inclusive": 0.0, "calls": 0, "alloc_total": 0, "alloc_peak": 0})
+        stack = self._stack
+        allocations = self.allocations
+
+        def wrapper(*args, **kwargs):
+            frame = [0.0, 0, 0]           #tiempo y peak de memoria de las secciones internas, memoria al inicio
+            if allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                tracemalloc.reset_peak()
+                frame[2] = current
+            stack.append(frame)
+            t0 = time.perf_counter()
+            try:
+                return fcn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                stack.pop()
+                section["time"] += elapsed - frame[0]
+                section["inclusive"] += elapsed
+                section["calls"] += 1
+                if stack:
+                    stack[-1][0] += elapsed
+                if allocations:
+                    peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                    section["alloc_total"] += peak - frame[2]
+                    section["alloc_peak"] = max(section["alloc_peak"], peak - frame[2])
+                    if stack:
+                        stack[-1][1] = max(stack[-1][1], peak)
+        return wrapper
+
+    def _wrap(self, obj, attribute:str, name:str):
+        """Replaces ``obj.attribute`` by its timed version until ``detach``."""
+        original = obj.__dict__.get(attribute)
+        setattr(obj, attribute, self.timed(name, getattr(obj, attribute)))
+        self._restore.append((obj, attribute, original))
+
+    def attach(self, ot, outputs:list=(), monitors:list=(), drivers:list=()):
+        """Wraps the phases and coupling of a simulation, and the outputs, monitors and drivers of its run.
+
+        Args:
+            ot (object): openterrace simulation
+            outputs (list): Output sinks of the run
+            monitors (list): Monitors of the run
+            drivers (list): Drivers of the run
+        """
+        phases = ot.Phase.instances
+        types = [phase.type for phase in phases]
+        for i, phase in enumerate(phases):
+            #con varias fases del mismo tipo se distinguen por su índice
+            label = phase.type if types.count(phase.type) == 1 else f"{phase.type}{i}"
+            self._wrap(phase, "_solve_equations", f"{label}.solve")
+            self._wrap(phase, "_update_boundary_nodes", f"{label}.boundary")
+            self._wrap(phase, "_update_properties", f"{label}.properties")
+            if hasattr(phase, "diff"):
+                self._wrap(phase, "diff", f"{label}.diffusion")
+            if hasattr(phase, "conv"):
+                self._wrap(phase, "conv", f"{label}.convection")
+                self._wrap(phase, "_update_massflow_rate", f"{label}.massflow")
+            timed = {fcn: self.timed(f"{label}.{fcn}", getattr(phase.fcns, fcn)) for fcn in PROPERTY_FUNCTIONS if hasattr(phase.fcns, fcn)}
+            self._restore.append((phase, "fcns", phase.__dict__["fcns"]))
+            phase.fcns = _TimedFunctions(phase.fcns, timed)
+        if ot.flag_coupling:
+            self._wrap(ot, "_coupling", "coupling")
+        for output in outputs:
+            self._wrap(output, "save", "output")
+        for monitor in monitors:
+            self._wrap(monitor, "update", "monitors")
+        for driver in drivers:
+            self._wrap(driver, "apply", "drivers")
+
+    def detach(self):
+        """Puts back every attribute replaced by ``attach``."""
+        for obj, attribute, original in reversed(self._restore):
+            if original is None:
+                delattr(obj, attribute)
+            else:
+                setattr(obj, attribute, original)
+        self._restore = []
+
+    def start(self):
+        """Starts the wall clock, ``tracemalloc`` and the trace."""
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc = True
+        if self.trace == 'cprofile':
+            import cProfile
+            self._tracer = cProfile.Profile()
+            self._tracer.enable()
+        elif self.trace == 'pyinstrument':
+            import pyinstrument
+            self._tracer = pyinstrument.Profiler()
+            self._tracer.start()
+        self._t0 = time.perf_counter()
+
+    def stop(self, stats:dict, simulated:float) -> dict:
+        """Stops the measurements and builds the report.
+
+        Args:
+            stats (dict): Output of ``tank_simulation.run``
+            simulated (float): Simulated time of the run in s
+
+        Returns:
+            dict: Wall time in s, steps, steps per second and simulated seconds per second, and the time in s, fraction of the wall time, number of calls and (with ``allocations``) allocated bytes of every section, sorted by time
+        """
+        wall = time.perf_counter() - self._t0
+        if self.trace == 'cprofile':
+            self._tracer.disable()
+        elif self.trace == 'pyinstrument':
+            self._tracer.stop()
+        if self._tracemalloc:
+            tracemalloc.stop()
+            self._tracemalloc = False
+        sections = {}
+        for name, section in sorted(self.sections.items(), key=lambda item: -item[1]["time"]):
+            if not section["calls"]:
+                continue #p. ej. las secciones que el paso fusionado no llama
+            sections[name] = {"time_s": section["time"], "inclusive_s": section["inclusive"], "fraction": section["time"]/wall if wall > 0 else 0.0,
+                              "calls": section["calls"], "time_per_call_us": 1e6*section["time"]/section["calls"] if section["calls"] else 0.0}
+            if self.allocations:
+                sections[name].update({"alloc_total_bytes": section["alloc_total"], "alloc_peak_bytes": section["alloc_peak"]})
+        #lo que no está en ninguna sección: el ciclo de tiempo, tqdm, el guardado de select_output
+        other = wall - sum(section["time"] for section in self.sections.values())
+        self.report = {"wall_time_s": wall, "steps": stats["steps"], "steps_per_s": stats["steps"]/wall if wall > 0 else 0.0,
+                       "simulated_s": simulated, "simulated_s_per_s": simulated/wall if wall > 0 else 0.0,
+                       "dt_min": stats["dt_min"], "dt_max": stats["dt_max"], "allocations": self.allocations,
+                       "sections": sections, "other_s": other}
+        return self.report
+
+    def save(self, path:str, **info):
+        """Writes the report as JSON and, if a trace was recorded, the trace next to it.
+
+        Args:
+            path (str): Path of the .json file
+            **info: Extra entries of the report (e.g. the PCM and the parameters of the run)
+
+        Returns:
+            str: Path of the trace file (None without trace)
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**info, **self.report}, f, indent=2, default=float)
+        trace_path = None
+        if self.trace == 'cprofile':
+            trace_path = path[:-len(".json")] + ".prof" if path.endswith(".json") else path + ".prof"
+            self._tracer.dump_stats(trace_path)
+        elif self.trace == 'pyinstrument':
+            trace_path = path[:-len(".json")] + ".html" if path.endswith(".json") else path + ".html"
+            with open(trace_path, "w", encoding="utf-8") as f:
+                f.write(self._tracer.output_html())
+        return trace_path
+
+def print_report(report:dict, top:int=12):
+    """Prints the sections of a report that take the most time.
+
+    Args:
+        report (dict): Report of ``RunProfiler.stop``
+        top (int): Number of sections printed
+    """
+    print(f"Perfil: {report['wall_time_s']:.2f} s, {report['steps']} pasos ({report['steps_per_s']:.0f} pasos/s, "
+          f"{report['simulated_s_per_s']:.0f} s simulados/s)")
+    print(f"{'sección':<22} | {'tiempo (s)':>10} | {'%':>6} | {'llamadas':>9} | {'µs/llamada':>10}" + (f" | {'MB asignados':>12}" if report["allocations"] else ""))
+    print("-" * (70 + (15 if report["allocations"] else 0)))
+    for name, section in list(report["sections"].items())[:top]:
+        print(f"{name:<22} | {section['time_s']:>10.3f} | {section['fraction']:>6.1%} | {section['calls']:>9} | {section['time_per_call_us']:>10.1f}"
+              + (f" | {section['alloc_total_bytes']/1024**2:>12.1f}" if report["allocations"] else ""))
+    print(f"{'otros (ciclo, tqdm)':<22} | {report['other_s']:>10.3f} | {report['other_s']/report['wall_time_s']:>6.1%}")
+
+def save_run_report(profiler:RunProfiler, path:str, pcm_name:str, mode:str, params:dict):
+    """Writes the report of a discharge or charge run (and its trace) next to its results.
+
+    Args:
+        profiler (RunProfiler): Profiler of the run
+        path (str): Path of the .json file
+        pcm_name (str): Name of the bed substance
+        mode (str): 'descarga' or 'carga'
+        params (dict): Parameters of the run (the grid and time step go to the report)
+    """
+    grid = {key: params[key] for key in ("n_fluid", "n_bed", "dt", "adaptive", "simulation_time")}
+    trace_path = profiler.save(path, pcm=pcm_name, mode=mode, **grid)
+    print(f"Perfil guardado en {path}" + (f" (traza en {trace_path})" if trace_path else ""))
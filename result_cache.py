@@ -0,0 +1,286 @@
+"""
+Content-addressed cache of the discharge and charge results.
+
+The key of a run is the SHA-1 of its full case definition: mode, PCM name and constants (or the
+h-T table of a tabulated material; those of every layer for a graded bed), every parameter that
+changes the results (geometry, grid, dt, boundary and initial values, solver options, the
+contents of a profile CSV) and the solver version (the source of the functions and classes that
+compute the results and the openterrace version). Plotting, reports and command line code are
+not part of the version, so a new plot style doesn't invalidate the cache. Options that only
+change how a run is done or reported (``fused``, ``stream``, profiling) are not part of the key.
+So any change of an input, or of the code, is a new key and old entries are never returned for
+it.
+
+Every entry is one ``<key>.npz`` in the cache folder with the arrays of the results, the case
+definition and the other values (e.g. the stop reason) as JSON. The modification time of a file
+is its last use: when the folder grows above ``max_bytes`` the least recently used entries are
+deleted. ``python result_cache.py invalidate`` removes entries explicitly (all, or the ones of a
+PCM and/or mode).
+"""
+
+import numpy as np
+import hashlib
+import ast
+import argparse
+import json
+import glob
+import time
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".result_cache")
+MAX_BYTES = 256 * 1024**2
+
+#parámetros que no cambian los resultados (solo cómo se corre o qué se reporta)
+RUNTIME_PARAMS = ["fused", "stream", "profiling", "profiling_allocations", "profiling_trace", "cache"]
+
+#código que calcula los resultados: cualquier cambio en él es una versión nueva del solver
+#(None = el módulo completo; si no, solo esas definiciones, sin los gráficos ni la línea de comandos)
+SOURCE_FILES = {"simulate_all_pcms.py": ["run_discharge"],
+                "simulate_all_pcms_carga.py": ["run_charge"],
+                "tank_simulation.py": None,
+                "implicit_solver.py": ["SLOPE_STEP", "_shift", "_tridiagonal", "ImplicitSolver"],
+                "pcm_registry.py": None,
+                "energy_accounting.py": None,
+                "stop_criteria.py": None,
+                "boundary_profiles.py": None,
+                "streaming_output.py": None,
+                "fused_step.py": None,
+                "single_precision.py": ["to_single_precision"]}
+
+_solver_version = None
+
+def _definitions_source(source:str, names:list[str]) -> str:
+    """Source of some top-level functions, classes and constants of a module."""
+    segments = []
+    found = set()
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            defined = [node.name]
+        elif isinstance(node, ast.Assign):
+            defined = [target.id for target in node.targets if isinstance(target, ast.Name)]
+        else:
+            continue
+        if any(name in names for name in defined):
+            segments.append(ast.get_source_segment(source, node))
+            found.update(defined)
+    if set(names) - found:
+        raise ValueError(f"Definitions not found for the solver version: {sorted(set(names) - found)}")
+    return "\n".join(segments)
+
+def solver_version() -> dict:
+    """Returns the hash of the code in ``SOURCE_FILES`` and the openterrace version (computed once per process)."""
+    global _solver_version
+    if _solver_version is None:
+        import importlib.metadata
+        digest = hashlib.sha1()
+        for name, definitions in SOURCE_FILES.items():
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), encoding='utf-8') as f:
+                source = f.read()
+            if definitions is not None:
+                source = _definitions_source(source, definitions)
+            digest.update(source.encode())
+        _solver_version = {"source": digest.hexdigest(), "openterrace": importlib.metadata.version("openterrace")}
+    return _solver_version
+
+def _file_hash(path:str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _material_definition(material) -> dict:
+    """Constants of a registered material, or the hash of its h-T table for a TabulatedMaterial."""
+    from pcm_registry import material_constants, TabulatedMaterial
+
+    if isinstance(material, TabulatedMaterial):
+        #la tabla h-T completa (la curva del archivo)
+        table = material._T_of_h
+        return {"curve": hashlib.sha1(table.x.tobytes() + table.y.tobytes() + material._k_of_h.y.tobytes() + material._rho_of_h.y.tobytes()).hexdigest()}
+    #vacío para las sustancias de openterrace (se identifican por el nombre)
+    return material_constants(material)
+
+def case_definition(mode:str, pcm_name:str, params:dict) -> dict:
+    """Builds the definition of a run that is hashed into its key.
+
+    Args:
+        mode (str): 'descarga' or 'carga'
+        pcm_name (str): Name of the bed substance
+        params (dict): All the parameters of the run (``DISCHARGE_PARAMS`` or ``CHARGE_PARAMS`` with the overrides)
+
+    Returns:
+        dict: Mode, PCM, its constants, the parameters that change the results and the solver version
+    """
+    from pcm_registry import materials
+
+    if params.get("grading"):
+        #lecho graduado: las constantes de cada capa
+        constants = {"layers": [_material_definition(materials().get(name)) for name, _ in params["grading"]]}
+    else:
+        constants = _material_definition(materials().get(pcm_name))
+    params = {key: value for key, value in params.items() if key not in RUNTIME_PARAMS}
+    if params.get("profile") not in (None, "M"):
+        #el contenido del perfil, no su ruta
+        params["profile"] = {"sha1": _file_hash(params["profile"])}
+    return {"mode": mode, "pcm": pcm_name, "material": constants, "params": params, "solver": solver_version()}
+
+def case_key(definition:dict) -> str:
+    """Returns the key of a case definition (SHA-1 of its JSON with sorted keys)."""
+    return hashlib.sha1(json.dumps(definition, sort_keys=True, default=float).encode()).hexdigest()
+
+class ResultCache:
+    """Folder of cached results with a size bound and least recently used eviction."""
+
+    def __init__(self, directory:str=CACHE_DIR, max_bytes:int=MAX_BYTES):
+        """Initialises the cache (the folder is created on the first ``put``).
+
+        Args:
+            directory (str): Folder of the entries
+            max_bytes (int): Maximum total size of the entries in bytes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, definition:dict) -> dict:
+        """Returns the stored results of a case and marks them as used, or None if they are not in the cache.
+
+        Args:
+            definition (dict): Output of ``case_definition``
+
+        Returns:
+            dict: Results, as returned by the run that stored them
+        """
+        path = self._path(case_key(definition))
+        try:
+            with np.load(path) as data:
+                results = {key: data[key] for key in data.files if not key.startswith("__")}
+                results.update(json.loads(str(data["__values__"])))
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            #no está, o quedó incompleto: se vuelve a simular
+            return None
+        for key, value in results.items():
+            if isinstance(value, np.ndarray) and value.ndim == 0:
+                results[key] = value.item()
+        os.utime(path)
+        return results
+
+    def put(self, definition:dict, results:dict):
+        """Stores the results of a case and evicts the least recently used entries above ``max_bytes``.
+
+        Args:
+            definition (dict): Output of ``case_definition``
+            results (dict): Results of the run (arrays and numbers are stored as arrays, the rest as JSON)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        arrays = {key: np.asarray(value) for key, value in results.items()
+                  if isinstance(value, (np.ndarray, np.number, int, float)) and not isinstance(value, bool)}
+        values = {key: value for key, value in results.items() if key not in arrays}
+        path = self._path(case_key(definition))
+        #se escribe aparte y se renombra: otro proceso nunca lee una entrada a medio escribir
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as f:
+            np.savez(f, __case__=json.dumps(definition, sort_keys=True, default=float), __values__=json.dumps(values, default=float), **arrays)
+        os.replace(temporary, path)
+        self.evict(keep=path)
+
+    def entries(self) -> list[dict]:
+        """Returns the entries of the cache, the most recently used first.
+
+        Returns:
+            list: Key, mode, PCM, size in bytes, last use (``time.time`` seconds) and path of every entry
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.npz")):
+            try:
+                stat = os.stat(path)
+                with np.load(path) as data:
+                    definition = json.loads(str(data["__case__"]))
+            except (FileNotFoundError, OSError, ValueError, KeyError):
+                continue
+            entries.append({"key": os.path.basename(path)[:-len(".npz")], "mode": definition["mode"], "pcm": definition["pcm"],
+                            "bytes": stat.st_size, "last_used": stat.st_mtime, "path": path})
+        return sorted(entries, key=lambda entry: -entry["last_used"])
+
+    def evict(self, max_bytes:int=None, keep:str=None) -> int:
+        """Deletes the least recently used entries until the cache fits in ``max_bytes``.
+
+        Args:
+            max_bytes (int): Size bound in bytes (``self.max_bytes`` if None)
+            keep (str): Path of an entry that is never deleted (the one just stored)
+
+        Returns:
+            int: Number of deleted entries
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        paths = glob.glob(os.path.join(self.directory, "*.npz"))
+        sizes = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            sizes[path] = (stat.st_mtime, stat.st_size)
+        total = sum(size for _, size in sizes.values())
+        deleted = 0
+        for path in sorted(sizes, key=lambda path: sizes[path][0]):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= sizes[path][1]
+            deleted += 1
+        return deleted
+
+    def invalidate(self, pcm:str=None, mode:str=None) -> int:
+        """Deletes the entries of a PCM (and its variants) and/or mode, or all of them.
+
+        Args:
+            pcm (str): Name of the bed substance (any if None)
+            mode (str): 'descarga' or 'carga' (any if None)
+
+        Returns:
+            int: Number of deleted entries
+        """
+        deleted = 0
+        for entry in self.entries():
+            #las variantes de un barrido se llaman <pcm>[<constante>=<valor>,...]
+            if (pcm is None or entry["pcm"] == pcm or entry["pcm"].startswith(pcm + "[")) and (mode is None or entry["mode"] == mode):
+                try:
+                    os.remove(entry["path"])
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+def main():
+    parser = argparse.ArgumentParser(description="Caché de resultados de las simulaciones de descarga y carga.")
+    parser.add_argument("--dir", default=CACHE_DIR, help="carpeta del caché")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="mostrar las entradas, la más reciente primero")
+    invalidate = commands.add_parser("invalidate", help="borrar las entradas de un PCM y/o modo (todas si no se indica ninguno)")
+    invalidate.add_argument("--pcm", default=None, help="PCM (también borra sus variantes)")
+    invalidate.add_argument("--mode", choices=["descarga", "carga"], default=None, help="modo")
+    prune = commands.add_parser("prune", help="borrar las entradas menos usadas hasta el tamaño máximo")
+    prune.add_argument("--max-mb", type=float, default=MAX_BYTES / 1024**2, help="tamaño máximo en MB")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.dir)
+    if args.command == "list":
+        entries = cache.entries()
+        print(f"{'clave':<12} | {'modo':<9} | {'PCM':<35} | {'KB':>7} | último uso")
+        print("-" * 90)
+        for entry in entries:
+            print(f"{entry['key'][:12]:<12} | {entry['mode']:<9} | {entry['pcm']:<35} | {entry['bytes']/1024:>7.1f} | "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))}")
+        print(f"{len(entries)} entradas, {sum(entry['bytes'] for entry in entries)/1024**2:.2f} MB en {args.dir}")
+    elif args.command == "invalidate":
+        print(f"{cache.invalidate(args.pcm, args.mode)} entradas borradas")
+    else:
+        print(f"{cache.evict(int(args.max_mb * 1024**2))} entradas borradas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Index of the result files written by the discharge and charge runners.
+
+``ResultStore`` scans a folder once for ``results_<pcm>.npz`` (descarga) and
+``results_CARGA_CONDUCCION_<pcm>.npz`` (carga) and reads only the zip directory and the .npy
+headers of every array. The arrays themselves are returned as read-only memory-mapped views
+(np.savez stores them uncompressed), so only the pages that are actually used are read.
+"""
+
+import numpy as np
+import zipfile
+import struct
+import glob
+import os
+
+#nombre del array de cada nodo del estanque en los .npz
+NODE_KEYS = {
+    "descarga": {"salida": "Tout"},
+    "carga": {"fondo": "T_fondo_C", "medio": "T_medio_C", "cima": "T_cima_C"}
+}
+
+#eje de tiempo de cada modo
+TIME_KEYS = {"descarga": "times", "carga": "times_hours"}
+
+class ResultEntry:
+    """Arrays of one result file, memory-mapped on access."""
+
+    def __init__(self, path:str, pcm:str, mode:str):
+        """Reads the location, dtype and shape of every array of a .npz file (not the data).
+
+        Args:
+            path (str): Path of the .npz file
+            pcm (str): Name of the bed substance
+            mode (str): 'descarga' or 'carga'
+        """
+        self.path = path
+        self.pcm = pcm
+        self.mode = mode
+        self._arrays = {}
+        self._cache = {}
+        with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+            for info in zf.infolist():
+                key = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+                if info.compress_type != zipfile.ZIP_STORED:
+                    #comprimido (np.savez_compressed): no se puede mapear, se lee con np.load
+                    self._arrays[key] = None
+                    continue
+                f.seek(info.header_offset)
+                name_len, extra_len = struct.unpack('<HH', f.read(30)[26:30])
+                f.seek(info.header_offset + 30 + name_len + extra_len)
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                self._arrays[key] = (f.tell(), shape, fortran_order, dtype)
+
+    def __repr__(self):
+        return f"ResultEntry({self.pcm!r}, {self.mode!r}, {self.path!r})"
+
+    def keys(self) -> list[str]:
+        """Names of the arrays in the file."""
+        return list(self._arrays)
+
+    def __contains__(self, key:str) -> bool:
+        return key in self._arrays
+
+    def __getitem__(self, key:str) -> np.ndarray:
+        """Returns an array of the file as a read-only memory map (0-d arrays and compressed members are read).
+
+        Args:
+            key (str): Name of the array
+
+        Returns:
+            ndarray: The array
+        """
+        if key not in self._arrays:
+            raise KeyError(f"{self.path} has no array '{key}'. Arrays are: {self.keys()}")
+        if key not in self._cache:
+            location = self._arrays[key]
+            if location is None:
+                with np.load(self.path) as data:
+                    self._cache[key] = data[key]
+            else:
+                offset, shape, fortran_order, dtype = location
+                if len(shape) == 0:
+                    self._cache[key] = np.fromfile(self.path, dtype=dtype, count=1, offset=offset).reshape(())
+                else:
+                    self._cache[key] = np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                                                 order='F' if fortran_order else 'C')
+        return self._cache[key]
+
+    @property
+    def times(self) -> np.ndarray:
+        """Output times in hours."""
+        return self[TIME_KEYS[self.mode]]
+
+    def node(self, node:str) -> np.ndarray:
+        """Returns the temperature in C of a tank node.
+
+        Args:
+            node (str): 'salida' for descarga, 'fondo', 'medio' or 'cima' for carga
+
+        Returns:
+            ndarray: Temperature at each output time
+        """
+        if node not in NODE_KEYS[self.mode]:
+            raise KeyError(f"'{node}' is not a node of mode '{self.mode}'. Nodes are: {list(NODE_KEYS[self.mode])}")
+        return self[NODE_KEYS[self.mode][node]]
+
+class ResultStore:
+    """Index of the result files of a folder."""
+
+    def __init__(self, directory:str='.'):
+        """Scans the folder for result files.
+
+        Args:
+            directory (str): Folder with the .npz files
+        """
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        """Scans the folder again (e.g. after new simulations finished)."""
+        self.entries = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "results_*.npz"))):
+            name = os.path.basename(path)[len("results_"):-len(".npz")]
+            if name.startswith("CARGA_CONDUCCION_"):
+                self.entries.append(ResultEntry(path, name[len("CARGA_CONDUCCION_"):], "carga"))
+            else:
+                self.entries.append(ResultEntry(path, name, "descarga"))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def query(self, pcm:str=None, mode:str=None) -> list[ResultEntry]:
+        """Returns the result files of a PCM and/or mode.
+
+        Args:
+            pcm (str): Name of the bed substance (any if None)
+            mode (str): 'descarga' or 'carga' (any if None)
+
+        Returns:
+            list: Matching entries
+        """
+        return [entry for entry in self.entries if (pcm is None or entry.pcm == pcm) and (mode is None or entry.mode == mode)]
+
+    def get(self, pcm:str, mode:str='descarga') -> ResultEntry:
+        """Returns the result file of a PCM and mode, or None if it doesn't exist.
+
+        Args:
+            pcm (str): Name of the bed substance
+            mode (str): 'descarga' or 'carga'
+
+        Returns:
+            ResultEntry: The entry
+        """
+        entries = self.query(pcm, mode)
+        return entries[0] if entries else None
+
+    def node(self, pcm:str, mode:str, node:str) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the output times in hours and the temperature in C of a tank node.
+
+        Args:
+            pcm (str): Name of the bed substance
+            mode (str): 'descarga' or 'carga'
+            node (str): 'salida' for descarga, 'fondo', 'medio' or 'cima' for carga
+
+        Returns:
+            tuple: Times and temperatures
+        """
+        entry = self.get(pcm, mode)
+        if entry is None:
+            raise KeyError(f"No results for '{pcm}' ({mode}) in {self.directory}")
+        return entry.times, entry.node(node)
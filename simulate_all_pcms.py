@@ -0,0 +1,335 @@
+import numpy as np
+from tank_simulation import reset_openterrace, run
+from streaming_output import StreamingOutput
+from pcm_registry import select_material, parse_grading, grading_name
+from energy_accounting import EnergyIntegrator
+from profiling import RunProfiler, print_report, save_run_report
+from result_cache import ResultCache, case_definition
+from stop_criteria import StopCriteria
+from boundary_profiles import TimeSeriesBC, load_profile, tapping_cycle
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+
+#los 5 pcms del benchmark (mismo orden que plot_all_pcms.py)
+PCMS = [
+    "sodium_acetate_trihydrate",
+    "magnesium_eutectic",
+    "barium_hydroxide_octahydrate",
+    "magnesium_nitrate_hexahydrate",
+    "magnesium_chloride_hexahydrate"
+]
+
+#parámetros de la simulación de descarga (los mismos de los scripts simulate_*.py)
+DISCHARGE_PARAMS = {
+    "D": 0.3,
+    "H": 1.5,
+    "phi": 0.4,
+    "R_inner": 0.01,            #radio interno del pcm
+    "R_outer": 0.03,            #radio externo del pcm
+    "n_fluid": 100,             #n° de nodos del fluido
+    "n_bed": 20,                #n° de nodos pcm
+    "flow_rate": -0.01,         #flujo hacia abajo
+    "h_value": 200,
+    "simulation_time": 4 * 3600,  #4 horas
+    "dt": 0.1,                  #paso del tiempo
+    "output_interval": 300,
+    "T_init": 273.15 + 80.0,    #temperatura inicial del estanque y PCM a 80°C
+    "T_cold": 273.15 + 20.0,    #temperatura del agua fría de entrada a 20°C
+    "cp_fluid": 4200,           #cp del agua
+    #paso de tiempo adaptativo (ver tank_simulation.run)
+    "adaptive": False,
+    "safety": 0.9,              #fracción del límite de estabilidad
+    "phase_change_factor": 0.5, #reducción del paso cerca del cambio de fase
+    #paso implícito (ver implicit_solver.py): sin límite de estabilidad, dt de 5-30 s
+    "implicit": False,
+    "theta": 1.0,               #1 = Euler implícito, 0.5 = Crank-Nicolson
+    "fused": False,             #paso explícito compilado (ver fused_step.py), mismos resultados
+    "precision": "float64",     #"float32": h, T y el historial en precisión simple (ver single_precision.py), usa el paso compilado
+    #histéresis del pcm (ver pcm_registry.HysteresisMaterial), 0 = modelo sin estado
+    "supercooling": 0.0,        #subenfriamiento en K bajo el inicio de la solidificación
+    "hysteresis": 0.0,          #desplazamiento en K de la curva de solidificación
+    #lecho graduado (ver pcm_registry.GradedMaterial): pares (pcm, fracción de la altura) de abajo hacia arriba, p.ej.
+    #[("magnesium_eutectic", 0.5), ("sodium_acetate_trihydrate", 0.5)]; None = un solo pcm en todo el lecho
+    "grading": None,
+    #perfil de extracción: None (flujo y entrada constantes), "M" (ciclo M de EN 16147) o un CSV con t_s, mdot, T_inlet_C
+    "profile": None,
+    #escribir la temperatura de salida a disco durante la simulación (results_<pcm>_Tout.npy)
+    "stream": False,
+    #criterios de término anticipado (None = no se usa), revisados cada stop_check_interval pasos
+    "T_outlet_min": None,       #temperatura de salida mínima en K (p.ej. 273.15 + 45.0 para ACS)
+    "liquid_fraction_min": None, #fracción líquida mínima del pcm
+    "energy_max": None,         #energía liberada máxima en MJ
+    "stop_check_interval": 100,
+    #caché de resultados (ver result_cache.py): una corrida con las mismas entradas se lee en vez de simularse
+    "cache": False,
+    #perfilado del ciclo de tiempo (ver profiling.py), reporte en results_<pcm>_profile.json
+    "profiling": False,
+    "profiling_allocations": False, #memoria asignada por sección con tracemalloc (la corrida es varias veces más lenta)
+    "profiling_trace": None     #traza completa: 'cprofile' (.prof) o 'pyinstrument' (.html)
+}
+
+def run_discharge(pcm_name:str, save:bool=True, **params) -> dict:
+    """Runs the discharge benchmark for one PCM and saves ``results_<pcm_name>.npz``.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        save (bool): Write the .npz file
+        **params: Overrides of the entries in ``DISCHARGE_PARAMS``
+
+    Returns:
+        dict: Released energy in MJ (``energy``), energy left in the PCM at the end in MJ (``energy_latent``, ``energy_sensible``), output times in hours (``times``), outlet temperature in C (``Tout``), number of time steps (``steps``), final time in hours (``t_stop``), stop condition reached (``stop_reason``, None if the run got to ``simulation_time``) and report of the profiler (``profiler``, None without ``profiling``)
+    """
+    p = {**DISCHARGE_PARAMS, **params}
+    if p["precision"] not in ("float64", "float32"):
+        raise ValueError(f"Unknown precision '{p['precision']}'. Valid options are: ['float64', 'float32']")
+    #con perfilado siempre se simula (lo que se mide es la corrida), y con stream también (el .npy se escribe durante la corrida)
+    cache = ResultCache() if p["cache"] and not (p["profiling"] or p["profiling_trace"] or p["stream"]) else None
+    if cache is not None:
+        definition = case_definition("descarga", pcm_name, p)
+        results = cache.get(definition)
+        if results is not None:
+            print(f"Resultados de {pcm_name} leídos del caché ({results['energy']:.2f} MJ liberados)")
+            if save:
+                save_results(pcm_name, results)
+            return results
+
+    import openterrace #se importa aquí: cargar openterrace (numba, scipy) toma casi un segundo
+
+    print(f" Iniciando simulación para: {pcm_name} ")
+    reset_openterrace()
+    ot = openterrace.Simulate(t_end=p["simulation_time"], dt=p["dt"])
+
+    # definiendo la fase Fluida (en este caso:Agua)
+    fluid = ot.create_phase(n=p["n_fluid"], type='fluid')
+    fluid.select_substance(substance='water')
+    fluid.select_domain_shape(domain='cylinder_1d', D=p["D"], H=p["H"]) #dominio: cilindro vertical
+    fluid.select_porosity(phi=p["phi"])
+    fluid.select_schemes(diff='central_difference_1d', conv='upwind_1d') #discretización
+    fluid.select_initial_conditions(T=p["T_init"]) #condición inicial
+    fluid.select_massflow(mdot=p["flow_rate"]) #flujo hacia abajo
+    #Condición de Borde: salida de agua caliente en el nodo 0 (abajo)
+    fluid.select_bc(bc_type='zero_gradient',
+                    parameter='T',
+                    position=(slice(None, None, None), 0))
+
+    #Condición de Borde: entrada de agua fría (fixed value) en el nodo -1 (ARRIBA)
+    fluid.select_bc(bc_type='fixed_value',
+                    parameter='T',
+                    position=(slice(None, None, None), -1),
+                    value=p["T_cold"])
+
+    #tiempos para guardar los distintos resultados
+    output_times = np.arange(0, p["simulation_time"] + p["output_interval"], p["output_interval"])
+    if not p["stream"]:
+        fluid.select_output(times=output_times)
+
+    # definiendo el pcm
+    bed = ot.create_phase(n=p["n_bed"], n_other=p["n_fluid"], type='bed')
+    select_material(bed, pcm_name, supercooling=p["supercooling"], hysteresis=p["hysteresis"], grading=p["grading"]) #pcm de la tabla pcm_materials.csv
+    bed.select_domain_shape(domain='hollow_sphere_1d', Rinner=p["R_inner"], Router=p["R_outer"])
+    bed.select_schemes(diff='central_difference_1d') #discretización solo conducción
+    bed.select_initial_conditions(T=p["T_init"]) #condición inicial
+    bed.select_bc(bc_type='zero_gradient', parameter='T', position=(slice(None, None, None), 0)) #condiciones bordes
+    bed.select_bc(bc_type='zero_gradient', parameter='T', position=(slice(None, None, None), -1))
+
+    #acoplamiento fluido y pcm
+    ot.select_coupling(fluid_phase=0, bed_phase=1, h_exp='constant', h_value=p["h_value"])
+    if p["precision"] == "float32":
+        from single_precision import to_single_precision
+        to_single_precision(ot)
+    #flujo y temperatura de entrada variables en el tiempo
+    drivers = []
+    flow_rate = p["flow_rate"]
+    if p["profile"] is not None:
+        if p["profile"] == "M":
+            profile = tapping_cycle()
+            interpolation = 'previous'
+        else:
+            profile = load_profile(p["profile"])
+            interpolation = 'linear'
+        driver = TimeSeriesBC(fluid, profile["times"], mdot=profile["mdot"], T=profile["T"], interpolation=interpolation)
+        driver.apply(0.0) #valores iniciales
+        drivers.append(driver)
+        if driver.mdot is not None:
+            flow_rate = None #el balance lee el flujo de cada paso
+    #balance de energía: se integra en cada paso de tiempo, no solo en los tiempos de salida
+    energy = EnergyIntegrator(fluid, bed, flow_rate=flow_rate, cp_fluid=p["cp_fluid"], T_ref=p["T_cold"], outlet=0)
+    monitors = [energy]
+    stop = StopCriteria(energy, T_outlet_min=p["T_outlet_min"], liquid_fraction_min=p["liquid_fraction_min"],
+                        energy_max=p["energy_max"], check_interval=p["stop_check_interval"])
+    if stop.active:
+        monitors.append(stop)
+    #simulación
+    profiler = RunProfiler(p["profiling_allocations"], p["profiling_trace"]) if p["profiling"] or p["profiling_trace"] else None
+    outputs = []
+    if p["stream"]:
+        #solo el nodo de salida (nodo 0) se va escribiendo a disco, sin guardar todo el historial en memoria
+        outlet = StreamingOutput(fluid, f"results_{pcm_name}_Tout.npy", output_times, nodes=0, dtype=p["precision"])
+        outputs.append(outlet)
+    try:
+        stats = run(ot, adaptive=p["adaptive"], safety=p["safety"], phase_change_factor=p["phase_change_factor"], outputs=outputs, monitors=monitors, drivers=drivers, profiler=profiler,
+                    implicit=p["implicit"], theta=p["theta"], fused=p["fused"] or p["precision"] == "float32")
+    finally:
+        #el archivo se cierra aunque la corrida falle (el encabezado queda con las filas guardadas)
+        for output in outputs:
+            output.close()
+
+    if stats["stopped"]:
+        print(f"simulación para {pcm_name} detenida en t = {stats['t']/3600:.2f} h ({stop.reason})")
+    else:
+        print(f"simulación para {pcm_name} terminada")
+
+    #Resultados
+    if p["stream"]:
+        T_outlet = outlet.load()[:, 0, 0]
+        time_seconds = outlet.times[:len(T_outlet)]
+    else:
+        #si la simulación se detuvo antes, solo los primeros _q tiempos de salida tienen datos
+        T_outlet = fluid.data.T[:fluid._q, 0, 0]
+        time_seconds = fluid.data.time[:fluid._q]
+    time_hours = time_seconds / 3600
+    outlet_temperature_C = T_outlet - 273.15  #La salida del agua caliente es por el nodo 0
+
+    #Energía Liberada y energía que queda en el pcm (sobre T_cold), en MJ
+    balance = energy.summary()
+    energy_released = balance["released"]
+
+    print(f"Energía Total Liberada ({pcm_name}): {energy_released:.2f} MJ")
+    results = {"energy": energy_released, "energy_latent": balance["bed_latent"], "energy_sensible": balance["bed_sensible"], "times": time_hours, "Tout": outlet_temperature_C,
+               "steps": stats["steps"], "t_stop": stats["t"] / 3600, "stop_reason": stop.reason,
+               "profiler": None if profiler is None else profiler.report}
+    if save:
+        save_results(pcm_name, results)
+    if profiler is not None:
+        print_report(profiler.report)
+        if save:
+            save_run_report(profiler, f"results_{pcm_name}_profile.json", pcm_name, "descarga", p)
+    if cache is not None:
+        cache.put(definition, results)
+    return results
+
+def save_results(pcm_name:str, results:dict):
+    """Writes ``results_<pcm_name>.npz``, the file read by plot_all_pcms.py.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        results (dict): Output of ``run_discharge``
+    """
+    np.savez(f"results_{pcm_name}.npz",
+             energy=results["energy"],
+             energy_latent=results["energy_latent"],
+             energy_sensible=results["energy_sensible"],
+             times=results["times"],
+             Tout=results["Tout"],
+             t_stop=results["t_stop"])
+    print(f"Resultados de datos guardados en results_{pcm_name}.npz")
+
+def plot_discharge(pcm_name:str, results:dict, fmt:str="svg") -> str:
+    """Plots the outlet temperature of one discharge and saves ``grafico_descarga_<pcm_name>.<fmt>``.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        results (dict): Output of ``run_discharge`` (``times`` and ``Tout``)
+        fmt (str): 'svg' or 'png' (raster, for large batches)
+
+    Returns:
+        str: Path of the figure
+    """
+    from plot_backend import pyplot, downsample
+    plt = pyplot()
+
+    print("Generando gráfico...")
+    plt.figure(figsize=(10, 7))
+    #series largas (salida en cada paso): se dibujan ~2 puntos por pixel
+    plt.plot(*downsample(results["times"], results["Tout"]), label=pcm_name, linewidth=2)
+    plt.legend(title='Material PCM')
+    plt.title(f'Simulación de Descarga: {pcm_name}', fontsize=16)
+    plt.xlabel('Tiempo de Descarga (horas)', fontsize=12)
+    plt.ylabel(u'Temperatura de Salida del Agua (°C)', fontsize=12)
+    plt.grid(which='major', color='#DDDDDD', linewidth=1)
+    plt.minorticks_on()
+    plt.ylim(45,85)
+    #guardar el gráfico con un nombre específico del pcm
+    path = f'grafico_descarga_{pcm_name}.{fmt}'
+    plt.savefig(path, dpi=150 if fmt == "png" else None)
+    print(f"Gráfico '{path}' guardado.")
+    return path
+
+def plot_all(results:dict, fmt:str="svg", workers:int=None) -> list[str]:
+    """Draws the figure of every discharge in a pool of processes (see ``plot_backend.render_figures``).
+
+    Args:
+        results (dict): Results of ``run_discharge`` keyed by PCM name
+        fmt (str): 'svg' or 'png'
+        workers (int): Number of worker processes (defaults to one per PCM, up to the number of cores)
+
+    Returns:
+        list: Paths of the figures
+    """
+    from plot_backend import render_figures
+    #solo los arreglos del gráfico viajan a los procesos
+    return render_figures(plot_discharge, [((pcm, {"times": r["times"], "Tout": r["Tout"]}, fmt), {}) for pcm, r in results.items()], workers)
+
+def run_all(pcms:list[str]=PCMS, workers:int=None, **params) -> dict:
+    """Runs the discharge of several PCMs in parallel, one process per simulation.
+
+    Args:
+        pcms (list): Names of the bed substances
+        workers (int): Number of worker processes (defaults to one per PCM, up to the number of cores)
+        **params: Overrides of the entries in ``DISCHARGE_PARAMS``
+
+    Returns:
+        dict: Results of ``run_discharge`` keyed by PCM name
+    """
+    if workers is None:
+        workers = min(len(pcms), os.cpu_count() or 1)
+    if workers <= 1:
+        return {pcm: run_discharge(pcm, **params) for pcm in pcms}
+
+    #cada simulación es independiente: se reparte en un pool de procesos
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pcm: pool.submit(run_discharge, pcm, **params) for pcm in pcms}
+        return {pcm: future.result() for pcm, future in futures.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación de descarga de varios PCMs en paralelo.")
+    parser.add_argument("pcms", nargs="*", default=PCMS, help="PCMs a simular (por defecto los 5 del benchmark)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="n° de procesos (por defecto uno por PCM)")
+    parser.add_argument("--adaptive", action="store_true", help="paso de tiempo adaptativo en vez de dt fijo")
+    parser.add_argument("--implicit", action="store_true", help="paso de tiempo implícito (usar con --dt de 5-30 s)")
+    parser.add_argument("--fused", action="store_true", help="paso explícito compilado con numba (mismos resultados, más rápido)")
+    parser.add_argument("--float32", action="store_true", help="h, T y el historial en float32 (paso compilado, ver single_precision.py)")
+    parser.add_argument("--dt", type=float, default=None, help="paso de tiempo en s (por defecto 0.1)")
+    parser.add_argument("--stream", action="store_true", help="escribir la salida a disco durante la simulación")
+    parser.add_argument("--profile", default=None, help="perfil de extracción: M (ciclo EN 16147) o un CSV con t_s, mdot, T_inlet_C")
+    parser.add_argument("--hours", type=float, default=None, help="horas simuladas (por defecto 4, o 24 con --profile M)")
+    parser.add_argument("--T-min", type=float, default=None, help="detener cuando la salida baje de esta temperatura en °C")
+    parser.add_argument("--liquid-min", type=float, default=None, help="detener cuando la fracción líquida del pcm baje de este valor")
+    parser.add_argument("--energy-max", type=float, default=None, help="detener cuando la energía liberada supere este valor en MJ")
+    parser.add_argument("--grading", default=None, help="lecho graduado <pcm>=<fracción>,... de abajo hacia arriba (se simula en vez de los PCMs)")
+    parser.add_argument("--plots", action="store_true", help="dibujar el gráfico de cada PCM en paralelo (grafico_descarga_<pcm>)")
+    parser.add_argument("--format", choices=["svg", "png"], default="svg", help="formato de los gráficos (png para lotes grandes)")
+    parser.add_argument("--cache", action="store_true", help="leer del caché los casos ya simulados con las mismas entradas (ver result_cache.py)")
+    parser.add_argument("--profiling", action="store_true", help="medir el tiempo de cada parte del paso (results_<pcm>_profile.json)")
+    parser.add_argument("--allocations", action="store_true", help="con --profiling, medir también la memoria asignada (tracemalloc)")
+    parser.add_argument("--trace", choices=["cprofile", "pyinstrument"], default=None, help="guardar además una traza completa de la corrida")
+    args = parser.parse_args()
+
+    T_outlet_min = None if args.T_min is None else args.T_min + 273.15
+    hours = args.hours if args.hours is not None else 24 if args.profile == "M" else 4
+    dt = {} if args.dt is None else {"dt": args.dt}
+    grading = parse_grading(args.grading) if args.grading else None
+    pcms = [grading_name(grading)] if grading else args.pcms
+    results = run_all(pcms, grading=grading, workers=args.workers, adaptive=args.adaptive, implicit=args.implicit, fused=args.fused, precision="float32" if args.float32 else "float64", **dt, stream=args.stream, profile=args.profile, simulation_time=hours*3600,
+                      T_outlet_min=T_outlet_min, liquid_fraction_min=args.liquid_min, energy_max=args.energy_max,
+                      cache=args.cache, profiling=args.profiling, profiling_allocations=args.allocations, profiling_trace=args.trace)
+
+    print("\nEnergía Total Liberada:")
+    for pcm_name, result in results.items():
+        print(f"{pcm_name:<35} | {result['energy']:<20.2f} | {result['t_stop']:.2f} h")
+    if args.plots:
+        plot_all(results, args.format, args.workers)
+
+if __name__ == "__main__":
+    main()
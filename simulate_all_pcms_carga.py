@@ -0,0 +1,294 @@
+import numpy as np
+from tank_simulation import reset_openterrace, run
+from streaming_output import StreamingOutput
+from pcm_registry import select_material, parse_grading, grading_name
+from energy_accounting import EnergyIntegrator
+from profiling import RunProfiler, print_report, save_run_report
+from result_cache import ResultCache, case_definition
+from simulate_all_pcms import PCMS
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+
+#parámetros de la carga estática (los mismos de los scripts carga_*.py)
+CHARGE_PARAMS = {
+    "D": 0.3,
+    "H": 1.5,
+    "phi": 0.4,
+    "R_inner": 0.01,
+    "R_outer": 0.03,
+    "n_fluid": 100,
+    "n_bed": 20,
+    "h_value": 200,
+    "simulation_time": 4 * 3600,
+    "dt": 0.1,
+    "output_interval": 300,
+    #carga térmica estática
+    "T_init": 273.15 + 20.0,    #estanque empieza frío
+    "T_hot": 273.15 + 80.0,     #el calentador a 80°C
+    "flow_rate": 0.0,           #no hay flujo de masa
+    #paso de tiempo adaptativo (ver tank_simulation.run)
+    "adaptive": False,
+    "safety": 0.9,
+    "phase_change_factor": 0.5,
+    #paso implícito (ver implicit_solver.py)
+    "implicit": False,
+    "theta": 1.0,
+    "fused": False,             #paso explícito compilado (ver fused_step.py), mismos resultados
+    "precision": "float64",     #"float32": h, T y el historial en precisión simple (ver single_precision.py), usa el paso compilado
+    #histéresis del pcm (ver pcm_registry.HysteresisMaterial)
+    "supercooling": 0.0,
+    "hysteresis": 0.0,
+    "grading": None,            #lecho graduado: pares (pcm, fracción de la altura) de abajo hacia arriba (ver simulate_all_pcms.py)
+    #escribir los nodos 1, n/2 y -1 a disco durante la simulación (results_CARGA_CONDUCCION_<pcm>_T.npy)
+    "stream": False,
+    #caché de resultados (ver result_cache.py)
+    "cache": False,
+    #perfilado del ciclo de tiempo (ver profiling.py), reporte en results_CARGA_CONDUCCION_<pcm>_profile.json
+    "profiling": False,
+    "profiling_allocations": False,
+    "profiling_trace": None
+}
+
+def run_charge(pcm_name:str, save:bool=True, **params) -> dict:
+    """Runs the static (conduction only) charge for one PCM and saves ``results_CARGA_CONDUCCION_<pcm_name>.npz``.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        save (bool): Write the .npz file
+        **params: Overrides of the entries in ``CHARGE_PARAMS``
+
+    Returns:
+        dict: Output times in hours (``times_hours``), water temperature in C at the bottom (node 1), middle and top (``T_fondo_C``, ``T_medio_C``, ``T_cima_C``), energy stored in the PCM at the end in MJ (``energy_latent``, ``energy_sensible``), number of time steps (``steps``) and report of the profiler (``profiler``, None without ``profiling``)
+    """
+    p = {**CHARGE_PARAMS, **params}
+    if p["precision"] not in ("float64", "float32"):
+        raise ValueError(f"Unknown precision '{p['precision']}'. Valid options are: ['float64', 'float32']")
+    #con perfilado o stream siempre se simula (ver run_discharge)
+    cache = ResultCache() if p["cache"] and not (p["profiling"] or p["profiling_trace"] or p["stream"]) else None
+    if cache is not None:
+        definition = case_definition("carga", pcm_name, p)
+        results = cache.get(definition)
+        if results is not None:
+            print(f"Resultados de CARGA de {pcm_name} leídos del caché")
+            if save:
+                save_results(pcm_name, results)
+            return results
+
+    import openterrace
+
+    print(f"Iniciando simulación de CARGA ESTÁTICA para: {pcm_name} ")
+    reset_openterrace()
+    ot = openterrace.Simulate(t_end=p["simulation_time"], dt=p["dt"])
+
+    #definiendo fase fluida (agua)
+    fluid = ot.create_phase(n=p["n_fluid"], type='fluid')
+    fluid.select_substance(substance='water')
+    fluid.select_domain_shape(domain='cylinder_1d', D=p["D"], H=p["H"])
+    fluid.select_porosity(phi=p["phi"])
+    fluid.select_schemes(diff='central_difference_1d')
+    fluid.select_initial_conditions(T=p["T_init"])
+    fluid.select_massflow(mdot=p["flow_rate"])
+    #Nodo 0 es el calentador a 80°C (abajo)
+    fluid.select_bc(bc_type='fixed_value',
+                     parameter='T',
+                     position=(slice(None, None, None), 0),
+                     value=p["T_hot"])
+
+    #Nodo -1 está aislado (no pierde calor y está arriba)
+    fluid.select_bc(bc_type='zero_gradient',
+                     parameter='T',
+                     position=(slice(None, None, None), -1))
+
+    output_times = np.arange(0, p["simulation_time"] + p["output_interval"], p["output_interval"])
+    #nodos que se guardan: fondo (1), mitad (n/2) y cima (-1)
+    nodes = [1, int(p["n_fluid"]/2), p["n_fluid"] - 1]
+    if not p["stream"]:
+        fluid.select_output(times=output_times)
+
+    #definiendo fase sólida pcm
+    bed = ot.create_phase(n=p["n_bed"], n_other=p["n_fluid"], type='bed')
+    select_material(bed, pcm_name, supercooling=p["supercooling"], hysteresis=p["hysteresis"], grading=p["grading"]) #pcm de la tabla pcm_materials.csv
+    bed.select_domain_shape(domain='hollow_sphere_1d', Rinner=p["R_inner"], Router=p["R_outer"])
+    bed.select_schemes(diff='central_difference_1d')
+    bed.select_initial_conditions(T=p["T_init"])
+    bed.select_bc(bc_type='zero_gradient', parameter='T', position=(slice(None, None, None), 0))
+
+    #acoplamiento entre fase fluida y pcm
+    ot.select_coupling(fluid_phase=0, bed_phase=1, h_exp='constant', h_value=p["h_value"])
+    if p["precision"] == "float32":
+        from single_precision import to_single_precision
+        to_single_precision(ot)
+
+    #energía almacenada sobre la temperatura inicial
+    energy = EnergyIntegrator(fluid, bed, flow_rate=p["flow_rate"], cp_fluid=fluid.cp.flat[0], T_ref=p["T_init"], outlet=-1)
+    #simulación
+    profiler = RunProfiler(p["profiling_allocations"], p["profiling_trace"]) if p["profiling"] or p["profiling_trace"] else None
+    outputs = []
+    if p["stream"]:
+        probes = StreamingOutput(fluid, f"results_CARGA_CONDUCCION_{pcm_name}_T.npy", output_times, nodes=nodes, dtype=p["precision"])
+        outputs.append(probes)
+    try:
+        stats = run(ot, adaptive=p["adaptive"], safety=p["safety"], phase_change_factor=p["phase_change_factor"], outputs=outputs, monitors=[energy], profiler=profiler,
+                    implicit=p["implicit"], theta=p["theta"], fused=p["fused"] or p["precision"] == "float32")
+    finally:
+        #el archivo se cierra aunque la corrida falle (ver run_discharge)
+        for output in outputs:
+            output.close()
+
+    print(f"Simulación de CARGA ESTÁTICA terminada.")
+
+    #resultados
+    if p["stream"]:
+        T_nodes = probes.load()[:, 0, :]
+        time_seconds = probes.times[:len(T_nodes)]
+    else:
+        T_nodes = fluid.data.T[:, 0, nodes]
+        time_seconds = fluid.data.time
+    time_hours = time_seconds / 3600
+
+    #temperatura en 3 puntos del estanque:
+    T_fondo = T_nodes[:, 0] - 273.15
+    T_medio = T_nodes[:, 1] - 273.15 #nodo 50 (la mitad)
+    T_cima = T_nodes[:, 2] - 273.15 #nodo -1 (la cima, n_fluid-1)
+    balance = energy.summary()
+    print(f"Energía almacenada en el PCM ({pcm_name}): {balance['bed_latent']:.2f} MJ latente, {balance['bed_sensible']:.2f} MJ sensible")
+
+    results = {"times_hours": time_hours, "T_fondo_C": T_fondo, "T_medio_C": T_medio, "T_cima_C": T_cima,
+               "energy_latent": balance["bed_latent"], "energy_sensible": balance["bed_sensible"], "steps": stats["steps"],
+               "profiler": None if profiler is None else profiler.report}
+    if save:
+        save_results(pcm_name, results)
+    if profiler is not None:
+        print_report(profiler.report)
+        if save:
+            save_run_report(profiler, f"results_CARGA_CONDUCCION_{pcm_name}_profile.json", pcm_name, "carga", p)
+    if cache is not None:
+        cache.put(definition, results)
+    return results
+
+def save_results(pcm_name:str, results:dict):
+    """Writes ``results_CARGA_CONDUCCION_<pcm_name>.npz`` (only T and time), the file read by plot_all_pcms_carga.py.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        results (dict): Output of ``run_charge``
+    """
+    print("Guardando resultados (solo T y tiempo)")
+    output_filename_data = f"results_CARGA_CONDUCCION_{pcm_name}.npz"
+    np.savez(output_filename_data,
+             times_hours=results["times_hours"],
+             T_fondo_C=results["T_fondo_C"],
+             T_medio_C=results["T_medio_C"],
+             T_cima_C=results["T_cima_C"],
+             energy_latent=results["energy_latent"],
+             energy_sensible=results["energy_sensible"])
+    print(f"Resultados guardados en {output_filename_data}")
+
+def plot_charge(pcm_name:str, results:dict, fmt:str="svg", **params) -> str:
+    """Plots the bottom water temperature of one charge and saves ``grafico_CARGA_CONDUCCION_<pcm_name>.<fmt>``.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        results (dict): Output of ``run_charge`` (``times_hours`` and ``T_fondo_C``)
+        fmt (str): 'svg' or 'png' (raster, for large batches)
+        **params: Overrides of the entries in ``CHARGE_PARAMS`` used for the simulation
+
+    Returns:
+        str: Path of the figure
+    """
+    from plot_backend import pyplot, downsample
+    plt = pyplot()
+
+    p = {**CHARGE_PARAMS, **params}
+    print("Generando gráfico...")
+    plt.figure(figsize=(10, 7))
+    plt.plot(*downsample(results["times_hours"], results["T_fondo_C"]), label=f'Fondo (Nodo 1)', linestyle='--')
+    plt.legend(title='Posición en el Estanque')
+    plt.title(f'Simulación de Carga Estática (Solo Conducción): {pcm_name}', fontsize=16)
+
+    #agregar leyenda de pcms
+    pcm_nombre_bonito = pcm_name.replace("_", " ").title()
+    plt.text(0.05, 0.95, f'PCM Utilizado: {pcm_nombre_bonito}',
+             transform=plt.gca().transAxes,
+             fontsize=12,
+             verticalalignment='top',
+             bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.5))
+
+    plt.xlabel('Tiempo de Carga (horas)', fontsize=12)
+    plt.ylabel(u'Temperatura del Agua (°C)', fontsize=12)
+    plt.grid(which='major', color='#DDDDDD', linewidth=1)
+    plt.minorticks_on()
+    plt.ylim(p["T_init"] - 273.15 - 5, p["T_hot"] - 273.15 + 5)
+    plt.xlim(0, p["simulation_time"] / 3600)
+
+    #guardar el gráfico
+    output_filename_plot = f'grafico_CARGA_CONDUCCION_{pcm_name}.{fmt}'
+    plt.savefig(output_filename_plot, dpi=150 if fmt == "png" else None)
+    print(f"Gráfico '{output_filename_plot}' guardado.")
+    return output_filename_plot
+
+def plot_all(results:dict, fmt:str="svg", workers:int=None, **params) -> list[str]:
+    """Draws the figure of every charge in a pool of processes (see ``plot_backend.render_figures``).
+
+    Args:
+        results (dict): Results of ``run_charge`` keyed by PCM name
+        fmt (str): 'svg' or 'png'
+        workers (int): Number of worker processes (defaults to one per PCM, up to the number of cores)
+        **params: Overrides of the entries in ``CHARGE_PARAMS`` used for the simulations
+
+    Returns:
+        list: Paths of the figures
+    """
+    from plot_backend import render_figures
+    return render_figures(plot_charge, [((pcm, {"times_hours": r["times_hours"], "T_fondo_C": r["T_fondo_C"]}, fmt), params) for pcm, r in results.items()], workers)
+
+def run_all(pcms:list[str]=PCMS, workers:int=None, **params) -> dict:
+    """Runs the charge of several PCMs in parallel, one process per simulation.
+
+    Args:
+        pcms (list): Names of the bed substances
+        workers (int): Number of worker processes (defaults to one per PCM, up to the number of cores)
+        **params: Overrides of the entries in ``CHARGE_PARAMS``
+
+    Returns:
+        dict: Results of ``run_charge`` keyed by PCM name
+    """
+    if workers is None:
+        workers = min(len(pcms), os.cpu_count() or 1)
+    if workers <= 1:
+        return {pcm: run_charge(pcm, **params) for pcm in pcms}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pcm: pool.submit(run_charge, pcm, **params) for pcm in pcms}
+        return {pcm: future.result() for pcm, future in futures.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación de carga estática de varios PCMs en paralelo.")
+    parser.add_argument("pcms", nargs="*", default=PCMS, help="PCMs a simular (por defecto los 5 del benchmark)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="n° de procesos (por defecto uno por PCM)")
+    parser.add_argument("--adaptive", action="store_true", help="paso de tiempo adaptativo en vez de dt fijo")
+    parser.add_argument("--implicit", action="store_true", help="paso de tiempo implícito (usar con --dt de 5-30 s)")
+    parser.add_argument("--fused", action="store_true", help="paso explícito compilado con numba (mismos resultados, más rápido)")
+    parser.add_argument("--float32", action="store_true", help="h, T y el historial en float32 (paso compilado, ver single_precision.py)")
+    parser.add_argument("--dt", type=float, default=None, help="paso de tiempo en s (por defecto 0.1)")
+    parser.add_argument("--stream", action="store_true", help="escribir la salida a disco durante la simulación")
+    parser.add_argument("--grading", default=None, help="lecho graduado <pcm>=<fracción>,... de abajo hacia arriba (se simula en vez de los PCMs)")
+    parser.add_argument("--plots", action="store_true", help="dibujar el gráfico de cada PCM en paralelo (grafico_CARGA_CONDUCCION_<pcm>)")
+    parser.add_argument("--format", choices=["svg", "png"], default="svg", help="formato de los gráficos (png para lotes grandes)")
+    parser.add_argument("--cache", action="store_true", help="leer del caché los casos ya simulados con las mismas entradas (ver result_cache.py)")
+    parser.add_argument("--profiling", action="store_true", help="medir el tiempo de cada parte del paso (results_CARGA_CONDUCCION_<pcm>_profile.json)")
+    parser.add_argument("--allocations", action="store_true", help="con --profiling, medir también la memoria asignada (tracemalloc)")
+    parser.add_argument("--trace", choices=["cprofile", "pyinstrument"], default=None, help="guardar además una traza completa de la corrida")
+    args = parser.parse_args()
+
+    dt = {} if args.dt is None else {"dt": args.dt}
+    grading = parse_grading(args.grading) if args.grading else None
+    pcms = [grading_name(grading)] if grading else args.pcms
+    results = run_all(pcms, grading=grading, workers=args.workers, adaptive=args.adaptive, implicit=args.implicit, fused=args.fused, precision="float32" if args.float32 else "float64", **dt, stream=args.stream,
+            cache=args.cache, profiling=args.profiling, profiling_allocations=args.allocations, profiling_trace=args.trace)
+    if args.plots:
+        plot_all(results, args.format, args.workers)
+
+if __name__ == "__main__":
+    main()
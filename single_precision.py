@@ -0,0 +1,120 @@
+"""
+Single precision (float32) state of the water + PCM bed tank.
+
+``to_single_precision`` stores the enthalpy and temperature fields of the fluid and bed phases,
+and their output history (``phase.data``), as float32, which halves the memory traffic of the
+largest arrays of a run. The enthalpy is stored relative to ``phase.h_offset``: ``_h_s`` of the
+PCM for the bed, and the water enthalpy at the same ``_T_s`` for the fluid. Absolute enthalpies
+(``_T_s * _cp`` ~ 7e5 J/kg) would spend the mantissa on the offset; relative to the start of
+the melting range the float32 spacing is finest around the mushy zone. The steps are done by the
+kernel of ``fused_step.py``, in float64 arithmetic on the float32 fields (the openterrace step
+expects absolute float64 enthalpies), so only the stored values are rounded.
+
+``compare`` runs the discharge and the charge in float64 and float32 and reports the error of
+the released energy, the outlet (bottom) temperature and the latent heat left in the PCM.
+"""
+
+import numpy as np
+from simulate_all_pcms import PCMS, run_discharge
+from simulate_all_pcms_carga import run_charge
+from pcm_registry import PCMMaterial
+import argparse
+import time
+
+#precisiones del estado de la simulación (parámetro "precision" de la descarga y la carga)
+PRECISIONS = ["float64", "float32"]
+
+def to_single_precision(ot):
+    """Converts the enthalpy, temperature and output history of the fluid and bed phases to float32.
+
+    Args:
+        ot (object): openterrace simulation with its phases, outputs and coupling selected (one fluid coupled to a ``PCMMaterial`` bed)
+    """
+    if len(ot.coupling) != 1:
+        raise ValueError("Single precision needs one fluid phase coupled to one bed phase")
+    fluid = ot.Phase.instances[ot.coupling[0]['fluid_phase']]
+    bed = ot.Phase.instances[ot.coupling[0]['bed_phase']]
+    if type(bed.fcns) is not PCMMaterial:
+        raise ValueError(f"Single precision needs a PCMMaterial bed (no hysteresis, tabulated curves or graded beds), got {bed.fcns!r}")
+    #misma temperatura de referencia en las dos fases: el inicio de la fusión
+    offsets = [(fluid, float(fluid.fcns.h(np.array(bed.fcns._T_s)))), (bed, float(bed.fcns._h_s))]
+    for phase, offset in offsets:
+        phase.h_offset = offset
+        phase.h = np.asarray(phase.h - offset, dtype=np.float32)
+        phase.T = np.asarray(phase.T, dtype=np.float32)
+        if getattr(phase, '_flag_save_data', False):
+            for parameter in phase.output_parameters:
+                setattr(phase.data, parameter, getattr(phase.data, parameter).astype(np.float32))
+
+def state_bytes(pcm_name:str, precision:str, **params) -> int:
+    """Bytes of the enthalpy and temperature fields and of the output history of a discharge.
+
+    Args:
+        pcm_name (str): Name of the bed substance (only the grid matters)
+        precision (str): 'float64' or 'float32'
+        **params: Overrides of the entries in ``DISCHARGE_PARAMS``
+
+    Returns:
+        int: Size in bytes
+    """
+    from simulate_all_pcms import DISCHARGE_PARAMS
+    p = {**DISCHARGE_PARAMS, **params}
+    nodes = p["n_fluid"] + p["n_fluid"]*p["n_bed"]
+    n_outputs = int(p["simulation_time"] // p["output_interval"]) + 1
+    return np.dtype(precision).itemsize * (2*nodes + n_outputs*p["n_fluid"])
+
+def compare(pcm_name:str, **params) -> dict:
+    """Runs the discharge and the charge of one PCM with the float64 and the float32 state.
+
+    Both runs use the fused step, which gives the same results as the openterrace step in float64.
+
+    Args:
+        pcm_name (str): Name of the bed substance
+        **params: Overrides of the simulation parameters
+
+    Returns:
+        dict: For each mode, the wall time of both runs and the errors of the float32 run against the float64 one
+    """
+    out = {}
+    for mode, fcn, key in [("descarga", run_discharge, "Tout"), ("carga", run_charge, "T_fondo_C")]:
+        runs = {}
+        times = {}
+        for precision in PRECISIONS:
+            t0 = time.perf_counter()
+            runs[precision] = fcn(pcm_name, save=False, **{**params, "fused": True, "precision": precision})
+            times[precision] = time.perf_counter() - t0
+        ref, single = runs["float64"], runs["float32"]
+        row = {"time_64": times["float64"], "time_32": times["float32"], "err_T": np.max(np.abs(single[key] - ref[key])),
+               "err_latent": abs(single["energy_latent"] - ref["energy_latent"])}
+        if mode == "descarga":
+            row["err_energy"] = abs(single["energy"] - ref["energy"])/abs(ref["energy"])
+        out[mode] = row
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Error del estado en float32 frente a float64 (descarga y carga).")
+    parser.add_argument("pcms", nargs="*", default=PCMS, help="PCMs a comparar (por defecto los 5 del benchmark)")
+    parser.add_argument("--hours", type=float, default=4, help="tiempo simulado en horas")
+    parser.add_argument("--n-fluid", type=int, default=None, help="n° de nodos del fluido")
+    parser.add_argument("--n-bed", type=int, default=None, help="n° de nodos del pcm")
+    args = parser.parse_args()
+
+    params = {"simulation_time": args.hours*3600}
+    if args.n_fluid is not None:
+        params["n_fluid"] = args.n_fluid
+    if args.n_bed is not None:
+        params["n_bed"] = args.n_bed
+    results = {pcm: compare(pcm, **params) for pcm in args.pcms}
+
+    print(f"\nEstado en float32 vs float64 ({state_bytes(args.pcms[0], 'float32', **params)/1024:.0f} KB vs "
+          f"{state_bytes(args.pcms[0], 'float64', **params)/1024:.0f} KB de h, T e historial):")
+    print("=" * 100)
+    print(f"{'PCM':<31} | {'modo':<8} | {'t64 (s)':>7} | {'t32 (s)':>7} | {'max |dT| (°C)':>13} | {'|dE|/E':>9} | {'|dE latente| (MJ)':>17}")
+    print("-" * 100)
+    for pcm_name, modes in results.items():
+        for mode, r in modes.items():
+            err_energy = f"{r['err_energy']:>9.2e}" if "err_energy" in r else f"{'-':>9}"
+            print(f"{pcm_name:<31} | {mode:<8} | {r['time_64']:>7.2f} | {r['time_32']:>7.2f} | {r['err_T']:>13.2e} | {err_energy} | {r['err_latent']:>17.2e}")
+
+if __name__ == "__main__":
+    main()
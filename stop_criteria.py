@@ -0,0 +1,72 @@
+"""
+Early termination of the discharge runs.
+
+``StopCriteria`` is given to ``tank_simulation.run`` as a monitor after the ``EnergyIntegrator``
+of the run. Every ``check_interval`` steps it compares the outlet temperature, the liquid
+fraction of the PCM and the released energy with their limits; when one of them is reached
+``update`` returns True and the time loop stops, keeping the outputs saved up to that time.
+"""
+
+class StopCriteria:
+    """Stop conditions of a discharge, checked every ``check_interval`` steps."""
+
+    def __init__(self, energy, T_outlet_min:float=None, liquid_fraction_min:float=None, energy_max:float=None, check_interval:int=100):
+        """Initialises the stop conditions (None disables a condition).
+
+        Args:
+            energy (EnergyIntegrator): Energy balance of the run (updated before this monitor)
+            T_outlet_min (float): Stop when the outlet temperature falls below this value in K
+            liquid_fraction_min (float): Stop when the liquid fraction of the PCM falls below this value
+            energy_max (float): Stop when the released energy exceeds this value in MJ
+            check_interval (int): Number of steps between checks
+        """
+        self.energy = energy
+        self.T_outlet_min = T_outlet_min
+        self.liquid_fraction_min = liquid_fraction_min
+        self.energy_max = energy_max
+        self.check_interval = check_interval
+        self.reason = None
+        self.t_stop = None
+        self._steps = 0
+
+    @property
+    def active(self) -> bool:
+        """True if any condition is set."""
+        return self.T_outlet_min is not None or self.liquid_fraction_min is not None or self.energy_max is not None
+
+    def check(self) -> str:
+        """Evaluates the conditions in the current state.
+
+        Returns:
+            str: Name of the first condition reached, or None
+        """
+        if self.T_outlet_min is not None:
+            if self.energy.fluid.T[0, self.energy.outlet] < self.T_outlet_min:
+                return "T_outlet_min"
+        if self.energy_max is not None:
+            if self.energy.released/1e6 > self.energy_max:
+                return "energy_max"
+        if self.liquid_fraction_min is not None:
+            if self.energy.liquid_fraction() < self.liquid_fraction_min:
+                return "liquid_fraction_min"
+        return None
+
+    def update(self, ot, t:float, dt:float) -> bool:
+        """Checks the conditions every ``check_interval`` steps.
+
+        Args:
+            ot (object): openterrace simulation
+            t (float): Time at the end of the step
+            dt (float): Time step size
+
+        Returns:
+            bool: True if the run has to stop
+        """
+        self._steps += 1
+        if self._steps % self.check_interval != 0:
+            return False
+        self.reason = self.check()
+        if self.reason is not None:
+            self.t_stop = t
+            return True
+        return False
@@ -0,0 +1,102 @@
+"""
+Output sink that writes the results to disk while the simulation runs.
+
+openterrace's ``select_output`` keeps the whole (time x n_other x n) history of a phase in memory
+until the end of the run. A ``StreamingOutput`` is given to ``tank_simulation.run`` instead and
+appends every snapshot of the selected nodes to a .npy file as soon as it is produced, so the
+memory used doesn't grow with the simulated time.
+"""
+
+import numpy as np
+import io
+import os
+
+class StreamingOutput:
+    """Appends snapshots of selected nodes of a phase to a .npy file."""
+
+    def __init__(self, phase, path:str, times:list[float], nodes=None, parameter:str='T', dtype=np.float64):
+        """Creates the .npy file with room for one row per output time.
+
+        Args:
+            phase (object): openterrace phase whose field is saved
+            path (str): Path of the .npy file
+            times (float): List of times to output data
+            nodes (int): Index or list of indices along the phase discretisation (all nodes if None)
+            parameter (str): Field of the phase to save
+            dtype (type): Data type stored in the file
+        """
+        self.phase = phase
+        self.path = path
+        self.times = np.asarray(times, dtype=float)
+        self.nodes = np.arange(phase.n) if nodes is None else np.atleast_1d(nodes)
+        self.parameter = parameter
+        self.dtype = np.dtype(dtype)
+        self.shape = (len(self.times), phase.n_other, len(self.nodes))
+        self._q = 0
+
+        self._file = open(path, 'wb')
+        self._header = self._header_bytes(self.shape)
+        self._file.write(self._header)
+
+    def _header_bytes(self, shape:tuple) -> bytes:
+        """Returns the .npy header of an array of the given shape."""
+        buffer = io.BytesIO()
+        np.lib.format.write_array_header_1_0(buffer, {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': shape})
+        return buffer.getvalue()
+
+    def save(self, t:float):
+        """Appends the current field if ``t`` is the next output time.
+
+        Args:
+            t (float): Current time
+        """
+        if self._q < len(self.times) and abs(t - self.times[self._q]) <= 1e-6:
+            field = getattr(self.phase, self.parameter)
+            self._file.write(np.ascontiguousarray(field[..., self.nodes], dtype=self.dtype).tobytes())
+            self._q = self._q + 1
+
+    @property
+    def n_saved(self) -> int:
+        """Number of snapshots written so far."""
+        return self._q
+
+    def close(self):
+        """Closes the file. If the run stopped before the last output time, the header is rewritten to the saved length."""
+        if self._file is None:
+            return
+        if self._q < len(self.times):
+            shape = (self._q,) + self.shape[1:]
+            header = self._header_bytes(shape)
+            if len(header) == len(self._header):
+                self._file.seek(0)
+                self._file.write(header)
+                self._file.close()
+            else:
+                #el encabezado cambió de largo: se reescribe el archivo con las filas guardadas
+                self._file.close()
+                data = np.memmap(self.path, mode='r', dtype=self.dtype, offset=len(self._header), shape=shape)
+                np.save(self.path + '.tmp.npy', data)
+                del data
+                os.replace(self.path + '.tmp.npy', self.path)
+            self.shape = shape
+        else:
+            self._file.close()
+        self._file = None
+
+    def load(self, mmap_mode:str='r') -> np.ndarray:
+        """Closes the file and opens the saved snapshots, memory-mapped by default.
+
+        Args:
+            mmap_mode (str): Mode passed to ``np.load`` (None loads the array into memory)
+
+        Returns:
+            ndarray: Array of shape (saved times, n_other, nodes)
+        """
+        self.close()
+        return np.load(self.path, mmap_mode=mmap_mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,325 @@
+"""
+Surrogate model of the discharge, trained on the rows of a parameter sweep.
+
+The inputs are the PCM constants (``pcm_registry.MATERIAL_COLUMNS``) and the numeric
+parameters of ``DISCHARGE_PARAMS`` that change in the training cases. The released energy is
+fitted with a Gaussian process; the outlet temperature curve is reduced with a POD (SVD of the
+curves of all cases) and every retained mode coefficient is fitted with its own Gaussian
+process. A prediction takes milliseconds and comes with its standard deviation and with a flag
+that tells when the full simulation should be run instead (inputs outside the training range or
+too much uncertainty).
+"""
+
+import numpy as np
+from parameter_sweep import load_checkpoint
+from simulate_all_pcms import DISCHARGE_PARAMS
+from pcm_registry import MATERIAL_COLUMNS, material_constants, get_material
+from collections import Counter
+import argparse
+import time
+
+class GaussianProcess:
+    """Gaussian process regression with a squared exponential kernel (one length scale per input) and noise."""
+
+    def __init__(self, X:np.ndarray, y:np.ndarray, length:np.ndarray=None, variance:float=1.0, noise:float=1e-6):
+        """Builds the model with the given hyperparameters (use ``fit`` to optimise them).
+
+        Args:
+            X (ndarray): Normalised inputs, one row per case
+            y (ndarray): Normalised outputs
+            length (ndarray): Length scale of each input (1 if None)
+            variance (float): Variance of the kernel
+            noise (float): Variance of the noise
+        """
+        self.X = X
+        self.y = y
+        self.length = np.ones(X.shape[1]) if length is None else np.asarray(length, dtype=float)
+        self.variance = variance
+        self.noise = noise
+        self._factorize()
+
+    def _kernel(self, A:np.ndarray, B:np.ndarray) -> np.ndarray:
+        d = (A[:,np.newaxis,:] - B[np.newaxis,:,:])/self.length
+        return self.variance*np.exp(-0.5*np.sum(d**2, axis=-1))
+
+    def _factorize(self):
+        K = self._kernel(self.X, self.X) + self.noise*np.eye(len(self.X))
+        self._L = np.linalg.cholesky(K)
+        self._alpha = np.linalg.solve(self._L.T, np.linalg.solve(self._L, self.y))
+
+    def log_likelihood(self) -> float:
+        """Log marginal likelihood of the training outputs."""
+        return -0.5*self.y @ self._alpha - np.sum(np.log(np.diag(self._L))) - 0.5*len(self.y)*np.log(2*np.pi)
+
+    @classmethod
+    def fit(cls, X:np.ndarray, y:np.ndarray) -> "GaussianProcess":
+        """Builds the model with the hyperparameters of maximum marginal likelihood.
+
+        Args:
+            X (ndarray): Normalised inputs, one row per case
+            y (ndarray): Normalised outputs
+
+        Returns:
+            GaussianProcess: Fitted model
+        """
+        from scipy.optimize import minimize #se importa aquí: solo se usa al entrenar
+
+        n_inputs = X.shape[1]
+
+        def objective(theta):
+            try:
+                model = cls(X, y, np.exp(theta[:n_inputs]), np.exp(theta[n_inputs]), np.exp(theta[n_inputs+1]))
+            except np.linalg.LinAlgError:
+                return 1e10
+            return -model.log_likelihood()
+
+        theta0 = np.concatenate([np.zeros(n_inputs), [0.0, np.log(1e-4)]])
+        #escalas de 0.01 a 100 veces el rango normalizado, ruido desde 1e-8
+        bounds = [(np.log(1e-2), np.log(1e2))]*n_inputs + [(np.log(1e-3), np.log(1e3)), (np.log(1e-8), np.log(1.0))]
+        theta = minimize(objective, theta0, method='L-BFGS-B', bounds=bounds).x
+        return cls(X, y, np.exp(theta[:n_inputs]), np.exp(theta[n_inputs]), np.exp(theta[n_inputs+1]))
+
+    def predict(self, X:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Mean and standard deviation of the outputs at the inputs X.
+
+        Args:
+            X (ndarray): Normalised inputs, one row per point
+
+        Returns:
+            tuple: Mean and standard deviation of each point
+        """
+        K = self._kernel(X, self.X)
+        mean = K @ self._alpha
+        v = np.linalg.solve(self._L, K.T)
+        variance = np.maximum(self.variance - np.sum(v**2, axis=0), 0)
+        return mean, np.sqrt(variance)
+
+    def loo_residuals(self) -> np.ndarray:
+        """Leave-one-out residuals of the training outputs (closed form, without refitting)."""
+        K_inv = np.linalg.solve(self._L.T, np.linalg.solve(self._L, np.eye(len(self.y))))
+        return self._alpha/np.diag(K_inv)
+
+    def state(self) -> dict:
+        """Arrays that rebuild the model with ``GaussianProcess(**state)``."""
+        return {"X": self.X, "y": self.y, "length": self.length, "variance": self.variance, "noise": self.noise}
+
+def training_data(rows:list[dict]) -> dict:
+    """Collects the inputs, energies and outlet curves of the discharge rows of a sweep.
+
+    Only the rows with the most common curve length are used (same simulation time and output
+    interval). The inputs are the PCM constants and discharge parameters that change between
+    those rows.
+
+    Args:
+        rows (list): Rows of a sweep checkpoint (``parameter_sweep.load_checkpoint``)
+
+    Returns:
+        dict: Input names (``features``), input matrix (``X``), released energy in MJ (``energy``), outlet curves in C (``Tout``), output times in h (``times``) and values of every candidate input in the first case (``defaults``)
+    """
+    rows = [row for row in rows if "Tout_curve" in row and "energy" in row]
+    if not rows:
+        raise ValueError("The checkpoint has no discharge rows with the outlet curve (Tout_curve)")
+    length = Counter(len(row["Tout_curve"]) for row in rows).most_common(1)[0][0]
+    rows = [row for row in rows if len(row["Tout_curve"]) == length]
+
+    #las filas antiguas sin constantes las toman del registro
+    for row in rows:
+        if not all(key in row for key in MATERIAL_COLUMNS):
+            row.update({key: value for key, value in material_constants(get_material(row["pcm"])).items() if key not in row})
+    candidates = MATERIAL_COLUMNS + [key for key, value in DISCHARGE_PARAMS.items()
+                                     if isinstance(value, (int, float)) and not isinstance(value, bool) and key not in MATERIAL_COLUMNS]
+    values = {key: np.array([row.get(key, DISCHARGE_PARAMS.get(key, np.nan)) for row in rows], dtype=float) for key in candidates}
+    features = [key for key in candidates if np.all(np.isfinite(values[key])) and np.ptp(values[key]) > 0]
+    if not features:
+        raise ValueError("No PCM constant or parameter changes between the training cases")
+
+    output_interval = rows[0].get("output_interval", DISCHARGE_PARAMS["output_interval"])
+    return {"features": features,
+            "X": np.column_stack([values[key] for key in features]),
+            "energy": np.array([row["energy"] for row in rows]),
+            "Tout": np.array([row["Tout_curve"] for row in rows]),
+            "times": np.arange(length)*output_interval/3600,
+            "defaults": {key: float(values[key][0]) for key in candidates}}
+
+class Surrogate:
+    """Energy and outlet temperature curve of a discharge predicted from the PCM constants and the tank parameters."""
+
+    def __init__(self, features:list[str], X_min:np.ndarray, X_max:np.ndarray, X_mean:np.ndarray, X_std:np.ndarray,
+                 energy_model:GaussianProcess, energy_scale:tuple, Tout_mean:np.ndarray, modes:np.ndarray, mode_models:list,
+                 mode_scales:np.ndarray, times:np.ndarray, defaults:dict):
+        self.features = features
+        self.X_min = X_min
+        self.X_max = X_max
+        self.X_mean = X_mean
+        self.X_std = X_std
+        self.energy_model = energy_model
+        self.energy_scale = energy_scale
+        self.Tout_mean = Tout_mean
+        self.modes = modes
+        self.mode_models = mode_models
+        self.mode_scales = mode_scales
+        self.times = times
+        self.defaults = defaults
+
+    @classmethod
+    def train(cls, rows:list[dict], energy_fraction:float=0.9999, max_modes:int=8) -> "Surrogate":
+        """Trains the surrogate on the discharge rows of a sweep.
+
+        Args:
+            rows (list): Rows of a sweep checkpoint (``parameter_sweep.load_checkpoint``)
+            energy_fraction (float): Fraction of the variance of the outlet curves kept by the POD modes
+            max_modes (int): Maximum number of POD modes
+
+        Returns:
+            Surrogate: Trained model
+        """
+        data = training_data(rows)
+        X = data["X"]
+        X_mean, X_std = X.mean(axis=0), X.std(axis=0)
+        Xn = (X - X_mean)/X_std
+
+        energy_scale = (data["energy"].mean(), data["energy"].std() or 1.0)
+        energy_model = GaussianProcess.fit(Xn, (data["energy"] - energy_scale[0])/energy_scale[1])
+
+        #POD de las curvas de salida: modos de la SVD de las curvas menos la curva media
+        Tout_mean = data["Tout"].mean(axis=0)
+        U, S, Vt = np.linalg.svd(data["Tout"] - Tout_mean, full_matrices=False)
+        captured = np.cumsum(S**2)/max(np.sum(S**2), 1e-300)
+        n_modes = min(max_modes, int(np.searchsorted(captured, energy_fraction)) + 1, len(S))
+        modes = Vt[:n_modes]
+        coefficients = U[:, :n_modes]*S[:n_modes]
+        mode_scales = coefficients.std(axis=0)
+        mode_scales[mode_scales == 0] = 1.0
+        mode_models = [GaussianProcess.fit(Xn, coefficients[:, i]/mode_scales[i]) for i in range(n_modes)]
+
+        #los parámetros que no cambian en el entrenamiento quedan fijos en su valor de entrenamiento
+        return cls(data["features"], X.min(axis=0), X.max(axis=0), X_mean, X_std, energy_model, energy_scale,
+                   Tout_mean, modes, mode_models, mode_scales, data["times"], data["defaults"])
+
+    def loo_error(self) -> dict:
+        """Leave-one-out errors of the training cases: RMS of the energy in MJ and of the POD reconstruction of the outlet curves in K."""
+        energy = self.energy_model.loo_residuals()*self.energy_scale[1]
+        curves = np.array([model.loo_residuals()*scale for model, scale in zip(self.mode_models, self.mode_scales)]).T @ self.modes
+        return {"energy": float(np.sqrt(np.mean(energy**2))), "Tout": float(np.sqrt(np.mean(curves**2)))}
+
+    def _inputs(self, pcm, params:dict) -> np.ndarray:
+        """Input vector from a PCM (registered name or dict of constants) and parameter overrides."""
+        constants = material_constants(get_material(pcm)) if isinstance(pcm, str) else dict(pcm or {})
+        values = {**self.defaults, **constants, **params}
+        return np.array([values[key] for key in self.features], dtype=float)
+
+    def predict(self, pcm=None, tol_energy:float=0.05, tol_T:float=1.0, **params) -> dict:
+        """Predicts the discharge of a PCM.
+
+        Args:
+            pcm: Name of a registered PCM or dict with the constants of ``MATERIAL_COLUMNS`` (missing ones keep the training values)
+            tol_energy (float): Relative standard deviation of the energy above which the full simulation is advised
+            tol_T (float): Standard deviation of the outlet temperature in K above which the full simulation is advised
+            **params: Values of the discharge parameters or PCM constants (missing ones keep the training values)
+
+        Returns:
+            dict: Released energy in MJ and its standard deviation (``energy``, ``energy_std``), output times in h (``times``), outlet temperature in C and its standard deviation (``Tout``, ``Tout_std``), whether the full simulation should be run (``fallback``) and why (``reasons``)
+        """
+        x = self._inputs(pcm, params)
+        xn = ((x - self.X_mean)/self.X_std)[np.newaxis]
+
+        mean, std = self.energy_model.predict(xn)
+        energy = mean[0]*self.energy_scale[1] + self.energy_scale[0]
+        energy_std = std[0]*self.energy_scale[1]
+
+        coefficients = np.zeros(len(self.mode_models))
+        variances = np.zeros(len(self.mode_models))
+        for i, (model, scale) in enumerate(zip(self.mode_models, self.mode_scales)):
+            mean, std = model.predict(xn)
+            coefficients[i] = mean[0]*scale
+            variances[i] = (std[0]*scale)**2
+        Tout = self.Tout_mean + coefficients @ self.modes
+        #los coeficientes se tratan como independientes
+        Tout_std = np.sqrt(variances @ self.modes**2)
+
+        reasons = []
+        #tolerancia de redondeo en los bordes del rango de entrenamiento
+        margin = 1e-9*np.maximum(np.abs(self.X_max), 1)
+        outside = [key for key, value, low, high, tol in zip(self.features, x, self.X_min, self.X_max, margin) if value < low - tol or value > high + tol]
+        if outside:
+            reasons.append("fuera del rango de entrenamiento: " + ", ".join(outside))
+        if energy_std > tol_energy*abs(energy):
+            reasons.append(f"incertidumbre de la energía {energy_std/abs(energy):.1%}")
+        if np.max(Tout_std) > tol_T:
+            reasons.append(f"incertidumbre de la salida {np.max(Tout_std):.2f} K")
+        return {"energy": float(energy), "energy_std": float(energy_std), "times": self.times, "Tout": Tout, "Tout_std": Tout_std,
+                "fallback": bool(reasons), "reasons": reasons}
+
+    def save(self, path:str):
+        """Writes the model to a .npz file.
+
+        Args:
+            path (str): Path of the file
+        """
+        arrays = {"features": np.array(self.features), "X_min": self.X_min, "X_max": self.X_max, "X_mean": self.X_mean,
+                  "X_std": self.X_std, "energy_scale": np.array(self.energy_scale), "Tout_mean": self.Tout_mean,
+                  "modes": self.modes, "mode_scales": self.mode_scales, "times": self.times,
+                  "default_keys": np.array(list(self.defaults)),
+                  "default_values": np.array(list(self.defaults.values()), dtype=float)}
+        for prefix, model in [("energy", self.energy_model)] + [(f"mode{i}", model) for i, model in enumerate(self.mode_models)]:
+            for key, value in model.state().items():
+                arrays[f"{prefix}_{key}"] = value
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path:str) -> "Surrogate":
+        """Reads a model written by ``save``.
+
+        Args:
+            path (str): Path of the file
+
+        Returns:
+            Surrogate: The model
+        """
+        with np.load(path) as data:
+            def model(prefix):
+                return GaussianProcess(**{key: data[f"{prefix}_{key}"] for key in ["X", "y", "length", "variance", "noise"]})
+            n_modes = len(data["modes"])
+            defaults = {str(key): float(value) for key, value in zip(data["default_keys"], data["default_values"])}
+            return cls([str(feature) for feature in data["features"]], data["X_min"], data["X_max"], data["X_mean"], data["X_std"],
+                       model("energy"), tuple(data["energy_scale"]), data["Tout_mean"], data["modes"],
+                       [model(f"mode{i}") for i in range(n_modes)], data["mode_scales"], data["times"], defaults)
+
+def _parse_value(text:str) -> tuple[str, float]:
+    """Parses ``NAME=value`` from the command line."""
+    name, value = text.split("=")
+    return name, float(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Modelo sustituto de la descarga entrenado con un barrido de parámetros.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="entrenar con el checkpoint de un barrido (<nombre>.jsonl)")
+    train.add_argument("checkpoint", help="archivo .jsonl del barrido")
+    train.add_argument("-o", "--output", default="surrogate.npz", help="archivo del modelo")
+    predict = subparsers.add_parser("predict", help="predecir la descarga de un PCM")
+    predict.add_argument("model", help="archivo del modelo")
+    predict.add_argument("--pcm", default=None, help="PCM registrado (si no, las constantes del entrenamiento cambiadas con --set)")
+    predict.add_argument("--set", nargs="*", default=[], metavar="NOMBRE=valor", help="constantes del pcm o parámetros del estanque")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        t0 = time.perf_counter()
+        surrogate = Surrogate.train(load_checkpoint(args.checkpoint))
+        errors = surrogate.loo_error()
+        print(f"Modelo entrenado en {time.perf_counter() - t0:.1f} s con las entradas {surrogate.features} y {len(surrogate.mode_models)} modos POD")
+        print(f"Error leave-one-out: energía {errors['energy']:.3f} MJ, temperatura de salida {errors['Tout']:.2f} K")
+        surrogate.save(args.output)
+        print(f"Modelo guardado en {args.output}")
+    else:
+        surrogate = Surrogate.load(args.model)
+        values = dict(_parse_value(text) for text in args.set)
+        t0 = time.perf_counter()
+        result = surrogate.predict(args.pcm, **values)
+        t = time.perf_counter() - t0
+        print(f"Energía liberada: {result['energy']:.2f} ± {result['energy_std']:.2f} MJ ({1e3*t:.1f} ms)")
+        print(f"Temperatura de salida final: {result['Tout'][-1]:.1f} ± {result['Tout_std'][-1]:.1f} °C")
+        if result["fallback"]:
+            print("Se recomienda la simulación completa: " + "; ".join(result["reasons"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Time loop for the openterrace tank simulations.
+
+``run`` advances the phases of an ``openterrace.Simulate`` object with the same steps as
+``Simulate.run_simulation`` (save output, solve each phase, update properties, couple fluid
+and bed). With ``adaptive=True`` the time step is chosen from the explicit stability limit of
+the current state instead of the fixed ``dt``, and reduced only while a bed node is close to
+its phase change.
+
+Monitors (e.g. ``energy_accounting.EnergyIntegrator``) are updated after every step up to
+``t_end`` with the time and size of the step. A monitor that returns True (e.g.
+``stop_criteria.StopCriteria``) ends the run at that time.
+
+With ``extra_step=False`` the fixed step loop ends exactly at ``t_end`` instead of taking the
+extra step of ``run_simulation``, so that runs can be chained on the same state (see
+``cyclic_simulation.py``).
+
+Drivers (e.g. ``boundary_profiles.TimeSeriesBC``) set time-varying boundary values before every
+step. With a fixed step they are prepared once with the times of all the steps.
+
+A ``profiling.RunProfiler`` times the parts of every step of one run (see ``profiling.py``).
+
+With ``implicit=True`` the phases are advanced by ``implicit_solver.ImplicitSolver`` (theta
+scheme with Newton iterations on T(h)) instead of the explicit update, so ``ot.dt`` can be far
+above the explicit stability limit. Only the fixed step is available in that mode.
+
+With ``fused=True`` every explicit step is one compiled call of ``fused_step.FusedStep``, with
+the same results (water + ``PCMMaterial`` bed only). It is also the step of the float32 state of
+``single_precision.py``.
+"""
+
+import numpy as np
+import importlib
+import functools
+
+def reset_openterrace():
+    """Clears the state left behind by previous openterrace simulations in this process.
+
+    openterrace keeps every created phase in the class attribute ``Simulate.Phase.instances``
+    (``run_simulation`` steps all of them) and ``select_domain_shape`` overwrites the functions
+    of the domain module with arrays. Both have to be undone before building a new case.
+    """
+    import openterrace
+
+    openterrace.Simulate.Phase.instances.clear()
+    for domain in openterrace.domains.__all__:
+        importlib.reload(getattr(openterrace.domains, domain))
+
+def stable_dt(ot) -> float:
+    """Largest time step for which the explicit scheme is stable in the current state.
+
+    For every node the heat capacity ``rho*cp*V`` is divided by the sum of the conductances
+    leaving it: diffusion ``k*A/dx`` on both faces (the zero_gradient boundary nodes count their
+    single face twice), convection ``|mdot|*cp`` and the fluid-bed coupling ``h*A``. This is the
+    Fourier (and CFL, for the upwind convection) limit that keeps the explicit update monotone.
+
+    Args:
+        ot (object): openterrace simulation
+
+    Returns:
+        float: Time step in s
+    """
+    phases = ot.Phase.instances
+    G = [np.zeros(phase.T.shape) for phase in phases]
+    for i, phase in enumerate(phases):
+        if hasattr(phase, 'diff'):
+            D0 = phase.k*phase.domain.A[0]/phase.domain.dx
+            D1 = phase.k*phase.domain.A[1]/phase.domain.dx
+            G[i] += D0 + D1
+            G[i][...,0] += D1[...,0] - D0[...,0]
+            G[i][...,-1] += D0[...,-1] - D1[...,-1]
+        if hasattr(phase, 'conv'):
+            mdot = phase.mdot_array if phase.mdot_array.ndim == 0 else phase.mdot_array[:,1]
+            #un flujo dado por una serie de tiempo puede subir antes del próximo cálculo del límite
+            mdot = max(np.max(np.abs(mdot)), getattr(phase, 'mdot_bound', 0.0))
+            G[i] += mdot*phase.cp
+    for couple in ot.coupling:
+        fluid = phases[couple['fluid_phase']]
+        bed = phases[couple['bed_phase']]
+        hA = couple['h_value']*bed.domain.A[-1][-1]
+        G[couple['bed_phase']][:,-1] += hA
+        G[couple['fluid_phase']][0] += fluid.domain.V/fluid.phi*(1-fluid.phi)/bed.domain.V0*hA
+
+    dt = np.inf
+    for phase, g in zip(phases, G):
+        C = phase.rho*phase.cp*phase.domain.V
+        dt = min(dt, np.min(C[g > 0]/g[g > 0], initial=np.inf))
+    return dt
+
+def near_phase_change(ot, band:float=1.0) -> bool:
+    """Checks if any bed node is within ``band`` K of the melting range ``_T_s``-``_T_l`` of its substance.
+
+    Args:
+        ot (object): openterrace simulation
+        band (float): Temperature margin in K
+
+    Returns:
+        bool: True if a node is close to the phase change
+    """
+    for phase in ot.Phase.instances:
+        if phase.type == 'bed' and hasattr(phase.fcns, '_T_s'):
+            if np.any((phase.T > phase.fcns._T_s - band) & (phase.T < phase.fcns._T_l + band)):
+                return True
+    return False
+
+def _save_data(phase, t:float):
+    """Saves the output of a phase if ``t`` is its next output time (up to round-off of the adaptive steps)."""
+    if phase._flag_save_data and phase._q < len(phase.data.time):
+        if abs(t - phase.data.time[phase._q]) <= 1e-6:
+            for parameter in phase.output_parameters:
+                getattr(phase.data, parameter)[phase._q] = getattr(phase, parameter)
+            phase._q = phase._q + 1
+
+def _final_save(ot, t:float, outputs:list=()):
+    """Saves the outputs at the last time of the run (only if it is an output time)."""
+    for output in outputs:
+        output.save(t)
+    for phase in ot.Phase.instances:
+        _save_data(phase, t)
+
+def _step(ot, t:float, dt:float, outputs:list=(), monitors:list=(), save=_save_data, advance=None) -> bool:
+    """Advances all phases by one time step, like one iteration of ``Simulate.run_simulation`` (or with ``advance(t, dt)``). Returns True if a monitor stops the run."""
+    ot.dt = dt
+    for output in outputs:
+        output.save(t)
+    if advance is None:
+        for phase in ot.Phase.instances:
+            save(phase, t)
+            phase._solve_equations(t, dt)
+            phase._update_properties()
+        if ot.flag_coupling:
+            ot._coupling()
+    else:
+        for phase in ot.Phase.instances:
+            save(phase, t)
+        advance(t, dt)
+    #run_simulation da un paso más allá de t_end: ese no se cuenta en los monitores
+    stop = False
+    if t < ot.t_end - 1e-6:
+        for monitor in monitors:
+            stop = monitor.update(ot, t + dt, dt) or stop
+    return stop
+
+def run(ot, adaptive:bool=False, safety:float=0.9, phase_change_factor:float=0.5, phase_change_band:float=1.0, check_interval:int=10, outputs:list=(), monitors:list=(), extra_step:bool=True, drivers:list=(), profiler=None,
+        implicit:bool=False, theta:float=1.0, fused:bool=False) -> dict:
+    """Runs the simulation from ``ot.t_start`` to ``ot.t_end``.
+
+    Args:
+        ot (object): openterrace simulation with its phases, outputs and coupling selected
+        adaptive (bool): Choose the time step from the stability limit instead of ``ot.dt``
+        safety (float): Fraction of the stability limit used as time step
+        phase_change_factor (float): Extra factor on the time step while a bed node is near its phase change
+        phase_change_band (float): Distance in K to the melting range counted as near the phase change
+        check_interval (int): Number of steps between evaluations of the stability limit
+        outputs (list): Output sinks (e.g. ``StreamingOutput``) saved at their output times, in addition to ``select_output``
+        monitors (list): Objects with an ``update(ot, t, dt)`` method called after every time step (the run stops when one returns True)
+        extra_step (bool): Take one step past ``t_end`` like ``Simulate.run_simulation`` (fixed step only)
+        drivers (list): Objects with ``prepare(step_times)`` and ``apply(t, i=None)`` methods that set boundary values before every step
+        profiler (object): ``profiling.RunProfiler`` that times the run (its report is in ``profiler.report``)
+        implicit (bool): Advance the phases with ``implicit_solver.ImplicitSolver`` (fixed step only)
+        theta (float): Implicitness of the implicit step (1 backward Euler, 0.5 Crank-Nicolson)
+        fused (bool): Advance the phases with the compiled step of ``fused_step.FusedStep`` (same results as the explicit step)
+
+    Returns:
+        dict: Number of steps (``steps``), smallest/largest time step used in s (``dt_min``, ``dt_max``), final time in s (``t``) and whether a monitor stopped the run (``stopped``), plus the Newton iterations of the implicit step (``newton_mean``, ``newton_max``, ``unconverged``)
+    """
+    args = (ot, adaptive, safety, phase_change_factor, phase_change_band, check_interval, outputs, monitors, extra_step, drivers)
+    solver = None
+    advance = None
+    if any(hasattr(phase, 'h_offset') for phase in ot.Phase.instances) and not fused:
+        raise ValueError("The single precision state (see single_precision.py) is only advanced by the fused step: use fused=True")
+    if implicit:
+        from implicit_solver import ImplicitSolver
+        if adaptive:
+            raise ValueError("The adaptive step is only available with the explicit scheme")
+        if fused:
+            raise ValueError("The fused step is explicit: use either implicit or fused")
+        solver = ImplicitSolver(ot, theta)
+        advance = solver.step
+    elif fused:
+        from fused_step import FusedStep
+        advance = FusedStep(ot).step
+    if profiler is None:
+        if advance is None:
+            return _run(*args)
+        stats = _run(*args, step=functools.partial(_step, advance=advance))
+        return stats if solver is None else {**stats, **solver.stats()}
+    #los cronómetros se ponen solo durante esta corrida: sin perfilador el ciclo no cambia
+    t_start = ot.t_start
+    profiler.attach(ot, outputs, monitors, drivers)
+    try:
+        profiler.start()
+        if advance is not None:
+            advance = profiler.timed("implicit" if solver is not None else "fused", advance)
+        stats = _run(*args, step=functools.partial(_step, save=profiler.timed("output", _save_data), advance=advance), limit=profiler.timed("stability", stable_dt))
+        if solver is not None:
+            stats = {**stats, **solver.stats()}
+        profiler.stop(stats, stats["t"] - t_start)
+    finally:
+        profiler.detach()
+    return stats
+
+def _run(ot, adaptive:bool, safety:float, phase_change_factor:float, phase_change_band:float, check_interval:int, outputs:list, monitors:list, extra_step:bool,
+         drivers:list, step=_step, limit=stable_dt) -> dict:
+    """Time loop of ``run`` (``step`` and ``limit`` replace ``_step`` and ``stable_dt``, timed by the profiler)."""
+    import tqdm
+
+    dt_fixed = ot.dt
+    phases = ot.Phase.instances
+
+    if not adaptive:
+        if extra_step:
+            #mismos tiempos que Simulate.run_simulation
+            times = np.arange(ot.t_start, ot.t_end+dt_fixed, dt_fixed)
+        else:
+            times = ot.t_start + dt_fixed*np.arange(round((ot.t_end - ot.t_start)/dt_fixed))
+        #las series se interpolan una sola vez en todos los tiempos de los pasos
+        for driver in drivers:
+            driver.prepare(times)
+        for steps, t in enumerate(tqdm.tqdm(times), 1):
+            for driver in drivers:
+                driver.apply(t, steps - 1)
+            if step(ot, t, dt_fixed, outputs, monitors):
+                #se guarda el estado final si cae en un tiempo de salida
+                _final_save(ot, t + dt_fixed, outputs)
+                return {"steps": steps, "dt_min": dt_fixed, "dt_max": dt_fixed, "t": t + dt_fixed, "stopped": True}
+        return {"steps": len(times), "dt_min": dt_fixed, "dt_max": dt_fixed, "t": ot.t_end, "stopped": False}
+
+    #los pasos se recortan para caer justo en los tiempos de salida y en t_end
+    output_times = np.unique(np.concatenate([phase.data.time for phase in phases if phase._flag_save_data]
+                                            + [output.times for output in outputs] + [[ot.t_end]]))
+    #los pasos también caen en los puntos de las series, donde se recalcula el límite
+    breakpoints = np.unique(np.concatenate([driver.times for driver in drivers] + [[]]))
+    output_times = np.unique(np.concatenate([output_times, breakpoints[(breakpoints > ot.t_start) & (breakpoints < ot.t_end)]]))
+    recheck = True
+    steps = 0
+    dt_min = np.inf
+    dt_max = 0.0
+    t = ot.t_start
+    stopped = False
+    with tqdm.tqdm(total=ot.t_end-ot.t_start, unit='s') as pbar:
+        while t < ot.t_end - 1e-6:
+            #las propiedades cambian lento: el límite se recalcula cada check_interval pasos
+            for driver in drivers:
+                driver.apply(t)
+            if steps % check_interval == 0 or recheck:
+                dt_stable = safety*limit(ot)
+                if near_phase_change(ot, phase_change_band):
+                    dt_stable = dt_stable*phase_change_factor
+            t_next = output_times[np.searchsorted(output_times, t + 1e-6)]
+            dt = min(dt_stable, t_next - t)
+            stopped = step(ot, t, dt, outputs, monitors)
+            t = t_next if abs(t + dt - t_next) <= 1e-6 else t + dt
+            recheck = t == t_next and np.any(np.abs(breakpoints - t) <= 1e-6)
+            steps += 1
+            dt_min = min(dt_min, dt)
+            dt_max = max(dt_max, dt)
+            pbar.update(dt)
+            if stopped:
+                break
+    _final_save(ot, t, outputs)
+    ot.dt = dt_fixed
+    return {"steps": steps, "dt_min": dt_min, "dt_max": dt_max, "t": t, "stopped": stopped}